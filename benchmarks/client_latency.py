@@ -0,0 +1,52 @@
+"""Compare cold and warm EC2 call latency through the shared client cache.
+
+Runs against moto, so it measures client construction and request
+handling rather than network time.
+
+    python benchmarks/client_latency.py --calls 50
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+
+from moto import mock_ec2
+
+from metadata_management import aws
+from metadata_management.ipam import Pool
+
+
+def _timed_call(region_name: str) -> float:
+    start = time.perf_counter()
+    Pool(region_name=region_name).client.describe_availability_zones()
+    return time.perf_counter() - start
+
+
+@mock_ec2
+def run(calls: int, region_name: str) -> dict:
+    cold = []
+    for _ in range(calls):
+        aws.clear_client_cache()
+        cold.append(_timed_call(region_name))
+    warm = [_timed_call(region_name) for _ in range(calls)]
+    return {
+        "calls": calls,
+        "cold_median_ms": round(statistics.median(cold) * 1000, 3),
+        "warm_median_ms": round(statistics.median(warm) * 1000, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--region", default="us-east-1")
+    args = parser.parse_args()
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    print(json.dumps(run(args.calls, args.region), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
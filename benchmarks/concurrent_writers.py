@@ -0,0 +1,77 @@
+"""Measure write throughput of parallel writers and count lost updates.
+
+With ``--indexed`` the index of the JSON, log and sharded backends is
+built first, so that every write keeps it up to date.
+
+    python benchmarks/concurrent_writers.py --writers 8 --rows 200
+    python benchmarks/concurrent_writers.py --backend sharded --indexed
+"""
+import argparse
+import json
+import multiprocessing
+import tempfile
+import time
+from pathlib import Path
+
+from metadata_management.database import (
+    BACKENDS,
+    JSON_BACKEND,
+    init_database,
+    open_database,
+)
+from metadata_management.manager import Metadata
+
+
+def _writer(db_file: Path, backend: str, writer: int, rows: int) -> None:
+    metadata = Metadata(db_file, backend)
+    for row in range(rows):
+        metadata.add(f"writer{writer}#{row}", "bar", "baz")
+
+
+def run(backend: str, writers: int, rows: int, indexed: bool = False) -> dict:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_file = Path(tmp_dir) / "metadata.db"
+        init_database(db_file, backend)
+        if indexed:
+            Metadata(db_file, backend).lookup("bar")  # Builds the index
+        context = multiprocessing.get_context("fork")
+        processes = [
+            context.Process(target=_writer, args=(db_file, backend, i, rows))
+            for i in range(writers)
+        ]
+        start = time.perf_counter()
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        seconds = time.perf_counter() - start
+        stored = len(open_database(db_file, backend).read_metadata().metadata)
+    expected = writers * rows
+    return {
+        "backend": backend,
+        "indexed": indexed,
+        "writers": writers,
+        "rows_per_writer": rows,
+        "seconds": round(seconds, 4),
+        "writes_per_second": round(expected / seconds, 1),
+        "lost_updates": expected - stored,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--backend", choices=BACKENDS, action="append")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--rows", type=int, default=100)
+    parser.add_argument("--indexed", action="store_true")
+    args = parser.parse_args()
+    results = [
+        run(backend, args.writers, args.rows, args.indexed)
+        for backend in args.backend or [JSON_BACKEND]
+    ]
+    print(json.dumps(results, indent=2))
+    return int(any(result["lost_updates"] for result in results))
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,73 @@
+"""Compare the size and load times of the JSON and packed formats.
+
+For each row count the database is written in both formats, then timed
+for a full load and for a single-record lookup from a fresh handler, as
+each CLI invocation does.
+
+    python benchmarks/packed_load.py --rows 10000 100000 1000000
+"""
+import argparse
+import json
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from record_memory import make_row  # noqa: E402
+
+from metadata_management.database import (  # noqa: E402
+    JSON_BACKEND,
+    PACKED_BACKEND,
+    open_database,
+)
+
+
+def _median_ms(operation, calls: int) -> float:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def run(rows: int, calls: int) -> dict:
+    metadata = {f"ip_reservation#account{i}": make_row(i) for i in range(rows)}
+    middle = f"ip_reservation#account{rows // 2}"
+    results = {"rows": rows}
+    with tempfile.TemporaryDirectory() as directory:
+        for backend in (JSON_BACKEND, PACKED_BACKEND):
+            db_path = Path(directory) / f"metadata.{backend}"
+            open_database(db_path, backend).write_metadata(metadata)
+            results[backend] = {
+                "bytes": db_path.stat().st_size,
+                "load_ms": _median_ms(
+                    lambda: open_database(db_path, backend).read_metadata(),
+                    calls,
+                ),
+                "get_ms": _median_ms(
+                    lambda: open_database(db_path, backend).get_record(
+                        middle
+                    ),
+                    calls,
+                ),
+            }
+    return results
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--rows", type=int, nargs="+", default=[10_000, 100_000, 1_000_000]
+    )
+    parser.add_argument("--calls", type=int, default=5)
+    args = parser.parse_args()
+    print(json.dumps([run(rows, args.calls) for rows in args.rows], indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
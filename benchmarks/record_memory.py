@@ -0,0 +1,112 @@
+"""Compare the memory of dict rows with MetadataRecord rows.
+
+Rows are measured once as built in memory, and once as held by the
+resident cache of the JSON backend that the server keeps, next to the
+plain parsed file it replaced.
+
+    python benchmarks/record_memory.py --rows 1000000
+"""
+import argparse
+import datetime
+import json
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict
+
+from metadata_management.database import (
+    CachedDatabaseHandler,
+    DatabaseHandler,
+    atomic_write,
+)
+from metadata_management.records import MetadataRecord
+
+USERS = ("alice", "bob", "carol", "dave")
+
+
+def make_row(i: int) -> Dict[str, Any]:
+    # Build every string at runtime, as json.loads would.
+    assigned = datetime.datetime(2022, 1, 1) + datetime.timedelta(seconds=i)
+    return {
+        "Value": f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}/32",
+        "Comment": "".join(["auto-reserved", " IP"]),
+        "AssignedBy": "".join([USERS[i % len(USERS)]]),
+        "AssignedDateUTC": assigned.isoformat(),
+        "inactive": i % 10 == 0,
+    }
+
+
+def measure(rows: int, convert: Callable[[Dict[str, Any]], Any]) -> int:
+    """Return the bytes held by ``rows`` converted rows."""
+    tracemalloc.start()
+    try:
+        baseline, _peak = tracemalloc.get_traced_memory()
+        store = {
+            f"ip_reservation#account{i}": convert(make_row(i))
+            for i in range(rows)
+        }
+        current, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del store
+    return current - baseline
+
+
+def measure_loaded(db_path: Path, load: Callable[[Path], Any]) -> int:
+    """Return the bytes still held once ``load`` has read the database."""
+    tracemalloc.start()
+    try:
+        baseline, _peak = tracemalloc.get_traced_memory()
+        held = load(db_path)
+        current, _peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del held
+    return current - baseline
+
+
+def _resident(db_path: Path) -> CachedDatabaseHandler:
+    handler = CachedDatabaseHandler(db_path)
+    handler.get_record("")  # Loads the cache
+    return handler
+
+
+def run(rows: int) -> Dict[str, Any]:
+    dict_bytes = measure(rows, dict)
+    record_bytes = measure(rows, MetadataRecord.from_dict)
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "metadata.json"
+        atomic_write(
+            db_path,
+            json.dumps(
+                {
+                    f"ip_reservation#account{i}": make_row(i)
+                    for i in range(rows)
+                }
+            ),
+        )
+        parsed_bytes = measure_loaded(
+            db_path, lambda path: DatabaseHandler(path).read_metadata()
+        )
+        resident_bytes = measure_loaded(db_path, _resident)
+    return {
+        "rows": rows,
+        "dict_bytes": dict_bytes,
+        "record_bytes": record_bytes,
+        "ratio": round(record_bytes / dict_bytes, 3),
+        "parsed_bytes": parsed_bytes,
+        "resident_bytes": resident_bytes,
+        "resident_ratio": round(resident_bytes / parsed_bytes, 3),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
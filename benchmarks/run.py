@@ -0,0 +1,294 @@
+"""Run the benchmark suite and compare it with a stored baseline.
+
+Measures, as median milliseconds per call:
+
+- ``add``, ``set_inactive``, ``remove`` and ``list`` on databases of
+  each ``--rows`` size, through a fresh ``Metadata`` per call as each
+  CLI invocation does;
+- CLI commands run to completion as subprocesses, cold start included,
+  against a database of the smallest ``--rows`` size, reserving offline
+  from a local pool;
+- the time ``metadata_management.cli`` adds to interpreter startup on
+  top of typer, from ``python -X importtime``;
+- ``reserve_ipv4_network`` and ``reserve_ipv4_networks`` against a real
+  EC2 client under moto, with the IPAM responses moto lacks stubbed.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --baseline results.json --threshold 0.25
+
+With ``--baseline`` the exit status is 1 if any metric is slower than
+its baseline by more than ``--threshold`` (a fraction). It is also 1 if
+the import time exceeds ``--import-budget``, with or without a baseline.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from botocore.stub import Stubber
+from moto import mock_ec2
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+from record_memory import make_row  # noqa: E402
+
+from metadata_management import __app_name__, aws  # noqa: E402
+from metadata_management.database import (  # noqa: E402
+    BACKENDS,
+    JSON_BACKEND,
+    init_database,
+    open_database,
+)
+from metadata_management.manager import Metadata  # noqa: E402
+
+LOCAL_POOL = "10.0.0.0/8"
+REGION = "us-east-1"
+POOL_ID = "ipam-pool-bench"
+# Time our own modules may add to the startup of commands that do not
+# touch AWS, on top of typer. Importing boto3 alone takes longer.
+IMPORT_BUDGET_MS = 150.0
+
+
+def _median_ms(operation, calls: int) -> float:
+    timings = []
+    for call in range(calls):
+        start = time.perf_counter()
+        operation(call)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def bench_store(rows: int, calls: int, backend: str) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "metadata.json"
+        init_database(db_path, backend)
+        open_database(db_path, backend).put_records(
+            {f"ip_reservation#account{i}": make_row(i) for i in range(rows)}
+        )
+
+        def manager() -> Metadata:
+            return Metadata(db_path, backend)
+
+        prefix = f"{backend}.{rows}"
+        return {
+            f"{prefix}.add": _median_ms(
+                lambda call: manager().add(f"bench#{call}", "v", ""), calls
+            ),
+            f"{prefix}.set_inactive": _median_ms(
+                lambda call: manager().set_inactive(f"bench#{call}"), calls
+            ),
+            f"{prefix}.remove": _median_ms(
+                lambda call: manager().remove(f"bench#{call}"), calls
+            ),
+            f"{prefix}.list": _median_ms(
+                lambda call: sum(
+                    1
+                    for _ in manager().iter_metadata(
+                        prefix="ip_reservation#", active_only=True
+                    )
+                ),
+                calls,
+            ),
+        }
+
+
+def _cli_commands(rows: int) -> dict:
+    """Return the arguments of each benchmarked command by call number."""
+    return {
+        "--version": lambda call: ["--version"],
+        "add": lambda call: ["add", f"bench#{call}", "v", ""],
+        "list": lambda call: ["list", "--active-only"],
+        "reserve-ipv4-network": lambda call: [
+            "reserve-ipv4-network",
+            f"bench{call}",
+            "24",
+            "False",
+            "--offline",
+        ],
+        "find": lambda call: ["find", "--value", make_row(rows // 2)["Value"]],
+    }
+
+
+def bench_cli(calls: int, rows: int) -> dict:
+    """Time each command run to completion in a fresh interpreter.
+
+    The commands use a config directory of their own, holding a database
+    of ``rows`` reservations and a local pool, so that reservations are
+    made offline.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        config_home = Path(directory) / "config"
+        config_home.mkdir()
+        env = {**os.environ, "XDG_CONFIG_HOME": str(config_home)}
+        db_path = Path(directory) / "metadata.json"
+
+        def run(args) -> None:
+            subprocess.run(
+                [sys.executable, "-m", "metadata_management", *args],
+                check=True,
+                capture_output=True,
+                env=env,
+            )
+
+        run(["init", "--db-path", str(db_path)])
+        config_file = config_home / __app_name__ / "config.ini"
+        with config_file.open("a") as config:
+            config.write(f"\n[IPAM]\ncidr = {LOCAL_POOL}\n")
+        open_database(db_path).put_records(
+            {f"ip_reservation#account{i}": make_row(i) for i in range(rows)}
+        )
+        for command, args in _cli_commands(rows).items():
+            results[f"cli.{command.strip('-')}"] = _median_ms(
+                lambda call: run(args(call)), calls
+            )
+    return results
+
+
+def _import_times(*args) -> dict:
+    """Run python -X importtime and return cumulative microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def bench_import(calls: int) -> dict:
+    """Time the import of the CLI, less typer, in a fresh interpreter."""
+    timings = []
+    for _ in range(calls):
+        times = _import_times("-c", "import metadata_management.cli")
+        own = times["metadata_management.cli"] - times.get("typer", 0)
+        timings.append(own / 1000)
+    return {"import.cli": round(statistics.median(timings), 3)}
+
+
+def _stub_reservations(stubber: Stubber, lookups: int, hosts: int) -> None:
+    for _ in range(lookups):
+        stubber.add_response(
+            "describe_ipam_pools", {"IpamPools": [{"IpamPoolId": POOL_ID}]}
+        )
+    for host in range(hosts):
+        stubber.add_response(
+            "allocate_ipam_pool_cidr",
+            {
+                "IpamPoolAllocation": {
+                    "Cidr": f"10.{host >> 8 & 255}.{host & 255}.0/24"
+                }
+            },
+        )
+
+
+@mock_ec2
+def bench_reservations(calls: int, batch: int) -> dict:
+    aws.clear_client_cache()
+    client = aws.get_client(region_name=REGION)
+    with tempfile.TemporaryDirectory() as directory, Stubber(
+        client
+    ) as stubber:
+        db_path = Path(directory) / "metadata.json"
+        init_database(db_path)
+
+        def reserve_one(call: int) -> None:
+            _stub_reservations(stubber, 1, 1)
+            Metadata(db_path).reserve_ipv4_network(
+                f"single{call}", region_name=REGION, dry_run=False
+            )
+
+        def reserve_batch(call: int) -> None:
+            _stub_reservations(stubber, 1, batch)
+            Metadata(db_path).reserve_ipv4_networks(
+                [f"batch{call}-{host}" for host in range(batch)],
+                region_name=REGION,
+                dry_run=False,
+            )
+
+        results = {
+            "reserve.single": _median_ms(reserve_one, calls),
+            f"reserve.batch{batch}": _median_ms(reserve_batch, calls),
+        }
+        stubber.assert_no_pending_responses()
+    aws.clear_client_cache()
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """Return the metrics slower than their baseline past ``threshold``."""
+    return [
+        f"{name}: {baseline[name]} -> {value} ms"
+        for name, value in sorted(results.items())
+        if name in baseline and value > baseline[name] * (1 + threshold)
+    ]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter
+    )
+    parser.add_argument(
+        "--rows",
+        type=int,
+        nargs="+",
+        default=[1_000, 10_000, 100_000, 1_000_000],
+    )
+    parser.add_argument("--calls", type=int, default=5)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument(
+        "--backend", choices=BACKENDS, nargs="+", default=[JSON_BACKEND]
+    )
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.25)
+    parser.add_argument(
+        "--import-budget", type=float, default=IMPORT_BUDGET_MS
+    )
+    args = parser.parse_args()
+
+    metrics = {}
+    for backend in args.backend:
+        for rows in args.rows:
+            metrics.update(bench_store(rows, args.calls, backend))
+    metrics.update(bench_cli(args.calls, min(args.rows)))
+    metrics.update(bench_import(args.calls))
+    metrics.update(bench_reservations(args.calls, args.batch))
+    results = {
+        "python": platform.python_version(),
+        "calls": args.calls,
+        "metrics": metrics,
+    }
+    report = json.dumps(results, indent=2)
+    if args.output is not None:
+        args.output.write_text(report + "\n")
+    else:
+        print(report)
+    regressions = []
+    if metrics["import.cli"] > args.import_budget:
+        regressions.append(
+            f"import.cli: {metrics['import.cli']} ms over the budget of "
+            f"{args.import_budget} ms"
+        )
+    if args.baseline is not None:
+        baseline = json.loads(args.baseline.read_text())["metrics"]
+        regressions += compare(metrics, baseline, args.threshold)
+    for regression in regressions:
+        print(f"regression: {regression}", file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,97 @@
+"""Compare per-operation latency with and without the resident server.
+
+Without the server every operation opens the database anew, as each CLI
+invocation does; with it, operations go over the Unix socket to one
+resident instance. Interpreter startup is not included.
+
+    python benchmarks/server_latency.py --rows 100000 --backend wal
+"""
+import argparse
+import json
+import statistics
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from metadata_management.database import (
+    BACKENDS,
+    JSON_BACKEND,
+    init_database,
+    open_database,
+)
+from metadata_management.manager import Metadata
+from metadata_management.server import MetadataServer, RemoteMetadata
+
+
+def _median_ms(operation, calls: int) -> float:
+    timings = []
+    for call in range(calls):
+        start = time.perf_counter()
+        operation(call)
+        timings.append(time.perf_counter() - start)
+    return round(statistics.median(timings) * 1000, 3)
+
+
+def run(rows: int, calls: int, backend: str) -> dict:
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = Path(directory) / "metadata.json"
+        init_database(db_path, backend)
+        open_database(db_path, backend).put_records(
+            {f"seed#{row}": {"Value": str(row)} for row in range(rows)}
+        )
+        last = f"seed#{rows - 1}"
+        local = {
+            "get_ms": _median_ms(
+                lambda call: Metadata(db_path, backend).get_metadata(last),
+                calls,
+            ),
+            "add_ms": _median_ms(
+                lambda call: Metadata(db_path, backend).add(
+                    f"local#{call}", "v", ""
+                ),
+                calls,
+            ),
+        }
+        socket_path = Path(directory) / "server.sock"
+        server = MetadataServer(
+            socket_path, Metadata(db_path, backend, resident=True)
+        )
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        client = RemoteMetadata(socket_path)
+        try:
+            remote = {
+                "get_ms": _median_ms(
+                    lambda call: client.get_metadata(last), calls
+                ),
+                "add_ms": _median_ms(
+                    lambda call: client.add(f"remote#{call}", "v", ""), calls
+                ),
+            }
+        finally:
+            client.close()
+            server.shutdown()
+            server.server_close()
+            thread.join()
+    return {
+        "backend": backend,
+        "rows": rows,
+        "calls": calls,
+        "local": local,
+        "server": remote,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--calls", type=int, default=20)
+    parser.add_argument("--backend", choices=BACKENDS, default=JSON_BACKEND)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows, args.calls, args.backend), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,4 +1,7 @@
 """Top-level package for Metadata management"""
+import time
+
+_import_started = time.perf_counter()  # Start of the --profile startup span
 
 __app_name__ = "metadata_management"
 __version__ = "0.1.0"
@@ -11,11 +14,19 @@ __version__ = "0.1.0"
     DB_WRITE_ERROR,
     JSON_ERROR,
     ID_ERROR,
-) = range(7)
+    DB_LOCK_ERROR,
+    VALIDATION_ERROR,
+    CIDR_ERROR,
+) = range(10)
 
 ERRORS = {
     DIR_ERROR: "config directory error",
     FILE_ERROR: "config file error",
     DB_READ_ERROR: "database read error",
     DB_WRITE_ERROR: "database write error",
+    JSON_ERROR: "database JSON format error",
+    ID_ERROR: "metadata title not found",
+    DB_LOCK_ERROR: "database lock timeout",
+    VALIDATION_ERROR: "invalid input rows",
+    CIDR_ERROR: "no free or non-overlapping CIDR in the local pool",
 }
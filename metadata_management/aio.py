@@ -0,0 +1,146 @@
+"""Asynchronous counterparts of the IPAM operations.
+
+boto3 has no asyncio support, so each call runs on an executor. Pass a
+``concurrent.futures.ThreadPoolExecutor`` to bound the number of calls in
+flight, or leave it out to use the event loop's default executor.
+"""
+import asyncio
+import functools
+from concurrent.futures import Executor
+from typing import Any, Awaitable, Callable, Iterable, List, Optional
+
+from metadata_management.ipam import IPAM, Pool, Scope
+
+DEFAULT_CONCURRENCY = 8
+
+
+async def gather_limited(
+    awaitables: Iterable[Awaitable],
+    limit: int = DEFAULT_CONCURRENCY,
+    return_exceptions: bool = False,
+) -> List[Any]:
+    """Like ``asyncio.gather``, with at most ``limit`` awaitables running."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(awaitable: Awaitable) -> Any:
+        async with semaphore:
+            return await awaitable
+
+    return await asyncio.gather(
+        *(run(awaitable) for awaitable in awaitables),
+        return_exceptions=return_exceptions,
+    )
+
+
+async def run_in_executor(
+    executor: Optional[Executor], function: Callable, *args, **kwargs
+) -> Any:
+    """Run a blocking call on ``executor`` and await its result."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(function, *args, **kwargs)
+    )
+
+
+class AsyncAWSAPIOperation:
+    """Wrap a synchronous operation whose calls run on an executor."""
+
+    def __init__(self, operation, executor: Optional[Executor] = None):
+        self.operation = operation
+        self._executor = executor
+
+    async def _run(self, function: Callable, *args, **kwargs) -> Any:
+        return await run_in_executor(self._executor, function, *args, **kwargs)
+
+
+class AsyncIPAM(AsyncAWSAPIOperation):
+    """Asynchronous IPAM."""
+
+    @classmethod
+    async def create(
+        cls,
+        region_name: str = None,
+        dry_run: bool = True,
+        executor: Optional[Executor] = None,
+        **client_options,
+    ) -> "AsyncIPAM":
+        ipam = await run_in_executor(
+            executor, IPAM, region_name, dry_run, **client_options
+        )
+        return cls(ipam, executor)
+
+    async def from_new(self) -> "AsyncIPAM":
+        await self._run(self.operation.from_new)
+        return self
+
+    async def from_existing(
+        self, name: str, cache=None, refresh: bool = False
+    ) -> "AsyncIPAM":
+        await self._run(self.operation.from_existing, name, cache, refresh)
+        return self
+
+    async def delete(self):
+        return await self._run(self.operation.delete)
+
+
+class AsyncScope(AsyncAWSAPIOperation):
+    """Asynchronous IPAM scope."""
+
+    @classmethod
+    async def create(
+        cls,
+        ipam_id,
+        region_name: str = None,
+        dry_run: bool = True,
+        executor: Optional[Executor] = None,
+        **client_options,
+    ) -> "AsyncScope":
+        scope = await run_in_executor(
+            executor, Scope, ipam_id, region_name, dry_run, **client_options
+        )
+        return cls(scope, executor)
+
+    async def delete(self):
+        return await self._run(self.operation.delete)
+
+
+class AsyncPool(AsyncAWSAPIOperation):
+    """Asynchronous IPAM IP pool."""
+
+    @classmethod
+    async def create(
+        cls,
+        region_name: str = None,
+        dry_run: bool = True,
+        executor: Optional[Executor] = None,
+        **client_options,
+    ) -> "AsyncPool":
+        pool = await run_in_executor(
+            executor, Pool, region_name, dry_run, **client_options
+        )
+        return cls(pool, executor)
+
+    async def from_new(self, ipam) -> "AsyncPool":
+        await self._run(self.operation.from_new, ipam)
+        return self
+
+    async def from_existing(
+        self, name: str = None, cache=None, refresh: bool = False
+    ) -> "AsyncPool":
+        await self._run(self.operation.from_existing, name, cache, refresh)
+        return self
+
+    async def allocate_cidr(
+        self, netmask_length, host=None, cidr=None, client_token=None
+    ) -> str:
+        """Allocate a CIDR block and return it."""
+        return await self._run(
+            self.operation.request_cidr,
+            netmask_length,
+            host,
+            cidr,
+            client_token,
+        )
+
+    async def delete(self):
+        return await self._run(self.operation.delete)
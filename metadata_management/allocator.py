@@ -0,0 +1,135 @@
+"""Local IPv4 CIDR allocation without a round trip to AWS IPAM."""
+import heapq
+import ipaddress
+from typing import Any, Dict, Iterable, List, Set, Tuple
+
+
+class AllocationError(ValueError):
+    """The pool is exhausted or a CIDR overlaps an existing allocation."""
+
+
+class CidrAllocator:
+    """Buddy allocator over a single IPv4 supernet.
+
+    Free blocks are kept per prefix length, as a set for membership tests
+    and a heap for the lowest address. Allocating, reserving and releasing
+    a block split or merge at most 32 times, each costing O(log n).
+    """
+
+    def __init__(self, supernet: str) -> None:
+        self.network = ipaddress.IPv4Network(supernet)
+        self._free: Dict[int, Set[int]] = {
+            prefix: set() for prefix in range(self.network.prefixlen, 33)
+        }
+        self._heaps: Dict[int, List[int]] = {
+            prefix: [] for prefix in self._free
+        }
+        self._allocated: Dict[int, int] = {}  # address -> prefix length
+        self._allocated_addresses = 0
+        self._add_free(
+            int(self.network.network_address), self.network.prefixlen
+        )
+
+    @classmethod
+    def from_metadata(
+        cls, supernet: str, metadata: Iterable[Tuple[str, Dict[str, Any]]]
+    ) -> Tuple["CidrAllocator", List[str]]:
+        """Build an allocator from reservation rows.
+
+        Returns the allocator and the titles whose CIDR could not be
+        reserved because it overlaps another row or lies outside the pool.
+        """
+        allocator, conflicts = cls(supernet), []
+        for title, record in metadata:
+            try:
+                allocator.reserve(record["Value"])
+            except (AllocationError, ValueError, KeyError, TypeError):
+                conflicts.append(title)
+        return allocator, conflicts
+
+    def _add_free(self, address: int, prefix: int) -> None:
+        self._free[prefix].add(address)
+        heapq.heappush(self._heaps[prefix], address)
+
+    def _pop_lowest(self, prefix: int) -> int:
+        heap, free = self._heaps[prefix], self._free[prefix]
+        while True:
+            address = heapq.heappop(heap)
+            if address in free:  # Skip entries removed by reserve or merge
+                free.remove(address)
+                return address
+
+    def _size(self, prefix: int) -> int:
+        return 1 << (32 - prefix)
+
+    def _split(self, address: int, prefix: int, target: int) -> None:
+        """Free the upper halves while splitting a block down to ``target``."""
+        while prefix < target:
+            prefix += 1
+            self._add_free(address + self._size(prefix), prefix)
+
+    def allocate(self, prefix: int) -> str:
+        """Allocate the lowest free block of the smallest fitting size."""
+        if not self.network.prefixlen <= prefix <= 32:
+            raise AllocationError(
+                f"/{prefix} does not fit in {self.network.with_prefixlen}"
+            )
+        for parent in range(prefix, self.network.prefixlen - 1, -1):
+            if self._free[parent]:
+                address = self._pop_lowest(parent)
+                self._split(address, parent, prefix)
+                self._allocated[address] = prefix
+                self._allocated_addresses += self._size(prefix)
+                return f"{ipaddress.IPv4Address(address)}/{prefix}"
+        raise AllocationError(f"no free /{prefix} in {self.network}")
+
+    def reserve(self, cidr: str) -> None:
+        """Mark a specific block as used, failing if it overlaps."""
+        network = ipaddress.IPv4Network(cidr)
+        if not network.subnet_of(self.network):
+            raise AllocationError(f"{cidr} is outside {self.network}")
+        address, prefix = int(network.network_address), network.prefixlen
+        for parent in range(prefix, self.network.prefixlen - 1, -1):
+            block = address & ~(self._size(parent) - 1)
+            if block in self._free[parent]:
+                self._free[parent].remove(block)
+                # Free every sibling on the way down to the reserved block.
+                while parent < prefix:
+                    parent += 1
+                    half = self._size(parent)
+                    if address & half:
+                        self._add_free(block, parent)
+                        block += half
+                    else:
+                        self._add_free(block + half, parent)
+                self._allocated[address] = prefix
+                self._allocated_addresses += self._size(prefix)
+                return
+        raise AllocationError(f"{cidr} overlaps an existing allocation")
+
+    def release(self, cidr: str) -> None:
+        """Return an allocated block and merge it with free buddies."""
+        network = ipaddress.IPv4Network(cidr)
+        address, prefix = int(network.network_address), network.prefixlen
+        if self._allocated.get(address) != prefix:
+            raise AllocationError(f"{cidr} is not allocated")
+        del self._allocated[address]
+        self._allocated_addresses -= self._size(prefix)
+        while prefix > self.network.prefixlen:
+            buddy = address ^ self._size(prefix)
+            if buddy not in self._free[prefix]:
+                break
+            self._free[prefix].remove(buddy)
+            address, prefix = min(address, buddy), prefix - 1
+        self._add_free(address, prefix)
+
+    def allocated(self) -> List[str]:
+        """Return the allocated blocks in address order."""
+        return [
+            f"{ipaddress.IPv4Address(address)}/{prefix}"
+            for address, prefix in sorted(self._allocated.items())
+        ]
+
+    def allocated_addresses(self) -> int:
+        """Return how many addresses are allocated."""
+        return self._allocated_addresses
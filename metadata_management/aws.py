@@ -1,9 +1,96 @@
 """A module for interacting with AWS API."""
-import boto3
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from metadata_management import profiling
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+DEFAULT_MAX_ATTEMPTS = 5
+
+# boto3 takes hundreds of milliseconds to import, so commands that never
+# call AWS should not pay for it. Both are imported with the first client.
+boto3 = None
+Config = None
+
+_sessions: Dict[Optional[str], Any] = {}
+_clients: Dict[Tuple, Any] = {}
+_clients_lock = threading.Lock()
+
+
+def _import_boto3() -> None:
+    global boto3, Config
+    if boto3 is None:
+        import boto3
+    if Config is None:
+        from botocore.config import Config
+
+
+def get_client(
+    region_name: str = None,
+    profile_name: str = None,
+    max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+    max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    service_name: str = "ec2",
+):
+    """Return a client shared by the whole process.
+
+    Creating a client loads the service model and opens a connection pool,
+    so one client is kept per region, profile and connection settings.
+    boto3 clients are thread-safe once created; sessions are not, so they
+    are only used while holding a lock.
+    """
+    key = (
+        service_name,
+        region_name,
+        profile_name,
+        max_pool_connections,
+        max_attempts,
+    )
+    with _clients_lock:
+        client = _clients.get(key)
+        if client is None:
+            with profiling.span(f"aws.client.{service_name}"):
+                _import_boto3()
+                session = _sessions.get(profile_name)
+                if session is None:
+                    session = boto3.session.Session(profile_name=profile_name)
+                    _sessions[profile_name] = session
+                client = session.client(
+                    service_name,
+                    region_name=region_name,
+                    config=Config(
+                        max_pool_connections=max_pool_connections,
+                        retries={
+                            "max_attempts": max_attempts,
+                            "mode": "standard",
+                        },
+                    ),
+                )
+            if profiling.enabled:
+                profiling.instrument_client(client)
+            _clients[key] = client
+        return client
+
+
+def clear_client_cache() -> None:
+    """Drop all cached sessions and clients."""
+    with _clients_lock:
+        _clients.clear()
+        _sessions.clear()
 
 
 class AWSAPIOperation:
-    def __init__(self, region_name: str, dry_run: bool = True):
-        self.client = boto3.client("ec2")
+    def __init__(
+        self,
+        region_name: str,
+        dry_run: bool = True,
+        profile_name: str = None,
+        max_pool_connections: int = DEFAULT_MAX_POOL_CONNECTIONS,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ):
+        self.client = get_client(
+            region_name, profile_name, max_pool_connections, max_attempts
+        )
         self.dry_run = dry_run
         self.region_name = region_name
+        self.profile_name = profile_name
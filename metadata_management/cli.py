@@ -1,17 +1,27 @@
 """This module provides the CLI."""
+import collections
+import functools
+import itertools
+import sys
+from datetime import datetime, timedelta
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Callable, List, Optional
 
 import typer
 
+import metadata_management
 from metadata_management import (
     ERRORS,
     __app_name__,
     __version__,
     config,
     database,
+    formats,
+    profiling,
 )
-from metadata_management.manager import Metadata
+from metadata_management.discovery import DiscoveryCache
+from metadata_management.manager import DEFAULT_WORKERS, Metadata
+from metadata_management.reconcile import MISMATCHED, MISSING, ORPHANED
 
 app = typer.Typer()
 
@@ -24,16 +34,25 @@ def init(
         "-db",
         prompt="metadata database location?",
     ),
+    backend: str = typer.Option(
+        database.JSON_BACKEND,
+        "--backend",
+        "-b",
+        help=f"Storage backend, one of: {', '.join(database.BACKENDS)}.",
+    ),
 ) -> None:
     """Initialize the metadata database."""
-    app_init_error = config.init_app(db_path)
+    if backend not in database.BACKENDS:
+        typer.secho(f'Unknown backend "{backend}"', fg=typer.colors.RED)
+        raise typer.Exit(1)
+    app_init_error = config.init_app(db_path, backend)
     if app_init_error:
         typer.secho(
             f'Creating config file failed with "{ERRORS[app_init_error]}"',
             fg=typer.colors.RED,
         )
         raise typer.Exit(1)
-    db_init_error = database.init_database(Path(db_path))
+    db_init_error = database.init_database(Path(db_path), backend)
     if db_init_error:
         typer.secho(
             f'Creating database failed with "{ERRORS[db_init_error]}"',
@@ -46,9 +65,30 @@ def init(
         )
 
 
-def get_manager() -> Metadata:
+def get_manager(remote: bool = False, resident: bool = False) -> Metadata:
+    """Return the manager of the configured database.
+
+    With ``remote`` a running server is used instead, if there is one.
+    """
     if config.CONFIG_FILE_PATH.exists():
         db_path = database.get_database_path(config.CONFIG_FILE_PATH)
+        backend = database.get_database_backend(config.CONFIG_FILE_PATH)
+        if remote:
+            from metadata_management import server
+
+            client = server.connect(
+                config.get_socket_path(config.CONFIG_FILE_PATH),
+                db_path,
+                backend,
+            )
+            if client is not None:
+                return client
+        lock_timeout = database.get_lock_timeout(config.CONFIG_FILE_PATH)
+        local_pool = config.get_local_pool(config.CONFIG_FILE_PATH)
+        aws_options = config.get_aws_options(config.CONFIG_FILE_PATH)
+        pool_name = config.get_pool_name(config.CONFIG_FILE_PATH)
+        cache_ttl = config.get_cache_ttl(config.CONFIG_FILE_PATH)
+        archive_after = config.get_archive_after(config.CONFIG_FILE_PATH)
     else:
         typer.secho(
             'Config file not found. Please, run "metadata_management init"',
@@ -56,7 +96,17 @@ def get_manager() -> Metadata:
         )
         raise typer.Exit(1)
     if db_path.exists():
-        return Metadata(db_path)
+        return Metadata(
+            db_path,
+            backend,
+            lock_timeout,
+            local_pool,
+            aws_options,
+            pool_name,
+            DiscoveryCache(config.DISCOVERY_CACHE_PATH, cache_ttl),
+            resident,
+            archive_after,
+        )
     else:
         typer.secho(
             'Database not found. Please, run "metadata_management init"',
@@ -65,14 +115,33 @@ def get_manager() -> Metadata:
         raise typer.Exit(1)
 
 
+def _server_errors(command: Callable) -> Callable:
+    """Report a failed request to a running server and exit."""
+
+    @functools.wraps(command)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        try:
+            return command(*args, **kwargs)
+        except Exception as exc:
+            # Loaded by get_manager once a server is used
+            server = sys.modules.get("metadata_management.server")
+            if server is None or not isinstance(exc, server.ServerError):
+                raise
+            typer.secho(f'The server failed with "{exc}"', fg=typer.colors.RED)
+            raise typer.Exit(1)
+
+    return wrapper
+
+
 @app.command()
+@_server_errors
 def add(
     metadata_title: str = typer.Argument(...),
     metadata_value: str = typer.Argument(...),
     comment: str = typer.Argument(...),
 ) -> None:
     """Add a new metadata with a comment."""
-    manager = get_manager()
+    manager = get_manager(remote=True)
     metadata, error = manager.add(metadata_title, metadata_value, comment)
     if error:
         typer.secho(
@@ -88,15 +157,28 @@ def add(
 
 
 @app.command()
+@_server_errors
 def reserve_ipv4_network(
     host: str = typer.Argument(...),
     network_mask_bits: int = typer.Argument(default=24),
     dry_run: bool = typer.Argument(...),
+    sync: bool = typer.Option(
+        True,
+        "--sync/--offline",
+        help="Claim locally allocated CIDRs in AWS IPAM as well.",
+    ),
+    refresh: bool = typer.Option(
+        False, help="Look up the IPAM pool again instead of using the cache."
+    ),
 ) -> None:
     """Allocate a new IPv4 range."""
-    manager = get_manager()
+    manager = get_manager(remote=True)
     metadata, error = manager.reserve_ipv4_network(
-        host, mask_bits=network_mask_bits, dry_run=dry_run
+        host,
+        mask_bits=network_mask_bits,
+        dry_run=dry_run,
+        sync=sync,
+        refresh=refresh,
     )
     if error:
         typer.secho(
@@ -111,35 +193,275 @@ def reserve_ipv4_network(
         )
 
 
+@app.command()
+@_server_errors
+def reserve_ipv4_networks(
+    hosts: Optional[List[str]] = typer.Argument(None),
+    from_file: Optional[Path] = typer.Option(
+        None, help="Read hosts from a file, one per line."
+    ),
+    network_mask_bits: int = typer.Option(24, "--mask-bits"),
+    dry_run: bool = typer.Option(..., "--dry-run/--no-dry-run"),
+    sync: bool = typer.Option(
+        True,
+        "--sync/--offline",
+        help="Claim locally allocated CIDRs in AWS IPAM as well.",
+    ),
+    refresh: bool = typer.Option(
+        False, help="Look up the IPAM pool again instead of using the cache."
+    ),
+    workers: int = typer.Option(
+        DEFAULT_WORKERS, min=1, help="Allocations running at once."
+    ),
+) -> None:
+    """Allocate an IPv4 range for each of several hosts."""
+    hosts = list(hosts or [])
+    if from_file is not None:
+        with from_file.open() as host_file:
+            hosts += [line.strip() for line in host_file if line.strip()]
+    if not hosts:
+        typer.secho("No hosts given", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    manager = get_manager(remote=True)
+    metadata, errors, error = manager.reserve_ipv4_networks(
+        hosts,
+        mask_bits=network_mask_bits,
+        dry_run=dry_run,
+        sync=sync,
+        workers=workers,
+        refresh=refresh,
+    )
+    for title, record in metadata.items():
+        typer.secho(f"{title}: {record['Value']}", fg=typer.colors.GREEN)
+    for _position, reason in errors:
+        typer.secho(reason, fg=typer.colors.RED, err=True)
+    if error:
+        typer.secho(
+            f'Adding IPv4 networks failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho(
+        f"{len(metadata)} networks reserved, {len(errors)} failed",
+        fg=typer.colors.GREEN if not errors else typer.colors.YELLOW,
+    )
+    if errors:
+        raise typer.Exit(1)
+
+
+@app.command()
+def recover(
+    dry_run: bool = typer.Option(
+        False, help="Only report what would be recovered."
+    ),
+    refresh: bool = typer.Option(
+        False, help="Look up the IPAM pool again instead of using the cache."
+    ),
+) -> None:
+    """Store or drop reservations interrupted before they were stored."""
+    manager = get_manager()
+    recovered, dropped, errors, error = manager.recover(
+        dry_run=dry_run, refresh=refresh
+    )
+    if error:
+        typer.secho(
+            f'Recovering reservations failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    for title, cidr in recovered.items():
+        typer.secho(f"{title}: {cidr}", fg=typer.colors.GREEN)
+    for host in dropped:
+        typer.secho(f"{host}: not allocated", fg=typer.colors.YELLOW)
+    for reason in errors:
+        typer.secho(reason, fg=typer.colors.RED, err=True)
+    typer.secho(
+        f"{len(recovered)} reservations recovered, "
+        f"{len(dropped)} pending entries dropped, {len(errors)} unresolved",
+        fg=typer.colors.GREEN if not errors else typer.colors.YELLOW,
+    )
+    if errors:
+        raise typer.Exit(1)
+
+
+@app.command()
+def reconcile(
+    repair: bool = typer.Option(
+        False, help="Change the IPAM pool to match the database."
+    ),
+    refresh: bool = typer.Option(
+        False, help="Look up the IPAM pool again instead of using the cache."
+    ),
+) -> None:
+    """Report reservations and IPAM allocations that do not match."""
+    manager = get_manager()
+    counts = collections.Counter()
+    try:
+        for drift, error in manager.reconcile(repair=repair, refresh=refresh):
+            counts[drift.kind] += 1
+            typer.secho(
+                f"{drift.kind}: {drift.host} "
+                f"database={drift.local_cidr or '-'} "
+                f"aws={drift.aws_cidr or '-'}",
+                fg=typer.colors.YELLOW,
+            )
+            if error:
+                counts["failed"] += 1
+                typer.secho(
+                    f"{drift.host}: repair failed: {error}",
+                    fg=typer.colors.RED,
+                    err=True,
+                )
+    except database.DatabaseError as exc:
+        typer.secho(
+            f'Reading reservations failed with "{ERRORS[exc.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    summary = ", ".join(
+        f"{counts[kind]} {kind}"
+        for kind in (MISSING, ORPHANED, MISMATCHED)
+    )
+    if repair:
+        summary += f", {counts['failed']} repairs failed"
+    typer.secho(summary, fg=typer.colors.GREEN)
+    if counts["failed"] or (counts and not repair):
+        raise typer.Exit(1)
+
+
+@app.command()
+def invalidate_cache(
+    region: Optional[str] = typer.Option(
+        None, help="Only forget the IDs cached for this region."
+    ),
+) -> None:
+    """Forget the cached IPAM, scope and pool IDs."""
+    DiscoveryCache(config.DISCOVERY_CACHE_PATH).invalidate(region)
+    typer.secho("Discovery cache cleared", fg=typer.colors.GREEN)
+
+
 @app.command(name="list")
-def list_all() -> None:
+@_server_errors
+def list_all(
+    prefix: Optional[str] = typer.Option(
+        None, help="Only titles starting with this, e.g. ip_reservation#."
+    ),
+    active_only: bool = typer.Option(False, help="Skip inactive metadata."),
+    assigned_by: Optional[str] = typer.Option(None),
+    since: Optional[datetime] = typer.Option(
+        None, help="Only metadata assigned at or after this UTC time."
+    ),
+    limit: Optional[int] = typer.Option(None, min=0),
+    offset: int = typer.Option(0, min=0),
+    fmt: str = typer.Option(
+        formats.TABLE,
+        "--format",
+        "-f",
+        help=f"Output format, one of: {', '.join(formats.OUTPUT_FORMATS)}.",
+    ),
+    include_archived: bool = typer.Option(
+        False, help="Also list the metadata moved out by compact."
+    ),
+) -> None:
     """List all metadata."""
-    manager = get_manager()
-    metadata = manager.get_metadata()
-    if len(metadata) == 0:
+    if fmt not in formats.OUTPUT_FORMATS:
+        typer.secho(f'Unknown format "{fmt}"', fg=typer.colors.RED)
+        raise typer.Exit(1)
+    manager = get_manager(remote=True)
+    metadata = manager.iter_metadata(
+        prefix,
+        active_only,
+        assigned_by,
+        since,
+        limit,
+        offset,
+        include_archived,
+    )
+    try:
+        if fmt == formats.TABLE:
+            first = next(metadata, None)
+            if first is None:
+                typer.secho(
+                    "There are no entries in the metadata list yet",
+                    fg=typer.colors.RED,
+                )
+                raise typer.Exit()
+            typer.secho("\nmetadata list:\n", fg=typer.colors.BLUE, bold=True)
+            metadata = itertools.chain([first], metadata)
+        with typer.open_file("-", "w") as stream:
+            formats.write_rows(stream, metadata, fmt)
+    except database.DatabaseError as exc:
         typer.secho(
-            "There are no entries in the metadata list yet",
+            f'Listing metadata failed with "{ERRORS[exc.error]}"',
             fg=typer.colors.RED,
         )
-        raise typer.Exit()
-    typer.secho("\nmetadata list:\n", fg=typer.colors.BLUE, bold=True)
-    columns = ("Value", "Content", "ReservedBy", "ReservedDateUTC", "inactive")
-    headers = " ".join(columns)
-    typer.secho(headers, fg=typer.colors.BLUE, bold=True)
-    typer.secho("-" * len(headers), fg=typer.colors.BLUE)
-    for _id in metadata.keys():
-        output = [_id] + [str(_key) for _key in metadata[_id].values()]
+        raise typer.Exit(1)
+
+
+@app.command()
+@_server_errors
+def find(
+    value: Optional[str] = typer.Option(None),
+    assigned_by: Optional[str] = typer.Option(None),
+    prefix: Optional[str] = typer.Option(
+        None, help="Only titles of this kind, e.g. ip_reservation."
+    ),
+    inactive: Optional[bool] = typer.Option(
+        None, "--inactive/--active", help="Only inactive or active metadata."
+    ),
+    fmt: str = typer.Option(
+        formats.TABLE,
+        "--format",
+        "-f",
+        help=f"Output format, one of: {', '.join(formats.OUTPUT_FORMATS)}.",
+    ),
+) -> None:
+    """List the metadata matching every option, using indexes."""
+    if fmt not in formats.OUTPUT_FORMATS:
+        typer.secho(f'Unknown format "{fmt}"', fg=typer.colors.RED)
+        raise typer.Exit(1)
+    manager = get_manager(remote=True)
+    try:
+        with typer.open_file("-", "w") as stream:
+            count = formats.write_rows(
+                stream, manager.find(value, assigned_by, prefix, inactive), fmt
+            )
+    except database.DatabaseError as exc:
+        typer.secho(
+            f'Finding metadata failed with "{ERRORS[exc.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    if not count:
+        typer.secho("No metadata matches", fg=typer.colors.RED)
+        raise typer.Exit(1)
+
+
+@app.command()
+@_server_errors
+def lookup(value: str = typer.Argument(...)) -> None:
+    """Print the titles of the metadata holding a value."""
+    manager = get_manager(remote=True)
+    try:
+        titles = manager.lookup(value)
+    except database.DatabaseError as exc:
         typer.secho(
-            " ".join(output),
-            fg=typer.colors.BLUE,
+            f'Looking up "{value}" failed with "{ERRORS[exc.error]}"',
+            fg=typer.colors.RED,
         )
-    typer.secho("-" * len(headers) + "\n", fg=typer.colors.BLUE)
+        raise typer.Exit(1)
+    if not titles:
+        typer.secho(f'No metadata holds "{value}"', fg=typer.colors.RED)
+        raise typer.Exit(1)
+    for title in titles:
+        typer.echo(title)
 
 
 @app.command(name="set-inactive")
+@_server_errors
 def set_inactive(metadata_title: str = typer.Argument(...)) -> None:
     """Complete a metadata by setting it as inactive using its metadata_ID."""
-    manager = get_manager()
+    manager = get_manager(remote=True)
     metadata, error = manager.set_inactive(metadata_title)
     if error:
         typer.secho(
@@ -155,6 +477,7 @@ def set_inactive(metadata_title: str = typer.Argument(...)) -> None:
 
 
 @app.command()
+@_server_errors
 def remove(
     metadata_title: str = typer.Argument(...),
     force: bool = typer.Option(
@@ -165,7 +488,7 @@ def remove(
     ),
 ) -> None:
     """Remove a metadata using its metadata title."""
-    manager = get_manager()
+    manager = get_manager(remote=True)
 
     def _remove():
         _metadata, error = manager.remove(metadata_title)
@@ -184,10 +507,7 @@ def remove(
     if force:
         _remove()
     else:
-        metadata = manager.get_metadata()
-        try:
-            metadata = metadata[metadata_title]
-        except IndexError:
+        if not manager.get_metadata(metadata_title):
             typer.secho("Invalid metadata_ID", fg=typer.colors.RED)
             raise typer.Exit(1)
         delete = typer.confirm(f"Delete metadata # {metadata_title}?")
@@ -197,14 +517,364 @@ def remove(
             typer.echo("Operation canceled")
 
 
+def _check_format(fmt: str) -> None:
+    if fmt not in formats.FORMATS:
+        typer.secho(f'Unknown format "{fmt}"', fg=typer.colors.RED)
+        raise typer.Exit(1)
+
+
+@app.command(name="import")
+@_server_errors
+def import_metadata(
+    path: str = typer.Argument("-", help="Input file, - for stdin."),
+    fmt: str = typer.Option(
+        formats.JSONL,
+        "--format",
+        "-f",
+        help=f"Input format, one of: {', '.join(formats.FORMATS)}.",
+    ),
+    strict: bool = typer.Option(
+        False,
+        help="Import nothing if any row is invalid or overlaps a reservation.",
+    ),
+) -> None:
+    """Add metadata in bulk from JSON Lines or CSV rows."""
+    _check_format(fmt)
+    manager = get_manager(remote=True)
+    with typer.open_file(path, encoding="utf-8") as stream:
+        metadata, errors, error = manager.bulk_add(
+            formats.read_rows(stream, fmt), strict=strict
+        )
+    for row_number, reason in errors:
+        typer.secho(
+            f"row {row_number}: {reason}", fg=typer.colors.RED, err=True
+        )
+    if error:
+        typer.secho(
+            f'Importing metadata failed with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    typer.secho(
+        f"{len(metadata)} rows imported, {len(errors)} rejected",
+        fg=typer.colors.GREEN if not errors else typer.colors.YELLOW,
+    )
+    if errors:
+        raise typer.Exit(1)
+
+
+@app.command()
+def export(
+    path: str = typer.Argument("-", help="Output file, - for stdout."),
+    fmt: str = typer.Option(
+        formats.JSONL,
+        "--format",
+        "-f",
+        help=f"Output format, one of: {', '.join(formats.FORMATS)}.",
+    ),
+) -> None:
+    """Write all metadata as JSON Lines or CSV rows."""
+    _check_format(fmt)
+    manager = get_manager()
+    try:
+        with typer.open_file(path, "w", encoding="utf-8") as stream:
+            formats.write_rows(stream, manager.iter_metadata(), fmt)
+    except database.DatabaseError as exc:
+        typer.secho(
+            f'Exporting metadata failed with "{ERRORS[exc.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+
+
+@app.command()
+def migrate(
+    source: Path = typer.Argument(..., help="Existing database."),
+    target: Path = typer.Argument(..., help="Database to create."),
+    backend: str = typer.Option(
+        database.SQLITE_BACKEND,
+        "--backend",
+        "-b",
+        help=f"Target backend, one of: {', '.join(database.BACKENDS)}.",
+    ),
+    source_backend: str = typer.Option(
+        database.JSON_BACKEND,
+        "--from-backend",
+        help="Backend of the existing database.",
+    ),
+    batch_size: int = typer.Option(database.DEFAULT_BATCH_SIZE),
+    switch: bool = typer.Option(
+        False, help="Point the config file at the new database."
+    ),
+) -> None:
+    """Copy a database into a new database, possibly of another backend."""
+    for name in (backend, source_backend):
+        if name not in database.BACKENDS:
+            typer.secho(f'Unknown backend "{name}"', fg=typer.colors.RED)
+            raise typer.Exit(1)
+    if target.exists():
+        typer.secho(f"{target} already exists", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    db_init_error = database.init_database(target, backend)
+    if db_init_error:
+        typer.secho(
+            f'Creating database failed with "{ERRORS[db_init_error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    rows, error = database.migrate_database(
+        database.open_database(source, source_backend),
+        database.open_database(target, backend),
+        batch_size,
+    )
+    if error:
+        typer.secho(
+            f'Migration failed after {rows} rows with "{ERRORS[error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    if switch:
+        app_init_error = config.init_app(str(target), backend)
+        if app_init_error:
+            typer.secho(
+                f'Updating config file failed with "{ERRORS[app_init_error]}"',
+                fg=typer.colors.RED,
+            )
+            raise typer.Exit(1)
+    typer.secho(f"{rows} rows migrated to {target}", fg=typer.colors.GREEN)
+
+
+@app.command()
+def reshard(
+    shards: int = typer.Argument(..., min=1, help="New number of shards."),
+) -> None:
+    """Spread a sharded database over another number of shards.
+
+    Other commands keep working meanwhile; writers wait for the new
+    shards.
+    """
+    from metadata_management.sharded import ShardedDatabaseHandler
+
+    get_manager()  # Checks the config file and the database exist
+    if (
+        database.get_database_backend(config.CONFIG_FILE_PATH)
+        != database.SHARDED_BACKEND
+    ):
+        typer.secho(
+            f'Only the "{database.SHARDED_BACKEND}" backend has shards',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    db_handler = ShardedDatabaseHandler(
+        database.get_database_path(config.CONFIG_FILE_PATH),
+        database.get_lock_timeout(config.CONFIG_FILE_PATH),
+    )
+    error = db_handler.reshard(shards)
+    if error:
+        typer.secho(
+            f'Resharding failed with "{ERRORS[error]}"', fg=typer.colors.RED
+        )
+        raise typer.Exit(1)
+    typer.secho(f"The database has {shards} shards", fg=typer.colors.GREEN)
+
+
+@app.command()
+def snapshot(
+    destination: str = typer.Argument(
+        ..., help="Local directory or s3://bucket/prefix."
+    ),
+    incremental: bool = typer.Option(
+        False, help="Only write the changes since the last snapshot."
+    ),
+    compression: str = typer.Option(
+        "gzip", help="gzip, or zstd with the zstandard package installed."
+    ),
+) -> None:
+    """Write a compressed snapshot of the database."""
+    from metadata_management.snapshot import COMPRESSIONS, SnapshotError
+
+    if compression not in COMPRESSIONS:
+        typer.secho(
+            f'Unknown compression "{compression}"', fg=typer.colors.RED
+        )
+        raise typer.Exit(1)
+    manager = get_manager()
+    try:
+        result = manager.snapshot(destination, incremental, compression)
+    except SnapshotError as exc:
+        typer.secho(f"Snapshot failed: {exc}", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    except Exception as exc:  # Upload errors from boto3
+        typer.secho(f"Uploading snapshot failed: {exc}", fg=typer.colors.RED)
+        raise typer.Exit(1)
+    if result.error:
+        typer.secho(
+            f'Snapshot failed with "{ERRORS[result.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    if result.location is None:
+        typer.secho(
+            f"No changes since snapshot {result.sequence}",
+            fg=typer.colors.GREEN,
+        )
+        return
+    typer.secho(
+        f"Snapshot {result.sequence} ({result.kind}, {result.changes} rows, "
+        f"{result.size} bytes) written to {result.location}",
+        fg=typer.colors.GREEN,
+    )
+
+
+@app.command()
+def compact(
+    older_than_days: Optional[float] = typer.Option(
+        None,
+        min=0,
+        help="Archive inactive metadata assigned more than this many days "
+        "ago. Defaults to archive_after_days in config.ini.",
+    ),
+) -> None:
+    """Move old inactive metadata out of the database into its archive."""
+    manager = get_manager()
+    if older_than_days is not None:
+        older_than = timedelta(days=older_than_days)
+    else:
+        older_than = config.get_archive_after(config.CONFIG_FILE_PATH)
+    if older_than is None:
+        typer.secho(
+            "Pass --older-than-days or set archive_after_days in config.ini",
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    result = manager.compact(older_than)
+    if result.error:
+        typer.secho(
+            f'Compaction failed with "{ERRORS[result.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    if not result.archived:
+        typer.secho("No inactive metadata to archive", fg=typer.colors.GREEN)
+        return
+    typer.secho(
+        f"Archived {result.archived} inactive metadata, reclaiming "
+        f"{result.bytes_before - result.bytes_after} bytes "
+        f"({result.bytes_before} -> {result.bytes_after})\n"
+        f"Full load: {result.load_ms_before:.1f} -> "
+        f"{result.load_ms_after:.1f} ms",
+        fg=typer.colors.GREEN,
+    )
+
+
+@app.command()
+@_server_errors
+def metrics(
+    output: Optional[Path] = typer.Option(
+        None,
+        "--output",
+        "-o",
+        help="File to replace, such as a textfile collector's *.prom file.",
+    ),
+) -> None:
+    """Print the store metrics in the Prometheus text format.
+
+    Operation latencies are only known to a running server.
+    """
+    manager = get_manager(remote=True)
+    try:
+        text = manager.metrics()
+    except database.DatabaseError as exc:
+        typer.secho(
+            f'Reading metrics failed with "{ERRORS[exc.error]}"',
+            fg=typer.colors.RED,
+        )
+        raise typer.Exit(1)
+    if output is None:
+        typer.echo(text, nl=False)
+        return
+    try:
+        database.atomic_write(output, text)
+    except OSError as exc:
+        typer.secho(f"Writing metrics failed: {exc}", fg=typer.colors.RED)
+        raise typer.Exit(1)
+
+
+@app.command()
+def serve(
+    socket_path: Optional[Path] = typer.Option(
+        None,
+        "--socket",
+        help="Unix socket to listen on, instead of the configured one.",
+    ),
+    metrics_port: Optional[int] = typer.Option(
+        None, help="Also serve GET /metrics over HTTP on this port."
+    ),
+    metrics_host: str = typer.Option(
+        "127.0.0.1",
+        help="Address to serve metrics on; 0.0.0.0 for all interfaces.",
+    ),
+) -> None:
+    """Keep the database loaded and answer the other commands' requests."""
+    from metadata_management import server
+
+    manager = get_manager(resident=True)
+    if socket_path is None:
+        socket_path = config.get_socket_path(config.CONFIG_FILE_PATH)
+    typer.secho(f"Listening on {socket_path}", fg=typer.colors.GREEN)
+    try:
+        server.serve(socket_path, manager, metrics_port, metrics_host)
+    except KeyboardInterrupt:
+        pass
+    except OSError as exc:
+        typer.secho(f"Serving failed: {exc}", fg=typer.colors.RED)
+        raise typer.Exit(1)
+
+
 def _version_callback(value: bool) -> None:
     if value:
         typer.echo(f"{__app_name__} v{__version__}")
         raise typer.Exit()
 
 
+def _start_profiling(
+    ctx: typer.Context,
+    summary: bool,
+    trace: Optional[Path],
+    cprofile: Optional[Path],
+) -> None:
+    """Time the command and report when its context closes."""
+    profiling.enable()
+    with profiling.span(
+        "startup", start=metadata_management._import_started
+    ):
+        pass
+    command_span = profiling.span(f"cli.{ctx.invoked_subcommand}")
+    command_span.__enter__()
+    profiler = None
+    if cprofile is not None:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    def finish() -> None:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(cprofile)
+        command_span.__exit__(None, None, None)
+        profiling.disable()
+        if trace is not None:
+            profiling.write_trace(trace)
+        if summary:
+            profiling.write_summary(sys.stderr)
+
+    ctx.call_on_close(finish)
+
+
 @app.callback()
 def main(
+    ctx: typer.Context,
     version: Optional[bool] = typer.Option(
         None,
         "--version",
@@ -212,6 +882,23 @@ def main(
         help="Show the application's version and exit.",
         callback=_version_callback,
         is_eager=True,
-    )
+    ),
+    profile: bool = typer.Option(
+        False,
+        "--profile",
+        envvar=profiling.PROFILE_ENV,
+        help="Print the time spent in each layer to stderr.",
+    ),
+    trace: Optional[Path] = typer.Option(
+        None,
+        envvar=profiling.TRACE_ENV,
+        help="Write the timed spans to this file as a Chrome trace.",
+    ),
+    cprofile: Optional[Path] = typer.Option(
+        None,
+        envvar=profiling.CPROFILE_ENV,
+        help="Run the command under cProfile and save the stats here.",
+    ),
 ) -> None:
-    return
+    if profile or trace is not None or cprofile is not None:
+        _start_profiling(ctx, profile, trace, cprofile)
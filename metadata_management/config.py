@@ -1,6 +1,8 @@
 """Config management."""
 import configparser
+import datetime
 from pathlib import Path
+from typing import Any, Dict, Optional
 
 import typer
 
@@ -11,22 +13,85 @@ from metadata_management import (
     SUCCESS,
     __app_name__,
 )
+from metadata_management.database import JSON_BACKEND
+from metadata_management.discovery import DEFAULT_TTL
 
 CONFIG_DIR_PATH = Path(typer.get_app_dir(__app_name__))
 CONFIG_FILE_PATH = CONFIG_DIR_PATH / "config.ini"
+DISCOVERY_CACHE_PATH = CONFIG_DIR_PATH / "discovery.json"
+DEFAULT_SOCKET_PATH = CONFIG_DIR_PATH / "server.sock"
 
 
-def init_app(db_path: str) -> int:
+def init_app(db_path: str, backend: str = JSON_BACKEND) -> int:
     """Initialize the application."""
     config_code = _init_config_file()
     if config_code != SUCCESS:
         return config_code
-    database_code = _create_database(db_path)
+    database_code = _create_database(db_path, backend)
     if database_code != SUCCESS:
         return database_code
     return SUCCESS
 
 
+def get_local_pool(config_file: Path) -> Optional[str]:
+    """Return the supernet reservations are allocated from locally."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    if not config_parser.has_section("IPAM"):
+        return None
+    return config_parser["IPAM"].get("cidr")
+
+
+def get_pool_name(config_file: Path) -> Optional[str]:
+    """Return the name of the IPAM pool reservations are made from."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    if not config_parser.has_section("IPAM"):
+        return None
+    return config_parser["IPAM"].get("pool")
+
+
+def get_cache_ttl(config_file: Path) -> float:
+    """Return how long discovered IPAM resource IDs are cached."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    if not config_parser.has_section("IPAM"):
+        return DEFAULT_TTL
+    return config_parser["IPAM"].getfloat("cache_ttl", DEFAULT_TTL)
+
+
+def get_socket_path(config_file: Path) -> Path:
+    """Return the Unix socket the server listens on."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    if not config_parser.has_section("Server"):
+        return DEFAULT_SOCKET_PATH
+    return Path(config_parser["Server"].get("socket", DEFAULT_SOCKET_PATH))
+
+
+def get_archive_after(config_file: Path) -> Optional[datetime.timedelta]:
+    """Return the age past which inactive metadata is archived, if set."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    days = config_parser["General"].getfloat("archive_after_days")
+    return datetime.timedelta(days=days) if days is not None else None
+
+
+def get_aws_options(config_file: Path) -> Dict[str, Any]:
+    """Return the AWS client settings from the [AWS] section."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    if not config_parser.has_section("AWS"):
+        return {}
+    section, options = config_parser["AWS"], {}
+    if "profile" in section:
+        options["profile_name"] = section["profile"]
+    for option in ("max_pool_connections", "max_attempts"):
+        if option in section:
+            options[option] = section.getint(option)
+    return options
+
+
 def _init_config_file() -> int:
     try:
         CONFIG_DIR_PATH.mkdir(exist_ok=True)
@@ -39,9 +104,13 @@ def _init_config_file() -> int:
     return SUCCESS
 
 
-def _create_database(db_path: str) -> int:
+def _create_database(db_path: str, backend: str) -> int:
     config_parser = configparser.ConfigParser()
-    config_parser["General"] = {"database": db_path}
+    config_parser.read(CONFIG_FILE_PATH)  # Keep the other settings
+    if not config_parser.has_section("General"):
+        config_parser.add_section("General")
+    config_parser["General"]["database"] = db_path
+    config_parser["General"]["backend"] = backend
     try:
         with CONFIG_FILE_PATH.open("w") as file:
             config_parser.write(file)
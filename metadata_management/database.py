@@ -1,19 +1,61 @@
 """Database access module."""
 import configparser
+import fcntl
 import json
-from typing import Any, Dict, List, NamedTuple
+import os
+import stat
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from json.decoder import WHITESPACE
 from pathlib import Path
-import configparser
+from types import TracebackType
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Type,
+    Union,
+)
+
 from metadata_management import (
+    DB_LOCK_ERROR,
     DB_READ_ERROR,
     DB_WRITE_ERROR,
+    ERRORS,
+    ID_ERROR,
     JSON_ERROR,
     SUCCESS,
+    profiling,
 )
+from metadata_management.records import MISSING, MetadataRecord
 
 DEFAULT_DB_FILE_PATH = Path.home().joinpath(
     "." + Path.home().stem + "_metadata.json"
 )
+JSON_BACKEND = "json"
+WAL_BACKEND = "wal"
+SQLITE_BACKEND = "sqlite"
+PACKED_BACKEND = "packed"
+SHARDED_BACKEND = "sharded"
+BACKENDS = (
+    JSON_BACKEND,
+    WAL_BACKEND,
+    SQLITE_BACKEND,
+    PACKED_BACKEND,
+    SHARDED_BACKEND,
+)
+DEFAULT_BATCH_SIZE = 1000
+DEFAULT_LOCK_TIMEOUT = 10.0  # seconds
+LOCK_SUFFIX = ".lock"
+READ_CHUNK_SIZE = 64 * 1024  # characters per read when streaming
 
 
 def get_database_path(config_file: Path) -> Path:
@@ -23,43 +65,643 @@ def get_database_path(config_file: Path) -> Path:
     return Path(config_parser["General"]["database"])
 
 
-def init_database(db_path: Path) -> int:
+def get_database_backend(config_file: Path) -> str:
+    """Return the storage backend configured for the metadata database."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    return config_parser["General"].get("backend", JSON_BACKEND)
+
+
+def get_lock_timeout(config_file: Path) -> float:
+    """Return how long writers wait for the database lock."""
+    config_parser = configparser.ConfigParser()
+    config_parser.read(config_file)
+    return config_parser["General"].getfloat(
+        "lock_timeout", DEFAULT_LOCK_TIMEOUT
+    )
+
+
+def atomic_write(path: Path, data: Union[str, bytes]) -> None:
+    """Replace ``path`` with ``data`` without exposing a partial file.
+
+    The data is written to a temporary file in the same directory, synced
+    to disk and renamed over ``path``.
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=path.name + ".")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            tmp.write(data)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        try:
+            os.chmod(tmp_name, stat.S_IMODE(path.stat().st_mode))
+        except FileNotFoundError:
+            pass
+        os.replace(tmp_name, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_name)
+        except OSError:
+            pass
+        raise
+    dir_fd = os.open(path.parent, os.O_RDONLY)
+    try:
+        os.fsync(dir_fd)
+    finally:
+        os.close(dir_fd)
+
+
+class JSONObjectStream:
+    """Iterate the members of a JSON object without loading the document.
+
+    Only the unconsumed part of the current chunk and the member being
+    decoded are held in memory. The empty list written by
+    ``init_database`` and an empty file are read as an empty object.
+    """
+
+    def __init__(self, stream: IO[str], chunk_size: int = READ_CHUNK_SIZE):
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _read(self) -> bool:
+        if self._eof:
+            return False
+        chunk = self._stream.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer = self._buffer[self._pos :] + chunk
+        self._pos = 0
+        return True
+
+    def _peek(self) -> str:
+        """Return the next non-whitespace character, or "" at the end."""
+        while True:
+            self._pos = WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._read():
+                return ""
+
+    def _expect(self, chars: str) -> str:
+        char = self._peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(
+                f"Expecting one of {chars!r}", self._buffer, self._pos
+            )
+        self._pos += 1
+        return char
+
+    def _value(self) -> Any:
+        self._peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError:
+                if self._read():
+                    continue  # The value continues in the next chunk
+                raise
+            if end == len(self._buffer) and self._read():
+                continue  # A number may continue in the next chunk
+            self._pos = end
+            return value
+
+    def __iter__(self) -> Iterator[Tuple[str, Any]]:
+        opening = self._peek()
+        if opening == "[":
+            self._pos += 1
+            self._expect("]")
+        elif opening:
+            self._expect("{")
+            if self._peek() == "}":
+                self._pos += 1
+            else:
+                while True:
+                    if self._peek() != '"':
+                        self._expect('"')
+                    key = self._value()
+                    self._expect(":")
+                    yield key, self._value()
+                    if self._expect(",}") == "}":
+                        break
+        if self._peek():
+            raise json.JSONDecodeError("Extra data", self._buffer, self._pos)
+
+
+class FileLock:
+    """Re-entrant advisory ``fcntl`` lock shared by processes and threads.
+
+    The lock is taken on a separate file because the database file itself
+    is replaced on every write.
+    """
+
+    def __init__(self, path: Path, timeout: float = DEFAULT_LOCK_TIMEOUT):
+        self._path = path
+        self._timeout = timeout
+        self._thread_lock = threading.RLock()
+        self._depth = 0
+        self._fd: Optional[int] = None
+        self.wait_time = 0.0
+
+    def acquire(self) -> bool:
+        """Take the lock, giving up after the timeout."""
+        start = time.monotonic()
+        deadline = start + self._timeout
+        if not self._thread_lock.acquire(timeout=self._timeout):
+            return False
+        if self._depth == 0:
+            try:
+                fd = os.open(self._path, os.O_RDWR | os.O_CREAT, 0o644)
+            except OSError:
+                self._thread_lock.release()
+                return False
+            delay = 0.001
+            while True:
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        os.close(fd)
+                        self._thread_lock.release()
+                        return False
+                    time.sleep(delay)
+                    delay = min(delay * 2, 0.05)
+            self._fd = fd
+        self._depth += 1
+        self.wait_time += time.monotonic() - start
+        return True
+
+    def release(self) -> None:
+        self._depth -= 1
+        if self._depth == 0:
+            fcntl.flock(self._fd, fcntl.LOCK_UN)
+            os.close(self._fd)
+            self._fd = None
+        self._thread_lock.release()
+
+
+def init_database(db_path: Path, backend: str = JSON_BACKEND) -> int:
     """Create the metadata database."""
+    if backend == SQLITE_BACKEND:
+        from metadata_management.sqlite import SQLiteDatabaseHandler
+
+        try:
+            for suffix in ("", "-wal", "-shm"):  # SQLite would replay a log
+                db_path.with_name(db_path.name + suffix).unlink(
+                    missing_ok=True
+                )
+        except OSError:
+            return DB_WRITE_ERROR
+        db_handler = SQLiteDatabaseHandler(db_path)
+        error = db_handler.create()
+        db_handler.close()
+        return error
     try:
+        if backend == PACKED_BACKEND:
+            from metadata_management.packed import pack
+
+            db_path.write_bytes(pack({}))
+            return SUCCESS
+        if backend == SHARDED_BACKEND:
+            from metadata_management.sharded import (
+                DEFAULT_SHARDS,
+                write_shards,
+            )
+
+            write_shards(db_path, {}, DEFAULT_SHARDS)
+            return SUCCESS
         db_path.write_text("[]")  # Empty metadata list
+        if backend == WAL_BACKEND:
+            from metadata_management.wal import get_log_path
+
+            get_log_path(db_path).unlink(missing_ok=True)
         return SUCCESS
     except OSError:
         return DB_WRITE_ERROR
 
 
+def open_database(
+    db_path: Path,
+    backend: str = JSON_BACKEND,
+    lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+    resident: bool = False,
+) -> "DatabaseHandler":
+    """Return the database handler implementing ``backend``.
+
+    With ``resident`` a JSON database is kept parsed in memory, for
+    long-lived processes. The other backends do not need to parse the
+    whole database for each operation.
+    """
+    if backend == WAL_BACKEND:
+        from metadata_management.wal import LogDatabaseHandler
+
+        return LogDatabaseHandler(db_path, lock_timeout=lock_timeout)
+    if backend == SQLITE_BACKEND:
+        from metadata_management.sqlite import SQLiteDatabaseHandler
+
+        return SQLiteDatabaseHandler(db_path, lock_timeout=lock_timeout)
+    if backend == PACKED_BACKEND:
+        from metadata_management.packed import PackedDatabaseHandler
+
+        return PackedDatabaseHandler(db_path, lock_timeout=lock_timeout)
+    if backend == SHARDED_BACKEND:
+        from metadata_management.sharded import ShardedDatabaseHandler
+
+        return ShardedDatabaseHandler(db_path, lock_timeout=lock_timeout)
+    if resident:
+        return CachedDatabaseHandler(db_path, lock_timeout=lock_timeout)
+    return DatabaseHandler(db_path, lock_timeout=lock_timeout)
+
+
+class MigrationResult(NamedTuple):
+    rows: int
+    error: int
+
+
+def migrate_database(
+    source: "DatabaseHandler",
+    target: "DatabaseHandler",
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> MigrationResult:
+    """Copy every record from ``source`` to ``target`` in batches.
+
+    Targets that rewrite their whole file on each write get a single one.
+    """
+    read = source.read_metadata()
+    if read.error:
+        return MigrationResult(0, read.error)
+    if target.rewrites_file:
+        error = target.write_metadata(read.metadata).error
+        return MigrationResult(0 if error else len(read.metadata), error)
+    rows, batch = 0, {}
+    for title, record in read.metadata.items():
+        batch[title] = record
+        if len(batch) >= batch_size:
+            error = target.put_records(batch).error
+            if error:
+                return MigrationResult(rows, error)
+            rows, batch = rows + len(batch), {}
+    if batch:
+        error = target.put_records(batch).error
+        if error:
+            return MigrationResult(rows, error)
+        rows += len(batch)
+    return MigrationResult(rows, SUCCESS)
+
+
 class DBResponse(NamedTuple):
     metadata: Dict[str, Any]
     error: int
 
 
+class MetadataFilter(NamedTuple):
+    """Conditions a record must meet to be listed."""
+
+    prefix: Optional[str] = None
+    active_only: bool = False
+    assigned_by: Optional[str] = None
+    since: Optional[str] = None  # ISO 8601, compared with AssignedDateUTC
+    value: Optional[str] = None
+    inactive_only: bool = False
+
+    def matches(self, title: str, record: Dict[str, Any]) -> bool:
+        return (
+            (self.prefix is None or title.startswith(self.prefix))
+            and not (self.active_only and record.get("inactive"))
+            and not (self.inactive_only and not record.get("inactive"))
+            and (self.value is None or record.get("Value") == self.value)
+            and (
+                self.assigned_by is None
+                or record.get("AssignedBy") == self.assigned_by
+            )
+            and (
+                self.since is None
+                or (record.get("AssignedDateUTC") or "") >= self.since
+            )
+        )
+
+
+class DatabaseError(Exception):
+    """Raised by streaming reads, which cannot return an error code."""
+
+    def __init__(self, error: int) -> None:
+        super().__init__(ERRORS.get(error, "database error"))
+        self.error = error
+
+
+class Transaction:
+    """A single read-modify-write cycle against the database.
+
+    The database is locked and parsed once on enter, then serialized and
+    unlocked once on exit. Changes are discarded if the read failed,
+    ``rollback`` was called or the block raised.
+    """
+
+    def __init__(self, db_handler: "DatabaseHandler") -> None:
+        self._db_handler = db_handler
+        self._rolled_back = False
+        self._locked = False
+        self.metadata: Dict[str, Any] = {}
+        self.error = SUCCESS
+
+    def rollback(self, error: int = SUCCESS) -> None:
+        """Discard the changes made in this transaction."""
+        self._rolled_back = True
+        self.error = error
+
+    def __enter__(self) -> "Transaction":
+        self._locked = self._db_handler.lock.acquire()
+        if not self._locked:
+            self.error = DB_LOCK_ERROR
+            return self
+        self.metadata, self.error = self._db_handler.read_metadata()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: Optional[Type[BaseException]],
+        exc_value: Optional[BaseException],
+        traceback: Optional[TracebackType],
+    ) -> None:
+        if not self._locked:
+            return
+        try:
+            if exc_type is None and not self.error and not self._rolled_back:
+                write = self._db_handler.write_metadata(self.metadata)
+                self.error = write.error
+        finally:
+            self._db_handler.lock.release()
+
+
 class DatabaseHandler:
-    def __init__(self, db_path: Path) -> None:
+    rewrites_file = True  # Each write replaces the whole file
+
+    def __init__(
+        self, db_path: Path, lock_timeout: float = DEFAULT_LOCK_TIMEOUT
+    ) -> None:
         self._db_path = db_path
+        self.lock = FileLock(
+            db_path.with_name(db_path.name + LOCK_SUFFIX), lock_timeout
+        )
 
+    @profiling.traced
     def read_metadata(self) -> DBResponse:
         try:
             with self._db_path.open("r") as db:
                 try:
-                    data = db.read()
-                    return DBResponse(
-                        json.loads("{}" if data == "[]" else data), SUCCESS
-                    )
+                    with profiling.span("file.read") as read:
+                        data = db.read()
+                        read.annotate(bytes_read=len(data))
+                    if data.strip() in ("", "[]"):  # Empty metadata list
+                        return DBResponse({}, SUCCESS)
+                    with profiling.span("json.loads") as parse:
+                        metadata = json.loads(data)
+                        parse.annotate(rows=len(metadata))
+                    return DBResponse(metadata, SUCCESS)
                 except json.JSONDecodeError:  # Catch wrong JSON format
                     return DBResponse({}, JSON_ERROR)
         except OSError:  # Catch file IO problems
             return DBResponse({}, DB_READ_ERROR)
 
+    @profiling.traced
     def write_metadata(self, metadata: Dict[str, Any]) -> DBResponse:
+        """Replace the database content with ``metadata``."""
+        if not self.lock.acquire():
+            return DBResponse(metadata, DB_LOCK_ERROR)
         try:
-            existing_rows = self.read_metadata().metadata
-            existing_rows.update(metadata)
-            with self._db_path.open("w") as db:
-                json.dump(existing_rows, db, indent=4)
+            with profiling.span("json.dumps") as serialize:
+                data = json.dumps(metadata, indent=4)
+                serialize.annotate(rows=len(metadata))
+            with profiling.span("file.write") as write:
+                atomic_write(self._db_path, data)
+                write.annotate(bytes_written=len(data))
             return DBResponse(metadata, SUCCESS)
         except OSError:  # Catch file IO problems
             return DBResponse(metadata, DB_WRITE_ERROR)
+        finally:
+            self.lock.release()
+
+    def files(self) -> List[Path]:
+        """Return the files holding the database."""
+        return [self._db_path]
+
+    @contextmanager
+    def write_lock(
+        self, titles: Optional[Iterable[str]] = None
+    ) -> Iterator[List[Path]]:
+        """Hold the lock taken by writes of ``titles``, or of any title.
+
+        Yields the files those writes change. Raises DatabaseError if the
+        lock cannot be taken.
+        """
+        if not self.lock.acquire():
+            raise DatabaseError(DB_LOCK_ERROR)
+        try:
+            yield self.files()
+        finally:
+            self.lock.release()
+
+    def transaction(self) -> Transaction:
+        """Return a context manager committing its changes in one write."""
+        return Transaction(self)
+
+    def compact(self) -> int:
+        """Reclaim the space of deleted records.
+
+        The file is rewritten on every write, so there is nothing to do.
+        """
+        return SUCCESS
+
+    def close(self) -> None:
+        """Release what the handler keeps open; the file is not kept."""
+
+    def count_rows(self) -> Tuple[int, int]:
+        """Return the number of rows and of inactive rows.
+
+        Raises DatabaseError if the database cannot be read.
+        """
+        rows = inactive = 0
+        for _, record in self.iter_metadata():
+            rows += 1
+            inactive += bool(record.get("inactive"))
+        return rows, inactive
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(title, record)`` pairs, raising DatabaseError on failure.
+
+        The file is decoded incrementally, so memory use does not grow with
+        the size of the database.
+        """
+        try:
+            with self._db_path.open("r") as db:
+                for title, record in JSONObjectStream(db):
+                    if where is None or where.matches(title, record):
+                        yield title, record
+        except json.JSONDecodeError:
+            raise DatabaseError(JSON_ERROR)
+        except OSError:
+            raise DatabaseError(DB_READ_ERROR)
+
+    def get_record(self, title: str) -> DBResponse:
+        """Return a single record."""
+        try:
+            for record_title, record in self.iter_metadata():
+                if record_title == title:
+                    return DBResponse(record, SUCCESS)
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+        return DBResponse({}, ID_ERROR)
+
+    def put_record(self, title: str, record: Dict[str, Any]) -> DBResponse:
+        """Insert or replace a single record."""
+        with self.transaction() as txn:
+            txn.metadata[title] = record
+        return DBResponse({title: record}, txn.error)
+
+    def put_records(
+        self, records: Dict[str, Any], delete: Iterable[str] = ()
+    ) -> DBResponse:
+        """Insert or replace several records, and delete others, in one write.
+
+        Titles in ``delete`` that do not exist are ignored.
+        """
+        with self.transaction() as txn:
+            txn.metadata.update(records)
+            for title in delete:
+                txn.metadata.pop(title, None)
+        return DBResponse(records, txn.error)
+
+    def update_record(self, title: str, changes: Dict[str, Any]) -> DBResponse:
+        """Update fields of an existing record and return the new record."""
+        with self.transaction() as txn:
+            if txn.error:
+                return DBResponse({}, txn.error)
+            if title not in txn.metadata:
+                txn.rollback(ID_ERROR)
+                return DBResponse({}, ID_ERROR)
+            record = {**txn.metadata[title], **changes}
+            txn.metadata[title] = record
+        return DBResponse(record, txn.error)
+
+    def delete_record(self, title: str) -> DBResponse:
+        """Delete a single record and return it."""
+        with self.transaction() as txn:
+            if txn.error:
+                return DBResponse({}, txn.error)
+            if title not in txn.metadata:
+                txn.rollback(ID_ERROR)
+                return DBResponse({}, ID_ERROR)
+            record = txn.metadata.pop(title)
+        return DBResponse(record, txn.error)
+
+
+class CachedDatabaseHandler(DatabaseHandler):
+    """Keep the parsed JSON database in memory between operations.
+
+    The file is parsed again only when its inode, size or modification
+    time changes, so a long-lived process still sees changes made by
+    others. Rows are held as ``MetadataRecord`` objects, which take far
+    less memory than dicts, and converted back on every read.
+    """
+
+    def __init__(
+        self, db_path: Path, lock_timeout: float = DEFAULT_LOCK_TIMEOUT
+    ) -> None:
+        super().__init__(db_path, lock_timeout)
+        self._metadata: Dict[str, MetadataRecord] = {}
+        self._stamp: Optional[Tuple[int, int, int]] = None
+
+    def _stat(self) -> Tuple[int, int, int]:
+        info = os.stat(self._db_path)
+        return info.st_ino, info.st_size, info.st_mtime_ns
+
+    def _refresh(self) -> int:
+        try:
+            stamp = self._stat()
+        except OSError:
+            return DB_READ_ERROR
+        if stamp != self._stamp:
+            try:
+                metadata = {
+                    title: MetadataRecord.from_dict(record)
+                    for title, record in super().iter_metadata()
+                }
+            except DatabaseError as exc:
+                return exc.error
+            self._metadata, self._stamp = metadata, stamp
+        return SUCCESS
+
+    @profiling.traced
+    def read_metadata(self) -> DBResponse:
+        error = self._refresh()
+        if error:
+            return DBResponse({}, error)
+        return DBResponse(
+            {title: row.to_dict() for title, row in self._metadata.items()},
+            SUCCESS,
+        )
+
+    @profiling.traced
+    def write_metadata(self, metadata: Dict[str, Any]) -> DBResponse:
+        """Replace the database content with ``metadata``."""
+        if not self.lock.acquire():
+            return DBResponse(metadata, DB_LOCK_ERROR)
+        try:
+            write = super().write_metadata(metadata)
+            if write.error:
+                self._stamp = None
+            else:
+                self._metadata = {
+                    title: MetadataRecord.from_dict(row)
+                    for title, row in metadata.items()
+                }
+                self._stamp = self._stat()
+            return write
+        except OSError:
+            self._stamp = None
+            return DBResponse(metadata, DB_WRITE_ERROR)
+        finally:
+            self.lock.release()
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(title, record)`` pairs from the parsed database."""
+        error = self._refresh()
+        if error:
+            raise DatabaseError(error)
+        # Writes replace the cached dict rather than change it
+        for title, row in self._metadata.items():
+            record = row.to_dict()
+            if where is None or where.matches(title, record):
+                yield title, record
+
+    def count_rows(self) -> Tuple[int, int]:
+        """Return the number of rows and of inactive rows."""
+        error = self._refresh()
+        if error:
+            raise DatabaseError(error)
+        metadata = self._metadata
+        inactive = sum(
+            row.inactive is not MISSING and bool(row.inactive)
+            for row in metadata.values()
+        )
+        return len(metadata), inactive
+
+    def get_record(self, title: str) -> DBResponse:
+        """Return a single record."""
+        error = self._refresh()
+        if error:
+            return DBResponse({}, error)
+        if title not in self._metadata:
+            return DBResponse({}, ID_ERROR)
+        return DBResponse(self._metadata[title].to_dict(), SUCCESS)
@@ -0,0 +1,86 @@
+"""Cache of IPAM, scope and pool IDs discovered through the EC2 API."""
+import json
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from metadata_management.database import atomic_write
+
+DEFAULT_TTL = 3600.0  # seconds
+IPAM = "ipam"
+SCOPE = "scope"
+POOL = "pool"
+
+
+def _key(kind: str, name: str, profile: Optional[str]) -> str:
+    return f"{profile or ''}:{kind}:{name}"
+
+
+class DiscoveryCache:
+    """Read-through TTL cache of resource IDs per region, kept in a file.
+
+    IDs rarely change, so looking them up once per TTL saves a describe
+    call on every reservation. Entries are keyed by region, AWS profile,
+    resource kind and the name used to select the resource, so that
+    profiles for different accounts never share an ID.
+    """
+
+    def __init__(self, path: Path, ttl: float = DEFAULT_TTL) -> None:
+        self._path = path
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, Dict[str, Any]]] = None
+
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if self._entries is None:
+            try:
+                self._entries = json.loads(self._path.read_text())
+            except (OSError, ValueError):
+                self._entries = {}
+        return self._entries
+
+    def _save(self) -> None:
+        try:
+            atomic_write(self._path, json.dumps(self._entries, indent=4))
+        except OSError:
+            pass  # A cache that cannot be saved is only slower
+
+    def get(
+        self, region: str, kind: str, name: str = "", profile: str = None
+    ) -> Optional[str]:
+        """Return a cached ID, or None if missing or expired."""
+        with self._lock:
+            entry = self._load().get(region, {}).get(
+                _key(kind, name, profile)
+            )
+        if entry is None or entry["expires"] < time.time():
+            return None
+        return entry["id"]
+
+    def set(
+        self,
+        region: str,
+        kind: str,
+        name: str,
+        value: str,
+        profile: str = None,
+    ) -> None:
+        with self._lock:
+            self._load().setdefault(region, {})[
+                _key(kind, name, profile)
+            ] = {
+                "id": value,
+                "expires": time.time() + self._ttl,
+            }
+            self._save()
+
+    def invalidate(self, region: str = None) -> None:
+        """Forget the entries of one region, or of all regions."""
+        with self._lock:
+            entries = self._load()
+            if region is None:
+                entries.clear()
+            else:
+                entries.pop(region, None)
+            self._save()
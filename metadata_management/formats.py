@@ -0,0 +1,126 @@
+"""Read and write metadata rows as JSON, JSON Lines, CSV or a table."""
+import csv
+import io
+import json
+from itertools import islice
+from typing import IO, Any, Dict, Iterable, Iterator, Optional, Tuple
+
+import typer
+
+JSON = "json"
+JSONL = "jsonl"
+CSV = "csv"
+TABLE = "table"
+FORMATS = (JSONL, CSV)
+OUTPUT_FORMATS = (TABLE, JSON, JSONL, CSV)
+FIELDS = (
+    "Title",
+    "Value",
+    "Comment",
+    "AssignedBy",
+    "AssignedDateUTC",
+    "inactive",
+)
+WRITE_BATCH_SIZE = 1000  # lines per write call
+
+
+def read_rows(stream: IO[str], fmt: str = JSONL) -> Iterator[Optional[Dict]]:
+    """Yield one dict per input row, or None for a row that cannot be parsed.
+
+    Blank JSON Lines are skipped so that row numbers follow the records.
+    """
+    if fmt == CSV:
+        yield from csv.DictReader(stream)
+        return
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError:
+            row = None
+        yield row if isinstance(row, dict) else None
+
+
+def to_row(title: str, record: Dict[str, Any]) -> Dict[str, Any]:
+    """Flatten a database record into an export row."""
+    return {"Title": title, **record}
+
+
+def _jsonl_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    for row in rows:
+        yield json.dumps(row) + "\n"
+
+
+def _json_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    separator = "[\n"
+    for row in rows:
+        yield separator + "    " + json.dumps(row)
+        separator = ",\n"
+    yield "\n]\n" if separator == ",\n" else "[]\n"
+
+
+def _csv_lines(rows: Iterable[Dict[str, Any]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, FIELDS, extrasaction="ignore")
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():  # Header only
+        yield buffer.getvalue()
+
+
+def _table_lines(
+    rows: Iterable[Dict[str, Any]], color: bool = False
+) -> Iterator[str]:
+    headers = " ".join(FIELDS)
+    rule = "-" * len(headers)
+    if color:
+        headers = typer.style(headers, fg=typer.colors.BLUE, bold=True)
+        rule = typer.style(rule, fg=typer.colors.BLUE)
+    rule += "\n"
+    yield headers + "\n"
+    yield rule
+    for row in rows:
+        yield " ".join(str(row.get(field, "")) for field in FIELDS) + "\n"
+    yield rule
+
+
+LINE_WRITERS = {
+    JSON: _json_lines,
+    JSONL: _jsonl_lines,
+    CSV: _csv_lines,
+    TABLE: _table_lines,
+}
+
+
+def write_rows(
+    stream: IO[str],
+    metadata: Iterable[Tuple[str, Dict[str, Any]]],
+    fmt: str = JSONL,
+) -> int:
+    """Write ``(title, record)`` pairs to ``stream`` and return the count.
+
+    Lines are written in batches so that output to a terminal is not
+    flushed once per row.
+    """
+    count = 0
+
+    def rows() -> Iterator[Dict[str, Any]]:
+        nonlocal count
+        for title, record in metadata:
+            count += 1
+            yield to_row(title, record)
+
+    if fmt == TABLE:  # Colored on terminals only
+        lines = _table_lines(rows(), stream.isatty())
+    else:
+        lines = LINE_WRITERS[fmt](rows())
+    while True:
+        batch = "".join(islice(lines, WRITE_BATCH_SIZE))
+        if not batch:
+            return count
+        stream.write(batch)
@@ -0,0 +1,166 @@
+"""Secondary indexes for the JSON and WAL backends."""
+import json
+import threading
+from pathlib import Path
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from metadata_management import DB_WRITE_ERROR
+from metadata_management.database import MetadataFilter
+
+if TYPE_CHECKING:
+    from metadata_management.sqlite import SQLiteDatabaseHandler
+
+INDEX_SUFFIX = ".idx"
+STAMP_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sources "
+    "(path TEXT PRIMARY KEY, stamp TEXT NOT NULL)"
+)
+
+
+def get_index_path(db_path: Path) -> Path:
+    """Return the path of the index kept next to ``db_path``."""
+    return db_path.with_name(db_path.name + INDEX_SUFFIX)
+
+
+def _stat(path: Path) -> Optional[List[int]]:
+    try:
+        stat = path.stat()
+    except FileNotFoundError:
+        return None
+    return [stat.st_ino, stat.st_size, stat.st_mtime_ns]
+
+
+def source_stamps(paths: Iterable[Path]) -> Dict[str, str]:
+    """Return a string per path that changes whenever the file changes."""
+    return {str(path): json.dumps(_stat(path)) for path in paths}
+
+
+class MetadataIndex:
+    """Copy of a database in an SQLite file indexed on its fields.
+
+    Lookups by value, assignee, title prefix and inactive flag use the
+    indexes of the copy instead of scanning the database. The copy
+    records the stat of each file returned by ``sources`` and is stale
+    once one of them has changed other than through ``update``. Callers
+    hold the locks of the files a write changes while checking and
+    updating them, so that writers of different shards update the index
+    side by side, and hold every lock while rebuilding it. sqlite3 is
+    imported on first use, as most commands never touch the index.
+    """
+
+    def __init__(
+        self, db_path: Path, sources: Callable[[], Iterable[Path]]
+    ) -> None:
+        self.path = get_index_path(db_path)
+        self._sources = sources
+        self._handler = None
+        self._lock = threading.RLock()  # Threads share one connection
+
+    @property
+    def handler(self) -> "SQLiteDatabaseHandler":
+        if self._handler is None:
+            from metadata_management.sqlite import SQLiteDatabaseHandler
+
+            self._handler = SQLiteDatabaseHandler(self.path)
+            self._handler.create()
+            self._handler.connection.execute(STAMP_SCHEMA)
+        return self._handler
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def _set_stamps(
+        self, stamps: Dict[str, str], fresh: bool = True
+    ) -> None:
+        """Record ``stamps``, or mark their files stale unless ``fresh``."""
+        with self.handler._write() as connection:
+            if fresh:
+                connection.executemany(
+                    "INSERT OR REPLACE INTO sources VALUES (?, ?)",
+                    stamps.items(),
+                )
+            else:
+                connection.executemany(
+                    "DELETE FROM sources WHERE path = ?",
+                    ((path,) for path in stamps),
+                )
+
+    def is_fresh(self, paths: Iterable[Path] = None) -> bool:
+        """Tell whether the index matches its sources.
+
+        With ``paths`` only the records of those files are checked.
+        """
+        import sqlite3
+
+        if not self.exists():
+            return False
+        with self._lock:
+            try:
+                stored = dict(
+                    self.handler.connection.execute(
+                        "SELECT path, stamp FROM sources"
+                    )
+                )
+            except sqlite3.Error:
+                return False
+        if paths is None:
+            return stored == source_stamps(self._sources())
+        return all(
+            stored.get(path) == stamp
+            for path, stamp in source_stamps(paths).items()
+        )
+
+    def rebuild(self, metadata: Iterable[Tuple[str, Dict[str, Any]]]) -> int:
+        """Replace the content of the index with ``metadata``."""
+        import sqlite3
+
+        stamps = source_stamps(self._sources())
+        with self._lock:
+            try:
+                with self.handler._write() as connection:
+                    connection.execute("DELETE FROM sources")
+                write = self.handler.write_metadata(dict(metadata))
+                if not write.error:
+                    self._set_stamps(stamps)
+            except sqlite3.Error:
+                return DB_WRITE_ERROR
+        return write.error
+
+    def update(
+        self,
+        records: Dict[str, Any],
+        delete: Iterable[str] = (),
+        paths: Iterable[Path] = None,
+    ) -> int:
+        """Apply a write just made to ``paths``, or to all the sources.
+
+        The index is left stale, to be rebuilt, if this fails.
+        """
+        import sqlite3
+
+        paths = list(paths) if paths is not None else self._sources()
+        with self._lock:
+            try:
+                write = self.handler.put_records(records, delete)
+                self._set_stamps(source_stamps(paths), not write.error)
+            except sqlite3.Error:
+                return DB_WRITE_ERROR
+        return write.error
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return self.handler.iter_metadata(where)
+
+    def count_rows(self) -> Tuple[int, int]:
+        return self.handler.count_rows()
@@ -1,12 +1,24 @@
 """A module for interacting AWS IPAM."""
+from metadata_management import discovery
 from metadata_management.aws import AWSAPIOperation
 
+ALLOCATIONS_PAGE_SIZE = 1000
+
+
+def _tag_value(resource, key):
+    for tag in resource.get("Tags") or []:
+        if tag.get("Key") == key:
+            return tag.get("Value")
+    return None
+
 
 class IPAM(AWSAPIOperation):
     """Represent an empty IPAM config."""
 
-    def __init__(self, region_name: str = None, dry_run: bool = True):
-        super().__init__(region_name, dry_run)
+    def __init__(
+        self, region_name: str = None, dry_run: bool = True, **client_options
+    ):
+        super().__init__(region_name, dry_run, **client_options)
         self.name = None
         self.ipam_id = None
         self.pool_name = None
@@ -24,15 +36,41 @@ class IPAM(AWSAPIOperation):
         self.ipam_id = response.get("IpamId")
         return self
 
-    def from_existing(self, name: str):
-        """Use an existing one."""
+    def from_existing(self, name: str, cache=None, refresh: bool = False):
+        """Use an existing one, looked up through ``cache`` if given."""
         self.name = name
+        region = self.region_name or self.client.meta.region_name
+        if cache is not None and not refresh:
+            self.ipam_id = cache.get(
+                region, discovery.IPAM, name, self.profile_name
+            )
+            self.scope_id = cache.get(
+                region, discovery.SCOPE, name, self.profile_name
+            )
+            if self.ipam_id and self.scope_id:
+                return self
         response = self.client.describe_ipams(
             DryRun=self.dry_run,
             IpamIds=[name]
         )
-        self.ipam_id = response.get("IpamId")
-        self.scope_id = response.get("PrivateDefaultScopeId")
+        ipam = (response.get("Ipams") or [{}])[0]
+        self.ipam_id = ipam.get("IpamId")
+        self.scope_id = ipam.get("PrivateDefaultScopeId")
+        if cache is not None and self.ipam_id:
+            cache.set(
+                region,
+                discovery.IPAM,
+                name,
+                self.ipam_id,
+                self.profile_name,
+            )
+            cache.set(
+                region,
+                discovery.SCOPE,
+                name,
+                self.scope_id,
+                self.profile_name,
+            )
         return self
 
     def delete(self):
@@ -48,8 +86,10 @@ class IPAM(AWSAPIOperation):
 class Scope(AWSAPIOperation):
     """Represent an empty IPAM scope config."""
 
-    def __init__(self, ipam_id, region_name, dry_run: bool = True):
-        super().__init__(region_name, dry_run)
+    def __init__(
+        self, ipam_id, region_name, dry_run: bool = True, **client_options
+    ):
+        super().__init__(region_name, dry_run, **client_options)
         response = self.client.create_ipam_scope(
             DryRun=self.dry_run, IpamId=ipam_id
         )
@@ -65,8 +105,10 @@ class Scope(AWSAPIOperation):
 class Pool(AWSAPIOperation):
     """Represent an IPAM IP pool."""
 
-    def __init__(self, region_name: str, dry_run: bool = True):
-        super().__init__(region_name, dry_run)
+    def __init__(
+        self, region_name: str, dry_run: bool = True, **client_options
+    ):
+        super().__init__(region_name, dry_run, **client_options)
         self.ipam_pool_id = None
         self.Cidr = None
 
@@ -81,24 +123,101 @@ class Pool(AWSAPIOperation):
         self.ipam_pool_id = response.get("IpamPoolId")
         return self
 
-    def from_existing(self):
-        """Use an existing pool on an existing scope."""
+    def from_existing(self, name: str = None, cache=None, refresh=False):
+        """Use an existing pool on an existing scope.
+
+        With ``name`` the pool whose ID, ``Name`` tag or description
+        matches is used. Otherwise, or if several match, the pool with the
+        lowest ID is picked so that the choice is stable. The ID is looked
+        up through ``cache`` if given, unless ``refresh`` is set.
+        """
+        region = self.region_name or self.client.meta.region_name
+        if cache is not None and not refresh:
+            self.ipam_pool_id = cache.get(
+                region, discovery.POOL, name or "", self.profile_name
+            )
+            if self.ipam_pool_id:
+                return self
         response = self.client.describe_ipam_pools(
             DryRun=self.dry_run,
         )
-        self.ipam_pool_id = response.get("IpamPools")[0].get("IpamPoolId")
+        pools = response.get("IpamPools")
+        if name is not None:
+            pools = [
+                pool
+                for pool in pools
+                if name
+                in (
+                    pool.get("IpamPoolId"),
+                    pool.get("Description"),
+                    _tag_value(pool, "Name"),
+                )
+            ]
+        if not pools:
+            raise LookupError(f"no IPAM pool matches {name!r}")
+        pool = min(pools, key=lambda pool: pool.get("IpamPoolId"))
+        self.ipam_pool_id = pool.get("IpamPoolId")
+        if cache is not None:
+            cache.set(
+                region,
+                discovery.POOL,
+                name or "",
+                self.ipam_pool_id,
+                self.profile_name,
+            )
+        return self
+
+    def allocate_cidr(
+        self, netmask_length, host=None, cidr=None, client_token=None
+    ):
+        """Reserve the next available IP CIDR block of the requested size.
+
+        Pass ``cidr`` to claim a specific block instead.
+        """
+        self.Cidr = self.request_cidr(netmask_length, host, cidr, client_token)
         return self
 
-    def allocate_cidr(self, netmask_length, host=None):
-        """Reserve the next available IP CIDR block of the requested size."""
+    def request_cidr(
+        self, netmask_length, host=None, cidr=None, client_token=None
+    ) -> str:
+        """Allocate a CIDR block and return it without changing the pool.
+
+        Requests repeated with the same ``client_token`` return the block
+        allocated the first time. Safe to call from several threads on one
+        pool.
+        """
+        if cidr is None:
+            options = {"NetmaskLength": netmask_length}
+        else:
+            options = {"Cidr": cidr}
+        if client_token is not None:
+            options["ClientToken"] = client_token
         response = self.client.allocate_ipam_pool_cidr(
             DryRun=self.dry_run,
             IpamPoolId=self.ipam_pool_id,
-            NetmaskLength=netmask_length,
             Description=host,
+            **options,
+        )
+        return response.get("IpamPoolAllocation").get("Cidr")
+
+    def iter_allocations(self):
+        """Yield every allocation of the pool, one page at a time."""
+        pages = self.client.get_paginator("get_ipam_pool_allocations")
+        for page in pages.paginate(
+            DryRun=self.dry_run,
+            IpamPoolId=self.ipam_pool_id,
+            PaginationConfig={"PageSize": ALLOCATIONS_PAGE_SIZE},
+        ):
+            yield from page.get("IpamPoolAllocations") or []
+
+    def release_allocation(self, allocation_id, cidr):
+        """Give an allocated CIDR block back to the pool."""
+        return self.client.release_ipam_pool_allocation(
+            DryRun=self.dry_run,
+            IpamPoolId=self.ipam_pool_id,
+            IpamPoolAllocationId=allocation_id,
+            Cidr=cidr,
         )
-        self.Cidr = response.get("IpamPoolAllocation").get("Cidr")
-        return self
 
     def delete(self):
         deprovision = self.client.deprovision_ipam_pool_cidr(
@@ -1,18 +1,64 @@
 """Manage metadata database."""
 import datetime
+import functools
+import itertools
 import os
 import pwd
+import time
+import weakref
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
 
-from typing import Any, Dict, NamedTuple
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
 
-from metadata_management import DB_READ_ERROR, ID_ERROR
-from metadata_management.database import DatabaseHandler
+from metadata_management import (
+    CIDR_ERROR,
+    DB_LOCK_ERROR,
+    DB_WRITE_ERROR,
+    SUCCESS,
+    VALIDATION_ERROR,
+    metrics,
+    profiling,
+    reconcile,
+)
+from metadata_management.allocator import AllocationError, CidrAllocator
+from metadata_management.aws import DEFAULT_MAX_POOL_CONNECTIONS
+from metadata_management.discovery import DiscoveryCache
+from metadata_management.database import (
+    DEFAULT_LOCK_TIMEOUT,
+    JSON_BACKEND,
+    SQLITE_BACKEND,
+    DatabaseError,
+    DatabaseHandler,
+    DBResponse,
+    MetadataFilter,
+    open_database,
+)
+from metadata_management.index import MetadataIndex, source_stamps
 from metadata_management.ipam import IPAM, Scope, Pool
 
-CURRENT_USER = pwd.getpwuid(os.getuid())[0]
+if TYPE_CHECKING:
+    from concurrent.futures import Executor
+
+    from metadata_management.snapshot import SnapshotResult
+
 KEY_DELIMITER = "#"
 IP_RESERVATION = "ip_reservation"
+PENDING_RESERVATION = "pending_reservation"
+DEFAULT_WORKERS = 8
+ARCHIVE_SUFFIX = ".archive"
+ARCHIVE_INTERVAL = 24 * 60 * 60  # Seconds between automatic compactions
 
 
 class CurrentMetadata(NamedTuple):
@@ -22,70 +68,1136 @@ class CurrentMetadata(NamedTuple):
     error: int
 
 
+class BulkResult(NamedTuple):
+    """Outcome of a bulk operation with per-row errors."""
+
+    metadata: Dict[str, Any]
+    errors: List[Tuple[int, str]]
+    error: int
+
+
+class StoreStats(NamedTuple):
+    rows: int
+    inactive_rows: int
+    size_bytes: int
+    lock_wait_seconds: float
+    # Local pool -> (allocated addresses, total addresses)
+    pools: Dict[str, Tuple[int, int]]
+
+
+class CompactResult(NamedTuple):
+    archived: int
+    bytes_before: int
+    bytes_after: int
+    load_ms_before: float
+    load_ms_after: float
+    error: int
+
+
+class RecoveryResult(NamedTuple):
+    """Outcome of resolving interrupted reservations."""
+
+    recovered: Dict[str, Any]
+    dropped: List[str]
+    errors: List[str]
+    error: int
+
+
+def __getattr__(name: str) -> Any:
+    # The user name is looked up on first use, which can be slow with
+    # directory services, rather than on every import.
+    if name == "CURRENT_USER":
+        globals()[name] = pwd.getpwuid(os.getuid())[0]
+        return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def _current_user() -> str:
+    return globals().get("CURRENT_USER") or __getattr__("CURRENT_USER")
+
+
+def _client_token(pending_key: str, started: str) -> str:
+    """Derive the AWS idempotency token of a journalled reservation."""
+    import hashlib
+
+    return hashlib.sha256(f"{pending_key}@{started}".encode()).hexdigest()
+
+
+def _validate_row(row: Any) -> str:
+    """Return why an import row is invalid, or an empty string."""
+    if not isinstance(row, dict):
+        return "row is not a JSON object"
+    for field in ("Title", "Value"):
+        if not isinstance(row.get(field), str) or not row[field]:
+            return f'"{field}" must be a non-empty string'
+    for field in ("Comment", "AssignedBy", "AssignedDateUTC"):
+        if row.get(field) is not None and not isinstance(row[field], str):
+            return f'"{field}" must be a string'
+    if row.get("inactive") not in (None, "", True, False, "True", "False"):
+        return '"inactive" must be true or false'
+    return ""
+
+
+def _swap_cidr(
+    allocator: CidrAllocator, release: Any, reserve: Any
+) -> None:
+    """Release one block of ``allocator`` and reserve another, if given.
+
+    Values that are not blocks of the pool are skipped, as they are when
+    the allocator is built.
+    """
+    changes = ((allocator.release, release), (allocator.reserve, reserve))
+    for change, cidr in changes:
+        if cidr is None:
+            continue
+        try:
+            change(cidr)
+        except (AllocationError, ValueError, TypeError):
+            pass
+
+
+def get_archive_path(db_path: Path) -> Path:
+    """Return the path of the archive of inactive metadata."""
+    return db_path.with_name(db_path.name + ARCHIVE_SUFFIX)
+
+
 class Metadata:
     """An object representing a piece of information."""
 
-    def __init__(self, db_path: Path) -> None:
-        self._db_handler = DatabaseHandler(db_path)
+    def __init__(
+        self,
+        db_path: Path,
+        backend: str = JSON_BACKEND,
+        lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+        local_pool: str = None,
+        aws_options: Dict[str, Any] = None,
+        pool_name: str = None,
+        discovery_cache: DiscoveryCache = None,
+        resident: bool = False,
+        archive_after: datetime.timedelta = None,
+    ) -> None:
+        self._db_path = db_path
+        self._backend = backend
+        self._db_handler = open_database(
+            db_path, backend, lock_timeout, resident
+        )
+        self._archive_path = get_archive_path(db_path)
+        self._archive = DatabaseHandler(self._archive_path)
+        self._archive_after = archive_after
+        self._local_pool = local_pool
+        self._aws_options = aws_options or {}
+        self._pool_name = pool_name
+        self._discovery_cache = discovery_cache
+        # An asyncio.Lock per event loop, as each is bound to the first
+        # loop that waits on it.
+        self._commit_locks = weakref.WeakKeyDictionary()
+        self._allocator = None
+        self._allocator_stamp = None  # Of the files the allocator matches
+        self.cidr_conflicts: List[str] = []
+        self._index = None
+        if backend != SQLITE_BACKEND:  # Indexed by the database itself
+            self._index = MetadataIndex(db_path, self._db_handler.files)
+        self._index_checked = False
+
+    @property
+    def db_path(self) -> Path:
+        return self._db_path
+
+    @property
+    def backend(self) -> str:
+        return self._backend
 
-    def get_metadata(self) -> Dict[str, Any]:
-        """Return the current metadata dict."""
+    @profiling.traced
+    def get_metadata(self, metadata_title: str = None) -> Dict[str, Any]:
+        """Return the current metadata dict, or a single entry of it."""
+        if metadata_title is not None:
+            read = self._db_handler.get_record(metadata_title)
+            return {metadata_title: read.metadata} if not read.error else {}
         read = self._db_handler.read_metadata()
         return read.metadata
 
+    def iter_metadata(
+        self,
+        prefix: str = None,
+        active_only: bool = False,
+        assigned_by: str = None,
+        since: datetime.datetime = None,
+        limit: int = None,
+        offset: int = 0,
+        include_archived: bool = False,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield matching ``(title, record)`` pairs without building a dict.
+
+        With ``include_archived`` the archived records follow the others.
+        """
+        where = MetadataFilter(
+            prefix,
+            active_only,
+            assigned_by,
+            since.isoformat() if since is not None else None,
+        )
+        if where == MetadataFilter():
+            where = None
+        metadata = self._db_handler.iter_metadata(where)
+        if include_archived and not active_only:
+            metadata = itertools.chain(metadata, self._iter_archive(where))
+        stop = offset + limit if limit is not None else None
+        return itertools.islice(metadata, offset, stop)
+
+    @contextmanager
+    def _indexed(
+        self, titles: Iterable[str]
+    ) -> Iterator[Optional[Callable[..., int]]]:
+        """Hold the locks a write of ``titles`` takes and yield an update.
+
+        The lock is the database lock, or with the sharded backend the
+        locks of the shards holding ``titles``, so that writers of other
+        shards are not held up. The yielded function applies the write to
+        the index, as ``MetadataIndex.update``, and marks the files it
+        changed as matching again. It is None if there is no index to
+        keep up to date: none was built yet, or the records of these
+        files are stale and will be rebuilt on its next use. A local
+        allocator matching these files before the write is taken to match
+        them after, as callers update it themselves.
+        """
+        index = self._index
+        if index is not None and not index.exists():
+            index = None
+        if index is None and self._allocator is None:
+            yield None
+            return
+        stack = ExitStack()
+        try:
+            paths = stack.enter_context(self._db_handler.write_lock(titles))
+        except DatabaseError:
+            yield None  # The write fails to take the lock as well
+            return
+        with stack:
+            current = self._allocator is not None and all(
+                self._allocator_stamp.get(path) == stamp
+                for path, stamp in source_stamps(paths).items()
+            )
+            if index is not None and index.is_fresh(paths):
+                yield functools.partial(index.update, paths=paths)
+            else:
+                yield None
+            if current:
+                self._allocator_stamp = {
+                    **self._allocator_stamp,
+                    **source_stamps(paths),
+                }
+
+    def _stamp(self) -> Dict[str, str]:
+        return source_stamps(self._db_handler.files())
+
+    def _refresh_index(self) -> int:
+        """Build the index, or rebuild it if the database changed."""
+        if self._index is None:
+            if not self._index_checked:  # Databases older than its index
+                error = self._db_handler.create()
+                if error:
+                    return error
+                self._index_checked = True
+            return SUCCESS
+        try:
+            with self._db_handler.write_lock():  # Every writer waits
+                if self._index.is_fresh():
+                    return SUCCESS
+                return self._index.rebuild(self._db_handler.iter_metadata())
+        except DatabaseError as exc:
+            return exc.error
+
+    @profiling.traced
+    def find(
+        self,
+        value: str = None,
+        assigned_by: str = None,
+        prefix: str = None,
+        inactive: bool = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield the ``(title, record)`` pairs matching every criterion.
+
+        ``prefix`` is the part of the title before ``KEY_DELIMITER``, like
+        ``ip_reservation``, and ``inactive`` selects inactive or active
+        records if not None. Lookups use indexes on these fields: the
+        SQLite backend's own, or an index file kept next to the database
+        by the other backends, built on first use.
+        """
+        error = self._refresh_index()
+        if error:
+            raise DatabaseError(error)
+        where = MetadataFilter(
+            prefix=prefix + KEY_DELIMITER if prefix is not None else None,
+            active_only=inactive is False,
+            assigned_by=assigned_by,
+            value=value,
+            inactive_only=inactive is True,
+        )
+        if self._index is None:
+            return self._db_handler.iter_metadata(where)
+        return self._index.iter_metadata(where)
+
+    @profiling.traced
+    def lookup(self, value: str) -> List[str]:
+        """Return the titles of the records holding ``value``."""
+        return [title for title, _ in self.find(value=value)]
+
+    def stats(self) -> StoreStats:
+        """Return the size of the store and the use of the local pool.
+
+        Nothing is locked for writing, so that scrapes do not hold up
+        writers: rows are counted by the database handler, and pool use
+        is read from the local allocator, or from a copy built from the
+        active reservations if it is not up to date. Raises DatabaseError
+        if the database cannot be read.
+        """
+        rows, inactive_rows = self._db_handler.count_rows()
+        pools = {}
+        if self._local_pool is not None:
+            allocator = self._allocator
+            if allocator is None or self._stamp() != self._allocator_stamp:
+                allocator, _ = CidrAllocator.from_metadata(
+                    self._local_pool,
+                    self.iter_metadata(
+                        prefix=IP_RESERVATION + KEY_DELIMITER,
+                        active_only=True,
+                    ),
+                )
+            pools[self._local_pool] = (
+                allocator.allocated_addresses(),
+                allocator.network.num_addresses,
+            )
+        return StoreStats(
+            rows,
+            inactive_rows,
+            self._store_size(),
+            self._db_handler.lock.wait_time,
+            pools,
+        )
+
+    def metrics(self) -> str:
+        """Return the store metrics in the Prometheus text format."""
+        return metrics.render(self.stats())
+
+    def _store_size(self) -> int:
+        """Return the size in bytes of the database files."""
+        size = 0
+        for path in self._db_handler.files():
+            try:
+                size += path.stat().st_size
+            except FileNotFoundError:
+                pass
+        return size
+
+    def _load_ms(self) -> float:
+        """Time a full load of the database by a new handler."""
+        db_handler = open_database(self._db_path, self._backend)
+        start = time.perf_counter()
+        try:
+            db_handler.read_metadata()
+            return (time.perf_counter() - start) * 1000
+        finally:
+            db_handler.close()
+
+    def _iter_archive(
+        self, where: Optional[MetadataFilter]
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        if self._archive_path.exists():
+            yield from self._archive.iter_metadata(where)
+
+    def _archive_inactive(self, older_than: datetime.timedelta) -> DBResponse:
+        """Move inactive records assigned before ``older_than`` ago.
+
+        Records without an assignment date count as the oldest. Returns
+        the archived records.
+        """
+        cutoff = (datetime.datetime.utcnow() - older_than).isoformat()
+        if not self._db_handler.lock.acquire():
+            return DBResponse({}, DB_LOCK_ERROR)
+        try:
+            expired = {
+                title: record
+                for title, record in self._db_handler.iter_metadata(
+                    MetadataFilter(inactive_only=True)
+                )
+                if (record.get("AssignedDateUTC") or "") < cutoff
+            }
+            if not expired:
+                self._archive_path.touch()  # Marks the last run
+                return DBResponse({}, SUCCESS)
+            archived = {}
+            if self._archive_path.exists():
+                read = self._archive.read_metadata()
+                if read.error:
+                    return DBResponse({}, read.error)
+                archived = read.metadata
+            # Archive first: a failure in between leaves a duplicate, not
+            # a lost record.
+            error = self._archive.write_metadata({**archived, **expired}).error
+            error = error or self._put_records({}, expired).error
+            return DBResponse(expired, error or self._db_handler.compact())
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+        except OSError:
+            return DBResponse({}, DB_WRITE_ERROR)
+        finally:
+            self._db_handler.lock.release()
+
+    def _archive_if_due(self) -> None:
+        """Run the automatic compaction at most every ARCHIVE_INTERVAL."""
+        try:
+            last_run = self._archive_path.stat().st_mtime
+        except FileNotFoundError:
+            last_run = 0.0
+        if time.time() - last_run >= ARCHIVE_INTERVAL:
+            self._archive_inactive(self._archive_after)  # Retried if failed
+
+    @profiling.traced
+    def compact(self, older_than: datetime.timedelta) -> CompactResult:
+        """Archive inactive records assigned before ``older_than`` ago.
+
+        Reports the space and full-load time saved. Archived records are
+        only read by ``iter_metadata`` with ``include_archived``.
+        """
+        bytes_before, load_ms_before = self._store_size(), self._load_ms()
+        archive = self._archive_inactive(older_than)
+        if archive.error or not archive.metadata:
+            return CompactResult(
+                len(archive.metadata),
+                bytes_before,
+                bytes_before,
+                load_ms_before,
+                load_ms_before,
+                archive.error,
+            )
+        return CompactResult(
+            len(archive.metadata),
+            bytes_before,
+            self._store_size(),
+            load_ms_before,
+            self._load_ms(),
+            SUCCESS,
+        )
+
+    def _get_allocator(self) -> CidrAllocator:
+        """Build the local allocator from active reservations.
+
+        It is built on first use and rebuilt once another process has
+        changed the database. Callers hold the database lock. Rows whose
+        CIDR overlaps another row are listed in ``cidr_conflicts``.
+        """
+        stamp = self._stamp()
+        if self._allocator is None or stamp != self._allocator_stamp:
+            self._allocator, self.cidr_conflicts = CidrAllocator.from_metadata(
+                self._local_pool,
+                self.iter_metadata(
+                    prefix=IP_RESERVATION + KEY_DELIMITER, active_only=True
+                ),
+            )
+            self._allocator_stamp = stamp
+        return self._allocator
+
+    def _release_cidr(self, metadata_title: str, cidr: Any) -> None:
+        """Return a reservation's CIDR to a loaded local allocator."""
+        if metadata_title.startswith(IP_RESERVATION + KEY_DELIMITER):
+            self._release_cidr_value(cidr)
+
+    def _release_cidr_value(self, cidr: Any) -> None:
+        if self._allocator is None or cidr is None:
+            return
+        if not self._db_handler.lock.acquire():
+            return  # Rebuilt from the database by the next process
+        try:
+            self._allocator.release(cidr)
+        except (AllocationError, ValueError, TypeError):
+            pass  # Inactive already, or never part of the local pool
+        finally:
+            self._db_handler.lock.release()
+
+    @profiling.traced
     def add(
         self, metadata_title: str, metadata_value: str, comment: str
     ) -> CurrentMetadata:
-        """Add a new metadata to the database."""
+        """Add a new metadata to the database.
+
+        With a local pool configured, a reservation's CIDR is claimed in
+        the local allocator, and the CIDR it replaces is given back.
+        """
+        if self._local_pool is None or not metadata_title.startswith(
+            IP_RESERVATION + KEY_DELIMITER
+        ):
+            return self._add(metadata_title, metadata_value, comment)
+        if not self._db_handler.lock.acquire():
+            return CurrentMetadata({}, DB_LOCK_ERROR)
+        try:
+            allocator = self._get_allocator()
+            read = self._db_handler.get_record(metadata_title)
+            replaced = None
+            if not read.error and not read.metadata.get("inactive"):
+                replaced = read.metadata.get("Value")
+                _swap_cidr(allocator, replaced, None)
+            try:
+                allocator.reserve(metadata_value)
+            except (AllocationError, ValueError):
+                _swap_cidr(allocator, None, replaced)
+                return CurrentMetadata({}, CIDR_ERROR)
+            result = self._add(metadata_title, metadata_value, comment)
+            if result.error:
+                _swap_cidr(allocator, metadata_value, replaced)
+            return result
+        finally:
+            self._db_handler.lock.release()
+
+    def _add(
+        self, metadata_title: str, metadata_value: str, comment: str
+    ) -> CurrentMetadata:
         metadata = {
             "Value": metadata_value,
             "Comment": comment,
-            "AssignedBy": CURRENT_USER,
+            "AssignedBy": _current_user(),
             "AssignedDateUTC": datetime.datetime.utcnow().isoformat(),
             "inactive": False,
         }
-        read = self._db_handler.read_metadata()
-        if read.error == DB_READ_ERROR:
-            return CurrentMetadata(metadata, read.error)
-        read.metadata[metadata_title] = metadata
-        write = self._db_handler.write_metadata(read.metadata)
-        return CurrentMetadata({metadata_title: metadata}, write.error)
+        with self._indexed([metadata_title]) as update_index:
+            write = self._db_handler.put_record(metadata_title, metadata)
+            if update_index is not None and not write.error:
+                update_index({metadata_title: metadata})
+        return CurrentMetadata(write.metadata, write.error)
+
+    @profiling.traced
+    def bulk_add(
+        self, rows: Iterable[Dict[str, Any]], strict: bool = False
+    ) -> BulkResult:
+        """Validate import rows and add the valid ones in a single write.
+
+        Rows carry ``Title``, ``Value`` and optionally ``Comment``,
+        ``AssignedBy``, ``AssignedDateUTC`` and ``inactive``, as written by
+        ``formats.write_rows``. Errors are reported by 1-based row number.
+        With ``strict`` nothing is written if any row is invalid.
+
+        With a local pool configured, the CIDRs of imported reservations
+        are claimed in the local allocator as ``add`` claims them. Rows
+        overlapping another reservation are reported and skipped, or fail
+        the whole import with CIDR_ERROR if ``strict`` is set.
+        """
+        assigned_date = datetime.datetime.utcnow().isoformat()
+        metadata, errors, row_numbers = {}, [], {}
+        for row_number, row in enumerate(rows, start=1):
+            reason = _validate_row(row)
+            if reason:
+                errors.append((row_number, reason))
+                continue
+            row_numbers[row["Title"]] = row_number
+            metadata[row["Title"]] = {
+                "Value": row["Value"],
+                "Comment": row.get("Comment") or "",
+                "AssignedBy": row.get("AssignedBy") or _current_user(),
+                "AssignedDateUTC": row.get("AssignedDateUTC") or assigned_date,
+                "inactive": row.get("inactive") in (True, "True"),
+            }
+        if errors and strict:
+            return BulkResult({}, errors, VALIDATION_ERROR)
+        if self._local_pool is None:
+            if not metadata:
+                return BulkResult({}, errors, SUCCESS)
+            write = self._put_records(metadata)
+            return BulkResult(write.metadata, errors, write.error)
+        if not self._db_handler.lock.acquire():
+            return BulkResult({}, errors, DB_LOCK_ERROR)
+        try:
+            allocator = self._get_allocator()
+            undo, conflicts = self._reserve_rows(allocator, metadata)
+            if conflicts:
+                errors = sorted(
+                    errors
+                    + [
+                        (row_numbers[title], reason)
+                        for title, reason in conflicts.items()
+                    ]
+                )
+                if strict:
+                    undo()
+                    return BulkResult({}, errors, CIDR_ERROR)
+                for title in conflicts:
+                    del metadata[title]
+            if not metadata:
+                return BulkResult({}, errors, SUCCESS)
+            write = self._put_records(metadata)
+            if write.error:
+                undo()
+            return BulkResult(write.metadata, errors, write.error)
+        finally:
+            self._db_handler.lock.release()
 
+    def _reserve_rows(
+        self, allocator: CidrAllocator, metadata: Dict[str, Any]
+    ) -> Tuple[Callable[[], None], Dict[str, str]]:
+        """Claim the CIDRs of the active reservations among ``metadata``.
+
+        Rows are taken in order as ``add`` would take them: each gives
+        back the CIDR of the reservation it replaces, and keeps it if its
+        own CIDR cannot be reserved. Callers hold the database lock.
+        Returns a function undoing the changes and the reasons of the
+        rows that could not be reserved by title.
+        """
+        titles = {
+            title
+            for title, record in metadata.items()
+            if title.startswith(IP_RESERVATION + KEY_DELIMITER)
+            and not record["inactive"]
+        }
+        if not titles:
+            return lambda: None, {}
+        replaced = {
+            title: record.get("Value")
+            for title, record in self.iter_metadata(
+                prefix=IP_RESERVATION + KEY_DELIMITER, active_only=True
+            )
+            if title in titles
+        }
+        swaps, conflicts = [], {}
+        for title in metadata:
+            if title not in titles:
+                continue
+            cidr = metadata[title]["Value"]
+            _swap_cidr(allocator, replaced.get(title), None)
+            try:
+                allocator.reserve(cidr)
+            except (AllocationError, ValueError) as exc:
+                _swap_cidr(allocator, None, replaced.get(title))
+                conflicts[title] = str(exc)
+                continue
+            swaps.append((cidr, replaced.get(title)))
+
+        def undo() -> None:
+            for cidr, replaced_cidr in reversed(swaps):
+                _swap_cidr(allocator, cidr, replaced_cidr)
+
+        return undo, conflicts
+
+    def _put_records(
+        self, records: Dict[str, Any], delete: Iterable[str] = ()
+    ) -> DBResponse:
+        """Write records to the database and its index."""
+        delete = list(delete)
+        with self._indexed([*records, *delete]) as update_index:
+            write = self._db_handler.put_records(records, delete)
+            if update_index is not None and not write.error:
+                update_index(records, delete)
+        return write
+
+    def _find_reservations(
+        self, hosts: Iterable[str]
+    ) -> Tuple[Dict[str, Any], int]:
+        """Return the active reservations of ``hosts`` by title."""
+        titles = {KEY_DELIMITER.join([IP_RESERVATION, host]) for host in hosts}
+        if not titles:
+            return {}, SUCCESS
+        try:
+            return {
+                title: record
+                for title, record in self.iter_metadata(
+                    prefix=os.path.commonprefix(sorted(titles)),
+                    active_only=True,
+                )
+                if title in titles
+            }, SUCCESS
+        except DatabaseError as exc:
+            return {}, exc.error
+
+    def _begin_reservations(
+        self, requests: Dict[str, str]
+    ) -> Tuple[Dict[str, str], int]:
+        """Journal the reservations about to be made in AWS IPAM.
+
+        ``requests`` maps each host to the CIDR picked from the local pool,
+        or to the prefix length, like ``/24``, if AWS picks the CIDR. Each
+        host gets a ``pending_reservation#<host>`` entry holding the client
+        token of its request. An entry left by an interrupted run for the
+        same request is reused, so that the retry returns the allocation
+        made the first time. Returns the client tokens by host.
+        """
+        titles = {
+            KEY_DELIMITER.join([PENDING_RESERVATION, host]): host
+            for host in requests
+        }
+        try:
+            journal = {
+                titles[title]: record
+                for title, record in self.iter_metadata(
+                    prefix=os.path.commonprefix(sorted(titles))
+                )
+                if title in titles
+            }
+        except DatabaseError as exc:
+            return {}, exc.error
+        started = datetime.datetime.utcnow().isoformat()
+        tokens, pending = {}, {}
+        for title, host in titles.items():
+            record = journal.get(host)
+            if record is None or record["Value"] != requests[host]:
+                record = {
+                    "Value": requests[host],
+                    "Comment": _client_token(title, started),
+                    "AssignedBy": _current_user(),
+                    "AssignedDateUTC": started,
+                    "inactive": False,
+                }
+                pending[title] = record
+            tokens[host] = record["Comment"]
+        if pending:
+            write = self._put_records(pending)
+            if write.error:
+                return {}, write.error
+        return tokens, SUCCESS
+
+    def _confirm_reservations(
+        self, cidrs: Dict[str, str], abandoned: Iterable[str] = ()
+    ) -> DBResponse:
+        """Store the reservations of ``cidrs`` by host.
+
+        Their journal entries, and those of the ``abandoned`` hosts, are
+        deleted in the same write.
+        """
+        assigned_date = datetime.datetime.utcnow().isoformat()
+        metadata = {
+            KEY_DELIMITER.join([IP_RESERVATION, host]): {
+                "Value": cidr,
+                "Comment": "auto-reserved IP",
+                "AssignedBy": _current_user(),
+                "AssignedDateUTC": assigned_date,
+                "inactive": False,
+            }
+            for host, cidr in cidrs.items()
+        }
+        return self._put_records(
+            metadata,
+            delete=[
+                KEY_DELIMITER.join([PENDING_RESERVATION, host])
+                for host in itertools.chain(cidrs, abandoned)
+            ],
+        )
+
+    @profiling.traced
     def reserve_ipv4_network(
         self,
         host: str,
         mask_bits: int = 24,
         region_name=None,
         dry_run: bool = True,
+        sync: bool = True,
+        refresh: bool = False,
+    ) -> CurrentMetadata:
+        """Create an IP network reservation and store it in the database.
+
+        With a local pool configured the CIDR is picked locally and, if
+        ``sync`` is set, claimed in AWS IPAM as well. Otherwise AWS IPAM
+        picks the next free CIDR. A host with an active reservation gets
+        that reservation back without any AWS call.
+        """
+        existing, error = self._find_reservations([host])
+        if error or existing:
+            return CurrentMetadata(existing, error)
+        if self._local_pool is None:
+            tokens, error = self._begin_reservations({host: f"/{mask_bits}"})
+            if error:
+                return CurrentMetadata({}, error)
+            pool = Pool(
+                dry_run=dry_run, region_name=region_name, **self._aws_options
+            ).from_existing(
+                self._pool_name, self._discovery_cache, refresh
+            )
+            pool.allocate_cidr(mask_bits, host, client_token=tokens[host])
+            return CurrentMetadata(
+                *self._confirm_reservations({host: pool.Cidr})
+            )
+        if not self._db_handler.lock.acquire():
+            return CurrentMetadata({}, DB_LOCK_ERROR)
+        try:
+            allocator = self._get_allocator()
+            try:
+                cidr = allocator.allocate(mask_bits)
+            except AllocationError:
+                return CurrentMetadata({}, CIDR_ERROR)
+            try:
+                if sync:
+                    tokens, error = self._begin_reservations({host: cidr})
+                    if error:
+                        allocator.release(cidr)
+                        return CurrentMetadata({}, error)
+                    pool = Pool(
+                        dry_run=dry_run,
+                        region_name=region_name,
+                        **self._aws_options,
+                    ).from_existing(
+                        self._pool_name, self._discovery_cache, refresh
+                    )
+                    pool.allocate_cidr(
+                        mask_bits, host, cidr=cidr, client_token=tokens[host]
+                    )
+                result = CurrentMetadata(
+                    *self._confirm_reservations({host: cidr})
+                )
+            except BaseException:
+                allocator.release(cidr)
+                raise
+            if result.error:
+                allocator.release(cidr)
+            return result
+        finally:
+            self._db_handler.lock.release()
+
+    def _allocate_local(self, mask_bits: int) -> Tuple[Optional[str], int]:
+        """Allocate a CIDR from the local pool under the database lock."""
+        if not self._db_handler.lock.acquire():
+            return None, DB_LOCK_ERROR
+        try:
+            return self._get_allocator().allocate(mask_bits), SUCCESS
+        except AllocationError:
+            return None, CIDR_ERROR
+        finally:
+            self._db_handler.lock.release()
+
+    async def reserve_ipv4_network_async(
+        self,
+        host: str,
+        mask_bits: int = 24,
+        region_name=None,
+        dry_run: bool = True,
+        sync: bool = True,
+        executor: "Executor" = None,
+        refresh: bool = False,
     ) -> CurrentMetadata:
-        """Create an IP network reservation and store it in the database."""
-        pool = Pool(dry_run=dry_run, region_name=region_name).from_existing()
-        pool.allocate_cidr(mask_bits, host)
-        reservation_key = KEY_DELIMITER.join([IP_RESERVATION, host])
-        add_host_result = self.add(reservation_key, pool.Cidr, "auto-reserved IP")
-        return add_host_result
+        """Reserve an IP network without blocking the event loop.
+
+        AWS calls from concurrent reservations overlap, while database
+        commits from this instance run one at a time. Offline reservations
+        need no AWS call and run synchronously on the executor.
+        """
+        import asyncio
+
+        from metadata_management.aio import AsyncPool, run_in_executor
+
+        if self._local_pool is not None and not sync:
+            return await run_in_executor(
+                executor,
+                self.reserve_ipv4_network,
+                host,
+                mask_bits,
+                region_name,
+                dry_run,
+                sync=False,
+            )
+        existing, error = await run_in_executor(
+            executor, self._find_reservations, [host]
+        )
+        if error or existing:
+            return CurrentMetadata(existing, error)
+        commit_lock = self._commit_locks.setdefault(
+            asyncio.get_running_loop(), asyncio.Lock()
+        )
+        cidr = None
+        if self._local_pool is not None:
+            cidr, error = await run_in_executor(
+                executor, self._allocate_local, mask_bits
+            )
+            if error:
+                return CurrentMetadata({}, error)
+        try:
+            async with commit_lock:
+                tokens, error = await run_in_executor(
+                    executor,
+                    self._begin_reservations,
+                    {host: cidr or f"/{mask_bits}"},
+                )
+            if error:
+                self._release_cidr_value(cidr)
+                return CurrentMetadata({}, error)
+            pool = AsyncPool(
+                await run_in_executor(
+                    executor,
+                    Pool,
+                    dry_run=dry_run,
+                    region_name=region_name,
+                    **self._aws_options,
+                ),
+                executor,
+            )
+            await pool.from_existing(
+                self._pool_name, self._discovery_cache, refresh
+            )
+            cidr = await pool.allocate_cidr(
+                mask_bits, host, cidr=cidr, client_token=tokens[host]
+            )
+            async with commit_lock:
+                result = CurrentMetadata(
+                    *await run_in_executor(
+                        executor, self._confirm_reservations, {host: cidr}
+                    )
+                )
+        except BaseException:
+            self._release_cidr_value(cidr)
+            raise
+        if result.error:
+            self._release_cidr_value(cidr)
+        return result
+
+    @profiling.traced
+    def reserve_ipv4_networks(
+        self,
+        hosts: Iterable[str],
+        mask_bits: int = 24,
+        region_name=None,
+        dry_run: bool = True,
+        sync: bool = True,
+        workers: int = DEFAULT_WORKERS,
+        refresh: bool = False,
+    ) -> BulkResult:
+        """Reserve an IP network for each host and store them in one write.
+
+        The pool is looked up once and at most ``workers`` allocations run
+        at a time. Hosts with an active reservation get it back without
+        any AWS call. Hosts that fail are reported by their 1-based
+        position and the others are still stored.
+        """
+        pending: Dict[int, str] = {}
+        errors: List[Tuple[int, str]] = []
+        seen = set()
+        for position, host in enumerate(hosts, start=1):
+            if host in seen:
+                errors.append((position, f"{host}: duplicate host"))
+            else:
+                seen.add(host)
+                pending[position] = host
+        existing, error = self._find_reservations(pending.values())
+        if error:
+            return BulkResult({}, errors, error)
+        pending = {
+            position: host
+            for position, host in pending.items()
+            if KEY_DELIMITER.join([IP_RESERVATION, host]) not in existing
+        }
+        if not self._db_handler.lock.acquire():
+            return BulkResult(existing, errors, DB_LOCK_ERROR)
+        try:
+            cidrs: Dict[int, Any] = {}
+            if self._local_pool is not None:
+                allocator = self._get_allocator()
+                for position, host in pending.items():
+                    try:
+                        cidrs[position] = allocator.allocate(mask_bits)
+                    except AllocationError as exc:
+                        errors.append((position, f"{host}: {exc}"))
+            if pending and (self._local_pool is None or sync):
+                from concurrent.futures import ThreadPoolExecutor
+
+                requests = {
+                    position: host
+                    for position, host in pending.items()
+                    if self._local_pool is None or position in cidrs
+                }
+                tokens, error = self._begin_reservations(
+                    {
+                        host: cidrs.get(position) or f"/{mask_bits}"
+                        for position, host in requests.items()
+                    }
+                )
+                if error:
+                    for cidr in cidrs.values():
+                        self._release_cidr_value(cidr)
+                    return BulkResult(existing, sorted(errors), error)
+                aws_options = dict(self._aws_options)
+                aws_options["max_pool_connections"] = max(
+                    workers,
+                    aws_options.get(
+                        "max_pool_connections", DEFAULT_MAX_POOL_CONNECTIONS
+                    ),
+                )
+                pool = Pool(
+                    dry_run=dry_run, region_name=region_name, **aws_options
+                ).from_existing(
+                    self._pool_name, self._discovery_cache, refresh
+                )
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    futures = {
+                        position: executor.submit(
+                            pool.request_cidr,
+                            mask_bits,
+                            host,
+                            cidr=cidrs.get(position),
+                            client_token=tokens[host],
+                        )
+                        for position, host in requests.items()
+                    }
+                for position, future in futures.items():
+                    try:
+                        cidrs[position] = future.result()
+                    except Exception as exc:
+                        host = pending[position]
+                        errors.append((position, f"{host}: {exc}"))
+                        self._release_cidr_value(cidrs.pop(position, None))
+            errors.sort()
+            if not cidrs:
+                return BulkResult(existing, errors, SUCCESS)
+            write = self._confirm_reservations(
+                {pending[position]: cidr for position, cidr in cidrs.items()}
+            )
+            if write.error:
+                for cidr in cidrs.values():
+                    self._release_cidr_value(cidr)
+            return BulkResult(
+                {**existing, **write.metadata}, errors, write.error
+            )
+        finally:
+            self._db_handler.lock.release()
 
+    @profiling.traced
+    def recover(
+        self,
+        region_name=None,
+        dry_run: bool = False,
+        refresh: bool = False,
+    ) -> RecoveryResult:
+        """Resolve reservations interrupted before they were stored.
+
+        Each ``pending_reservation#<host>`` entry is matched against the
+        allocations of the IPAM pool described with its host. A single
+        match is stored as the host's reservation, and an entry without
+        any is dropped since AWS never allocated its CIDR. Entries with
+        several matches are left for a person to resolve. Run it while no
+        reservations are in progress; with ``dry_run`` nothing is written.
+        """
+        prefix = PENDING_RESERVATION + KEY_DELIMITER
+        try:
+            journal = {
+                title[len(prefix):]: record
+                for title, record in self.iter_metadata(prefix=prefix)
+            }
+        except DatabaseError as exc:
+            return RecoveryResult({}, [], [], exc.error)
+        if not journal:
+            return RecoveryResult({}, [], [], SUCCESS)
+        pool = Pool(
+            dry_run=False, region_name=region_name, **self._aws_options
+        ).from_existing(self._pool_name, self._discovery_cache, refresh)
+        allocations: Dict[str, List[str]] = {}
+        for allocation in pool.iter_allocations():
+            host = allocation.get("Description")
+            if host in journal:
+                allocations.setdefault(host, []).append(allocation["Cidr"])
+        cidrs, dropped, errors = {}, [], []
+        for host, record in sorted(journal.items()):
+            matches = allocations.get(host, [])
+            if not record["Value"].startswith("/"):
+                matches = [cidr for cidr in matches if cidr == record["Value"]]
+            if len(matches) == 1:
+                cidrs[host] = matches[0]
+            elif not matches:
+                dropped.append(host)
+            else:
+                errors.append(f"{host}: {len(matches)} allocations found")
+        if dry_run:
+            return RecoveryResult(
+                {
+                    KEY_DELIMITER.join([IP_RESERVATION, host]): cidr
+                    for host, cidr in cidrs.items()
+                },
+                dropped,
+                errors,
+                SUCCESS,
+            )
+        write = self._confirm_reservations(cidrs, abandoned=dropped)
+        self._allocator = None  # Rebuilt with the recovered CIDRs
+        return RecoveryResult(
+            {
+                title: record["Value"]
+                for title, record in write.metadata.items()
+            },
+            dropped,
+            errors,
+            write.error,
+        )
+
+    def reconcile(
+        self, region_name=None, repair: bool = False, refresh: bool = False
+    ) -> Iterator[Tuple[reconcile.Drift, str]]:
+        """Yield the drift between active reservations and the IPAM pool.
+
+        The pool's allocations are streamed page by page. With ``repair``
+        the pool is changed to match the database as each drift is found,
+        and the drift comes with the reason its repair failed; the reason
+        is empty otherwise. Raises ``DatabaseError`` if the database
+        cannot be read.
+        """
+        prefix = IP_RESERVATION + KEY_DELIMITER
+        reservations = {
+            title[len(prefix):]: record["Value"]
+            for title, record in self.iter_metadata(
+                prefix=prefix, active_only=True
+            )
+        }
+        prefix = PENDING_RESERVATION + KEY_DELIMITER
+        pending = {
+            title[len(prefix):] for title, _ in self.iter_metadata(prefix)
+        }
+        pool = Pool(
+            dry_run=False, region_name=region_name, **self._aws_options
+        ).from_existing(self._pool_name, self._discovery_cache, refresh)
+        for drift in reconcile.find_drift(
+            reservations, pool.iter_allocations(), pending
+        ):
+            error = ""
+            if repair:
+                try:
+                    reconcile.repair(pool, drift)
+                except Exception as exc:
+                    error = str(exc)
+            yield drift, error
+
+    @profiling.traced
+    def snapshot(
+        self,
+        destination: str,
+        incremental: bool = False,
+        compression: str = "gzip",
+    ) -> "SnapshotResult":
+        """Write a compressed snapshot to a directory or S3 prefix.
+
+        See ``snapshot.write_snapshot``.
+        """
+        from metadata_management.snapshot import write_snapshot
+
+        return write_snapshot(
+            self._db_handler,
+            self._db_path,
+            destination,
+            incremental,
+            compression,
+            **self._aws_options,
+        )
+
+    @profiling.traced
     def set_inactive(self, metadata_title: str) -> CurrentMetadata:
         """Set a metadata as inactive."""
-        read = self._db_handler.read_metadata()
-        if read.error:
-            return CurrentMetadata({}, read.error)
-        try:
-            metadata = read.metadata[metadata_title]
-        except IndexError:
-            return CurrentMetadata({}, ID_ERROR)
-        metadata["inactive"] = True
-        write = self._db_handler.write_metadata(read.metadata)
-        return CurrentMetadata(metadata, write.error)
+        with self._indexed([metadata_title]) as update_index:
+            update = self._db_handler.update_record(
+                metadata_title, {"inactive": True}
+            )
+            if update_index is not None and not update.error:
+                update_index({metadata_title: update.metadata})
+        if not update.error:
+            self._release_cidr(metadata_title, update.metadata.get("Value"))
+            if self._archive_after is not None:
+                self._archive_if_due()
+        return CurrentMetadata(update.metadata, update.error)
 
+    @profiling.traced
     def remove(self, metadata_title: str) -> CurrentMetadata:
-        """Remove a metadata from the database using its id or index."""
-        read = self._db_handler.read_metadata()
-        if read.error:
-            return CurrentMetadata({}, read.error)
-        try:
-            metadata = read.metadata.pop(metadata_title)
-        except IndexError:
-            return CurrentMetadata({}, ID_ERROR)
-        write = self._db_handler.write_metadata(read.metadata)
-        return CurrentMetadata(metadata, write.error)
+        """Remove a metadata from the database using its title."""
+        with self._indexed([metadata_title]) as update_index:
+            delete = self._db_handler.delete_record(metadata_title)
+            if update_index is not None and not delete.error:
+                update_index({}, [metadata_title])
+        if not delete.error and not delete.metadata.get("inactive"):
+            self._release_cidr(metadata_title, delete.metadata.get("Value"))
+        return CurrentMetadata(delete.metadata, delete.error)
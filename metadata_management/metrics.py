@@ -0,0 +1,141 @@
+"""Export store metrics in the Prometheus text exposition format.
+
+Operation latencies are collected from the ``profiling.traced`` calls
+once ``collect`` is called, as the server does. The size of the store,
+its lock waits and the use of the local pool come from
+``Metadata.stats``.
+"""
+import bisect
+import threading
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+from metadata_management import profiling
+
+if TYPE_CHECKING:
+    from metadata_management.manager import StoreStats
+
+PREFIX = "metadata_management_"
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 10)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class Histogram:
+    """Counts of durations under each bucket bound, and their sum."""
+
+    __slots__ = ("buckets", "sum")
+
+    def __init__(self) -> None:
+        self.buckets = [0] * (len(BUCKETS) + 1)  # The last one is +Inf
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.buckets[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+
+
+class Operations:
+    """Latency histograms of the traced operations, by name."""
+
+    def __init__(self) -> None:
+        self._histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def lines(self) -> List[str]:
+        name = PREFIX + "operation_duration_seconds"
+        lines = [
+            f"# HELP {name} Duration of store operations.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for operation, histogram in sorted(self._histograms.items()):
+                label = f'operation="{_escape(operation)}"'
+                count = 0
+                for bound, observed in zip(
+                    (*BUCKETS, "+Inf"), histogram.buckets
+                ):
+                    count += observed
+                    lines.append(
+                        f'{name}_bucket{{{label},le="{bound}"}} {count}'
+                    )
+                lines.append(f"{name}_sum{{{label}}} {histogram.sum}")
+                lines.append(f"{name}_count{{{label}}} {count}")
+        return lines
+
+
+_operations: Optional[Operations] = None
+
+
+def collect() -> Operations:
+    """Start timing the traced operations of this process."""
+    global _operations
+    if _operations is None:
+        _operations = Operations()
+        profiling.add_observer(_operations.observe)
+    return _operations
+
+
+def stop() -> None:
+    """Stop timing operations and drop what was collected."""
+    global _operations
+    if _operations is not None:
+        profiling.remove_observer(_operations.observe)
+        _operations = None
+
+
+def _escape(value: str) -> str:
+    return (
+        value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    )
+
+
+def _metric(
+    lines: List[str], name: str, kind: str, description: str
+) -> str:
+    name = PREFIX + name
+    lines += [f"# HELP {name} {description}", f"# TYPE {name} {kind}"]
+    return name
+
+
+def render(stats: "StoreStats") -> str:
+    """Return ``stats`` and the collected latencies as exposition text."""
+    lines = _operations.lines() if _operations is not None else []
+    name = _metric(lines, "rows", "gauge", "Rows in the database.")
+    active = stats.rows - stats.inactive_rows
+    lines.append(f'{name}{{state="active"}} {active}')
+    lines.append(f'{name}{{state="inactive"}} {stats.inactive_rows}')
+    name = _metric(
+        lines, "database_bytes", "gauge", "Size of the database files."
+    )
+    lines.append(f"{name} {stats.size_bytes}")
+    name = _metric(
+        lines,
+        "lock_wait_seconds_total",
+        "counter",
+        "Time spent taking the database lock.",
+    )
+    lines.append(f"{name} {stats.lock_wait_seconds}")
+    if stats.pools:
+        name = _metric(
+            lines, "pool_addresses", "gauge", "Addresses in the local pool."
+        )
+        for pool, (allocated, total) in sorted(stats.pools.items()):
+            label = f'pool="{_escape(pool)}"'
+            lines.append(f'{name}{{{label},state="allocated"}} {allocated}')
+            lines.append(f'{name}{{{label},state="total"}} {total}')
+        name = _metric(
+            lines,
+            "pool_utilisation_ratio",
+            "gauge",
+            "Fraction of the local pool reserved.",
+        )
+        for pool, (allocated, total) in sorted(stats.pools.items()):
+            label = f'pool="{_escape(pool)}"'
+            lines.append(f"{name}{{{label}}} {allocated / total}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,216 @@
+"""Packed binary storage backend for the metadata database.
+
+A packed file holds a header, the records as one JSON object without
+whitespace, sorted by title, and a directory with the offsets of each
+title and record in that object::
+
+    header     magic, version, row count, offset of the directory
+    records    {"title":{...},...}
+    directory  (title offset, record offset) per row, in title order
+
+A full load decodes the records with a single ``json.loads``; a lookup
+binary-searches the memory-mapped directory and decodes one record.
+"""
+import json
+import mmap
+import struct
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from metadata_management import (
+    DB_LOCK_ERROR,
+    DB_READ_ERROR,
+    DB_WRITE_ERROR,
+    ID_ERROR,
+    JSON_ERROR,
+    SUCCESS,
+    profiling,
+)
+from metadata_management.database import (
+    DatabaseError,
+    DatabaseHandler,
+    DBResponse,
+    MetadataFilter,
+    atomic_write,
+)
+
+MAGIC = b"MDPK"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxQQ")  # magic, version, rows, directory
+ENTRY = struct.Struct("<QQ")
+
+
+class PackFormatError(ValueError):
+    """The file is not a packed database."""
+
+
+def pack(metadata: Dict[str, Any]) -> bytes:
+    """Return the packed file holding ``metadata``."""
+    parts, entries = [b"{"], []
+    offset = HEADER.size + 1
+    for position, title in enumerate(sorted(metadata)):
+        key = json.dumps(title).encode() + b":"
+        record = json.dumps(metadata[title], separators=(",", ":")).encode()
+        if position:
+            parts.append(b",")
+            offset += 1
+        entries.append(ENTRY.pack(offset, offset + len(key)))
+        parts += [key, record]
+        offset += len(key) + len(record)
+    parts.append(b"}")
+    header = HEADER.pack(MAGIC, VERSION, len(entries), offset + 1)
+    return b"".join([header, *parts, *entries])
+
+
+class PackedFile:
+    """Read-only view of a memory-mapped packed file."""
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as stream:
+            self._map = mmap.mmap(
+                stream.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        try:
+            magic, version, self.rows, self._directory = HEADER.unpack_from(
+                self._map
+            )
+        except struct.error:
+            self.close()
+            raise PackFormatError(path)
+        end = self._directory + self.rows * ENTRY.size
+        if magic != MAGIC or version != VERSION or end != len(self._map):
+            self.close()
+            raise PackFormatError(path)
+
+    def close(self) -> None:
+        self._map.close()
+
+    def __enter__(self) -> "PackedFile":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.close()
+
+    def _offsets(self, position: int) -> Tuple[int, int]:
+        return ENTRY.unpack_from(
+            self._map, self._directory + position * ENTRY.size
+        )
+
+    def _title(self, position: int) -> str:
+        title_offset, record_offset = self._offsets(position)
+        return json.loads(self._map[title_offset : record_offset - 1])
+
+    def _record(self, position: int) -> Dict[str, Any]:
+        _, start = self._offsets(position)
+        if position + 1 < self.rows:
+            end = self._offsets(position + 1)[0] - 1  # Before the comma
+        else:
+            end = self._directory - 1  # Before the closing brace
+        return json.loads(self._map[start:end])
+
+    def _bisect(self, title: str) -> int:
+        """Return the position of the first title not below ``title``."""
+        low, high = 0, self.rows
+        while low < high:
+            middle = (low + high) // 2
+            if self._title(middle) < title:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def load(self) -> Dict[str, Any]:
+        """Decode every record."""
+        return json.loads(self._map[HEADER.size : self._directory])
+
+    def get(self, title: str) -> Optional[Dict[str, Any]]:
+        """Decode the record of ``title``, or return None."""
+        position = self._bisect(title)
+        if position == self.rows or self._title(position) != title:
+            return None
+        return self._record(position)
+
+    def iter_prefix(
+        self, prefix: str
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield the rows whose title starts with ``prefix``, in order."""
+        for position in range(self._bisect(prefix), self.rows):
+            title = self._title(position)
+            if not title.startswith(prefix):
+                break
+            yield title, self._record(position)
+
+
+class PackedDatabaseHandler(DatabaseHandler):
+    """Store the database as a packed file, replaced on every write.
+
+    Writes cost as much as with the JSON backend, but the file is about a
+    fifth smaller and single records are read without decoding the rest.
+    """
+
+    def _open(self) -> PackedFile:
+        try:
+            return PackedFile(self._db_path)
+        except PackFormatError:
+            raise DatabaseError(JSON_ERROR)
+        except (OSError, ValueError):  # ValueError: mmap of an empty file
+            raise DatabaseError(DB_READ_ERROR)
+
+    @profiling.traced
+    def read_metadata(self) -> DBResponse:
+        try:
+            with self._open() as packed:
+                metadata = packed.load()
+                profiling.annotate(rows=len(metadata))
+                return DBResponse(metadata, SUCCESS)
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+        except ValueError:
+            return DBResponse({}, JSON_ERROR)
+
+    @profiling.traced
+    def write_metadata(self, metadata: Dict[str, Any]) -> DBResponse:
+        """Replace the database content with ``metadata``."""
+        if not self.lock.acquire():
+            return DBResponse(metadata, DB_LOCK_ERROR)
+        try:
+            data = pack(metadata)
+            atomic_write(self._db_path, data)
+            profiling.annotate(bytes_written=len(data), rows=len(metadata))
+            return DBResponse(metadata, SUCCESS)
+        except OSError:
+            return DBResponse(metadata, DB_WRITE_ERROR)
+        finally:
+            self.lock.release()
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(title, record)`` pairs in title order.
+
+        With a prefix only the records under it are decoded.
+        """
+        with self._open() as packed:
+            try:
+                if where is not None and where.prefix:
+                    rows = packed.iter_prefix(where.prefix)
+                else:
+                    rows = iter(packed.load().items())
+                for title, record in rows:
+                    if where is None or where.matches(title, record):
+                        yield title, record
+            except ValueError:
+                raise DatabaseError(JSON_ERROR)
+
+    def get_record(self, title: str) -> DBResponse:
+        """Return a single record."""
+        try:
+            with self._open() as packed:
+                record = packed.get(title)
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+        except ValueError:
+            return DBResponse({}, JSON_ERROR)
+        if record is None:
+            return DBResponse({}, ID_ERROR)
+        return DBResponse(record, SUCCESS)
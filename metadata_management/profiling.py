@@ -0,0 +1,213 @@
+"""Opt-in timing of the CLI, manager, storage and AWS layers.
+
+Spans are recorded only after ``enable``. Until then ``span`` returns a
+shared no-op context manager and ``traced`` functions check one flag
+before calling through, so instrumented code runs at full speed.
+Observers added with ``add_observer`` are told the duration of each
+``traced`` call, whether spans are recorded or not.
+"""
+import functools
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import IO, Any, Callable, Dict, List, Optional, TypeVar
+
+PROFILE_ENV = "METADATA_MANAGEMENT_PROFILE"
+TRACE_ENV = "METADATA_MANAGEMENT_TRACE"
+CPROFILE_ENV = "METADATA_MANAGEMENT_CPROFILE"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+enabled = False
+active = False  # Recording spans or observed
+_spans: List["Span"] = []
+_observers: List[Callable[[str, float], None]] = []
+_local = threading.local()
+
+
+def _stack() -> List["Span"]:
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    return stack
+
+
+class Span:
+    """A timed section of work, with counts such as bytes or rows."""
+
+    __slots__ = ("name", "start", "end", "thread", "counts")
+
+    def __init__(self, name: str, start: float = None) -> None:
+        self.name = name
+        self.start = start
+        self.end: Optional[float] = None
+        self.thread = threading.get_ident()
+        self.counts: Dict[str, int] = {}
+
+    def __enter__(self) -> "Span":
+        _stack().append(self)
+        if self.start is None:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.end = time.perf_counter()
+        stack = _stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        _spans.append(self)
+
+    def annotate(self, **counts: int) -> None:
+        for name, count in counts.items():
+            self.counts[name] = self.counts.get(name, 0) + count
+
+
+class _NullSpan:
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        pass
+
+    def annotate(self, **counts: int) -> None:
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def enable() -> None:
+    """Start recording spans, dropping any recorded before."""
+    global enabled, active
+    _spans.clear()
+    enabled = active = True
+
+
+def disable() -> None:
+    global enabled, active
+    enabled = False
+    active = bool(_observers)
+
+
+def add_observer(observer: Callable[[str, float], None]) -> None:
+    """Call ``observer(name, seconds)`` after each ``traced`` call."""
+    global active
+    _observers.append(observer)
+    active = True
+
+
+def remove_observer(observer: Callable[[str, float], None]) -> None:
+    global active
+    _observers.remove(observer)
+    active = enabled or bool(_observers)
+
+
+def span(name: str, start: float = None):
+    """Return a context manager timing ``name`` while profiling is on.
+
+    ``start``, a ``time.perf_counter`` value, backdates the span.
+    """
+    return Span(name, start) if enabled else NULL_SPAN
+
+
+def annotate(**counts: int) -> None:
+    """Add counts, like ``bytes_read=n``, to the innermost open span."""
+    if enabled:
+        stack = _stack()
+        if stack:
+            stack[-1].annotate(**counts)
+
+
+def traced(func: F) -> F:
+    """Time each call of ``func`` under its qualified name."""
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not active:
+            return func(*args, **kwargs)
+        call_span = Span(name) if enabled else NULL_SPAN
+        start = time.perf_counter()
+        try:
+            with call_span:
+                return func(*args, **kwargs)
+        finally:
+            seconds = time.perf_counter() - start
+            for observer in _observers:
+                observer(name, seconds)
+
+    return wrapper  # type: ignore[return-value]
+
+
+def _before_call(model: Any, context: Dict[str, Any], **kwargs) -> None:
+    if enabled:
+        name = f"{model.service_model.service_name}.{model.name}"
+        context["profiling_span"] = Span(name).__enter__()
+
+
+def _after_call(context: Dict[str, Any], **kwargs) -> None:
+    call_span = context.pop("profiling_span", None)
+    if call_span is not None:
+        call_span.__exit__(None, None, None)
+
+
+def instrument_client(client: Any) -> None:
+    """Time each API call made by a boto3 client."""
+    client.meta.events.register("before-call", _before_call)
+    client.meta.events.register("after-call", _after_call)
+
+
+def summary() -> List[Dict[str, Any]]:
+    """Return the recorded spans totalled by name, slowest first."""
+    totals: Dict[str, Dict[str, Any]] = defaultdict(
+        lambda: {"calls": 0, "ms": 0.0}
+    )
+    for recorded in _spans:
+        total = totals[recorded.name]
+        total["calls"] += 1
+        total["ms"] += (recorded.end - recorded.start) * 1000
+        for name, count in recorded.counts.items():
+            total[name] = total.get(name, 0) + count
+    return sorted(
+        ({"name": name, **total} for name, total in totals.items()),
+        key=lambda total: -total["ms"],
+    )
+
+
+def write_summary(stream: IO[str]) -> None:
+    """Write a table of the spans totalled by name."""
+    stream.write(f"{'span':<44} {'calls':>6} {'ms':>10}  counts\n")
+    for total in summary():
+        counts = " ".join(
+            f"{name}={value}"
+            for name, value in total.items()
+            if name not in ("name", "calls", "ms")
+        )
+        stream.write(
+            f"{total['name']:<44} {total['calls']:>6} "
+            f"{total['ms']:>10.3f}  {counts}\n"
+        )
+
+
+def write_trace(path: Path) -> None:
+    """Write the spans in the Chrome trace event format.
+
+    The file opens in Perfetto or ``chrome://tracing``.
+    """
+    pid = os.getpid()
+    events = [
+        {
+            "name": recorded.name,
+            "ph": "X",
+            "ts": round(recorded.start * 1e6, 3),
+            "dur": round((recorded.end - recorded.start) * 1e6, 3),
+            "pid": pid,
+            "tid": recorded.thread,
+            "args": recorded.counts,
+        }
+        for recorded in sorted(_spans, key=lambda item: item.start)
+    ]
+    path.write_text(json.dumps({"traceEvents": events}))
@@ -0,0 +1,92 @@
+"""Compare IP reservations with the allocations AWS IPAM holds."""
+from typing import (
+    Any,
+    Container,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Tuple,
+)
+
+MISSING = "missing"
+ORPHANED = "orphaned"
+MISMATCHED = "mismatched"
+CUSTOM_ALLOCATION = "custom"
+
+
+class Drift(NamedTuple):
+    """A difference between a reservation and the pool's allocations.
+
+    ``missing`` reservations have no allocation, ``orphaned`` allocations
+    have no reservation and ``mismatched`` hosts hold a different CIDR
+    in AWS than in the database.
+    """
+
+    kind: str
+    host: str
+    local_cidr: str = None
+    aws_cidr: str = None
+    allocation_id: str = None
+
+
+def find_drift(
+    reservations: Dict[str, str],
+    allocations: Iterable[Dict[str, Any]],
+    pending: Container[str] = (),
+) -> Iterator[Drift]:
+    """Yield the drift between ``reservations`` and ``allocations``.
+
+    ``reservations`` maps each host to its CIDR and is consumed. The
+    allocations, as returned by ``GetIpamPoolAllocations``, are matched to
+    hosts through their description in a single pass, so only the
+    reservations and the allocations of mismatched hosts are held in
+    memory. Allocations of VPCs and other resources are ignored, and so
+    are those of ``pending`` hosts, which are left to ``recover``.
+    """
+    matched = set()
+    conflicting: Dict[str, List[Tuple[str, str]]] = {}
+    for allocation in allocations:
+        if allocation.get("ResourceType", CUSTOM_ALLOCATION) != (
+            CUSTOM_ALLOCATION
+        ):
+            continue
+        host = allocation.get("Description") or ""
+        if host in pending:
+            continue
+        cidr = allocation.get("Cidr")
+        allocation_id = allocation.get("IpamPoolAllocationId")
+        if host not in reservations and host not in matched:
+            yield Drift(ORPHANED, host, None, cidr, allocation_id)
+        elif host in matched or reservations[host] != cidr:
+            conflicting.setdefault(host, []).append((cidr, allocation_id))
+        else:
+            matched.add(host)
+            del reservations[host]
+    for host, allocated in conflicting.items():
+        if host not in matched:
+            cidr, allocation_id = allocated.pop(0)
+            local_cidr = reservations.pop(host)
+            yield Drift(MISMATCHED, host, local_cidr, cidr, allocation_id)
+        for cidr, allocation_id in allocated:
+            yield Drift(ORPHANED, host, None, cidr, allocation_id)
+    for host, cidr in reservations.items():
+        yield Drift(MISSING, host, cidr)
+
+
+def repair(pool, drift: Drift) -> None:
+    """Make the pool's allocations match the database for one drift.
+
+    Missing CIDRs are claimed and orphaned allocations released. The
+    allocation of a mismatched host is released and its CIDR from the
+    database claimed instead.
+    """
+    if drift.kind != MISSING:
+        pool.release_allocation(drift.allocation_id, drift.aws_cidr)
+    if drift.kind != ORPHANED:
+        pool.request_cidr(
+            int(drift.local_cidr.split("/")[1]),
+            drift.host,
+            cidr=drift.local_cidr,
+        )
@@ -0,0 +1,116 @@
+"""Compact in-memory representation of metadata rows."""
+import datetime
+import sys
+from typing import Any, Dict, Optional, Union
+
+EPOCH = datetime.datetime(1970, 1, 1)
+DATE_FIELD = "AssignedDateUTC"
+FIELDS = ("Value", "Comment", "AssignedBy", DATE_FIELD, "inactive")
+MISSING: Any = object()  # A field absent from the row, not written back
+
+
+def _intern(text: Optional[str]) -> Optional[str]:
+    return sys.intern(text) if isinstance(text, str) else text
+
+
+def to_epoch(assigned_date: Any) -> Any:
+    """Return an ISO date as integer microseconds since the epoch.
+
+    Values that would not format back to the same string, such as dates
+    with a UTC offset, are returned unchanged.
+    """
+    if not isinstance(assigned_date, str):
+        return assigned_date
+    try:
+        moment = datetime.datetime.fromisoformat(assigned_date)
+    except ValueError:
+        return assigned_date
+    if moment.tzinfo is not None or moment.isoformat() != assigned_date:
+        return assigned_date
+    return (moment - EPOCH) // datetime.timedelta(microseconds=1)
+
+
+def from_epoch(assigned_date: Any) -> Any:
+    """Return the ISO string for a value produced by ``to_epoch``."""
+    if not isinstance(assigned_date, int):
+        return assigned_date
+    return (EPOCH + datetime.timedelta(microseconds=assigned_date)).isoformat()
+
+
+class MetadataRecord:
+    """A metadata row without a per-row dict.
+
+    ``AssignedBy`` and ``Comment`` are interned since most rows share a few
+    values, and the assignment date is kept as an integer. Fields outside
+    the usual five are kept in ``extra``, as are dates given as integers,
+    which ``from_epoch`` would otherwise format. Absent fields stay absent
+    and other values are kept as given, so rows convert back unchanged.
+    """
+
+    __slots__ = (
+        "value",
+        "comment",
+        "assigned_by",
+        "assigned_date",
+        "inactive",
+        "extra",
+    )
+
+    def __init__(
+        self,
+        value: Optional[str] = MISSING,
+        comment: Optional[str] = MISSING,
+        assigned_by: Optional[str] = MISSING,
+        assigned_date: Union[int, str, None] = MISSING,
+        inactive: Any = MISSING,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        self.value = value
+        self.comment = _intern(comment)
+        self.assigned_by = _intern(assigned_by)
+        if isinstance(assigned_date, int):
+            extra = {**(extra or {}), DATE_FIELD: assigned_date}
+            assigned_date = MISSING
+        self.assigned_date = to_epoch(assigned_date)
+        self.inactive = inactive
+        self.extra = extra or None
+
+    @classmethod
+    def from_dict(cls, record: Dict[str, Any]) -> "MetadataRecord":
+        extra = {k: v for k, v in record.items() if k not in FIELDS}
+        return cls(*(record.get(field, MISSING) for field in FIELDS), extra)
+
+    def to_dict(self) -> Dict[str, Any]:
+        assigned_date = from_epoch(self.assigned_date)
+        if assigned_date is MISSING and self.extra:
+            # Keep an integer date in its place among the fields.
+            assigned_date = self.extra.get(DATE_FIELD, MISSING)
+        values = (
+            self.value,
+            self.comment,
+            self.assigned_by,
+            assigned_date,
+            self.inactive,
+        )
+        record = {
+            field: value
+            for field, value in zip(FIELDS, values)
+            if value is not MISSING
+        }
+        if self.extra:
+            record.update(self.extra)
+        return record
+
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, MetadataRecord):
+            return NotImplemented
+        return all(
+            getattr(self, slot) == getattr(other, slot)
+            for slot in self.__slots__
+        )
+
+    # The slots can be assigned, so equal records may not stay equal.
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        return f"MetadataRecord({self.to_dict()!r})"
@@ -0,0 +1,455 @@
+"""Serve a resident Metadata instance over a Unix socket.
+
+Each request is one line of JSON, ``{"method": ..., "params": {...}}``,
+answered by one line holding ``{"result": ...}`` or ``{"error": ...}``.
+A JSON list of requests is a batch: its requests run one after the other
+and are answered by a list. Requests of different clients run at the
+same time; their writes take the database lock, as separate processes
+do, so lookups and listings never wait behind an AWS call.
+Listings are answered in pages of at most ``PAGE_SIZE`` rows, which the
+client asks for one after the other. The server keeps the listing of
+each connection open between its pages.
+"""
+import datetime
+import functools
+import http.server
+import inspect
+import itertools
+import json
+import os
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metadata_management import metrics
+from metadata_management.database import DatabaseError
+from metadata_management.manager import BulkResult, CurrentMetadata, Metadata
+
+NO_SERVER_ENV = "METADATA_MANAGEMENT_NO_SERVER"
+PAGE_SIZE = 1000  # Rows per response to a listing
+DEFAULT_TIMEOUT = 300.0  # Seconds, long enough for many AWS calls
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+
+class ServerError(Exception):
+    """A request failed on the server."""
+
+
+def _page_size(limit: Optional[int]) -> int:
+    return PAGE_SIZE if limit is None else min(limit, PAGE_SIZE)
+
+
+@functools.wraps(Metadata.iter_metadata)  # For the signature
+def _iter_metadata(
+    manager: Metadata, since: str = None, **params
+) -> Iterator:
+    if since is not None:
+        params["since"] = datetime.datetime.fromisoformat(since)
+    return manager.iter_metadata(**params)
+
+
+def _handshake(manager: Metadata) -> Dict[str, str]:
+    """Return what clients check before using the server."""
+    return {
+        "db_path": str(manager.db_path.resolve()),
+        "backend": manager.backend,
+    }
+
+
+def _bind(function: Any, manager: Metadata, params: Any) -> None:
+    """Raise TypeError unless ``function`` takes ``params`` as keywords."""
+    if not isinstance(params, dict):
+        raise TypeError("params must be an object")
+    inspect.signature(function).bind(manager, **params)
+
+
+METHODS = {
+    "add": Metadata.add,
+    "bulk_add": Metadata.bulk_add,
+    "get_metadata": Metadata.get_metadata,
+    "handshake": _handshake,
+    "lookup": Metadata.lookup,
+    "metrics": Metadata.metrics,
+    "remove": Metadata.remove,
+    "reserve_ipv4_network": Metadata.reserve_ipv4_network,
+    "reserve_ipv4_networks": Metadata.reserve_ipv4_networks,
+    "set_inactive": Metadata.set_inactive,
+}
+# Methods answered in pages, taking ``limit`` and ``offset``.
+LISTINGS = {
+    "find": Metadata.find,
+    "iter_metadata": _iter_metadata,
+}
+
+
+class _Cursor:
+    """The listing a connection is paging through.
+
+    The next page of the same listing resumes the iterator where the
+    last page stopped, so a full listing visits each row once instead of
+    skipping ``offset`` rows again for every page.
+    """
+
+    def __init__(self) -> None:
+        self.key: Optional[str] = None
+        self.offset = 0
+        self.rows: Iterator = iter(())
+
+    def take(self, key: str, offset: int) -> Optional[Iterator]:
+        """Return the open listing if it continues at ``offset``."""
+        rows = self.rows if (key, offset) == (self.key, self.offset) else None
+        self.key, self.rows = None, iter(())
+        return rows
+
+    def keep(self, key: str, offset: int, rows: Iterator) -> None:
+        self.key, self.offset, self.rows = key, offset, rows
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        cursor = _Cursor()
+        for line in self.rfile:
+            try:
+                request = json.loads(line)
+            except ValueError:
+                response: Any = {"error": "request is not valid JSON"}
+            else:
+                if isinstance(request, list):
+                    response = self.server.dispatch(request, cursor)
+                else:
+                    response = self.server.dispatch([request], cursor)[0]
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+
+
+class MetadataServer(
+    socketserver.ThreadingMixIn, socketserver.UnixStreamServer
+):
+    """Answer requests with a single long-lived Metadata instance.
+
+    Clients are served from separate threads, each running its requests
+    as they come.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: Path, manager: Metadata) -> None:
+        self.manager = manager
+        super().__init__(str(socket_path), _RequestHandler)
+
+    def dispatch(
+        self, requests: List[Any], cursor: _Cursor = None
+    ) -> List[Dict[str, Any]]:
+        return [self._call(request, cursor) for request in requests]
+
+    def _call(self, request: Any, cursor: Optional[_Cursor]) -> Dict[str, Any]:
+        try:
+            name = request["method"]
+            if name not in METHODS and name not in LISTINGS:
+                raise KeyError(name)
+        except (KeyError, TypeError):
+            return {"error": "unknown method"}
+        try:
+            params = request.get("params", {})
+            if name in LISTINGS:
+                result = self._page(name, params, cursor)
+            else:
+                _bind(METHODS[name], self.manager, params)
+                result = METHODS[name](self.manager, **params)
+            return {"result": result}
+        except DatabaseError as exc:
+            return {"error": str(exc), "code": exc.error}
+        except Exception as exc:
+            return {"error": f"{type(exc).__name__}: {exc}"}
+
+    def _page(
+        self, name: str, params: Dict[str, Any], cursor: Optional[_Cursor]
+    ) -> List:
+        """Return one page of a listing, resuming the connection's cursor."""
+        params = dict(params)
+        size = _page_size(params.pop("limit", None))
+        offset = params.pop("offset", 0)
+        _bind(LISTINGS[name], self.manager, params)
+        key = json.dumps([name, params], sort_keys=True)
+        rows = cursor.take(key, offset) if cursor is not None else None
+        if rows is None:
+            rows = itertools.islice(
+                LISTINGS[name](self.manager, **params), offset, None
+            )
+        page = list(itertools.islice(rows, size))
+        if cursor is not None and len(page) == size:
+            cursor.keep(key, offset + size, rows)
+        return page
+
+
+class _MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        try:
+            body = self.server.manager.metrics().encode()
+        except Exception as exc:
+            self.send_error(500, f"{type(exc).__name__}: {exc}")
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", metrics.CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass  # Scraped every few seconds
+
+
+def serve_metrics(
+    manager: Metadata, port: int, host: str = DEFAULT_METRICS_HOST
+) -> http.server.ThreadingHTTPServer:
+    """Answer ``GET /metrics`` on ``host`` and ``port`` from a thread.
+
+    Only local clients can scrape unless another ``host`` is given.
+    """
+    http_server = http.server.ThreadingHTTPServer(
+        (host, port), _MetricsHandler
+    )
+    http_server.daemon_threads = True
+    http_server.manager = manager  # type: ignore[attr-defined]
+    threading.Thread(target=http_server.serve_forever, daemon=True).start()
+    return http_server
+
+
+def serve(
+    socket_path: Path,
+    manager: Metadata,
+    metrics_port: int = None,
+    metrics_host: str = DEFAULT_METRICS_HOST,
+) -> None:
+    """Serve ``manager`` on ``socket_path`` until interrupted.
+
+    Operation latencies are collected for the ``metrics`` method, which
+    is also served over HTTP on ``metrics_host`` and ``metrics_port`` if
+    a port is given.
+    """
+    client = connect(socket_path)
+    if client is not None:
+        client.close()
+        raise OSError(f"a server is already listening on {socket_path}")
+    socket_path.unlink(missing_ok=True)  # Left by a server that crashed
+    metrics.collect()
+    umask = os.umask(0o177)  # Bound as 0600, so only the owner connects
+    try:
+        server = MetadataServer(socket_path, manager)
+    finally:
+        os.umask(umask)
+    http_server = None
+    try:
+        if metrics_port is not None:
+            http_server = serve_metrics(manager, metrics_port, metrics_host)
+        server.serve_forever()
+    finally:
+        if http_server is not None:
+            http_server.shutdown()
+            http_server.server_close()
+        server.server_close()
+        socket_path.unlink(missing_ok=True)
+
+
+def _result(response: Dict[str, Any]) -> Any:
+    if "error" not in response:
+        return response["result"]
+    if response.get("code") is not None:
+        raise DatabaseError(response["code"])
+    raise ServerError(response["error"])
+
+
+class RemoteMetadata:
+    """Forward the calls of the CLI to a running server.
+
+    Offers the subset of ``Metadata`` listed in ``METHODS`` and
+    ``LISTINGS`` with the same
+    signatures and return types.
+    """
+
+    def __init__(
+        self, socket_path: Path, timeout: float = DEFAULT_TIMEOUT
+    ) -> None:
+        self._socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self._socket.settimeout(timeout)
+            self._socket.connect(str(socket_path))
+        except OSError:
+            self._socket.close()
+            raise
+        self._stream = self._socket.makefile("rwb")
+
+    def close(self) -> None:
+        self._stream.close()
+        self._socket.close()
+
+    def _send(self, request: Any) -> Any:
+        try:
+            self._stream.write(json.dumps(request).encode() + b"\n")
+            self._stream.flush()
+            line = self._stream.readline()
+        except OSError as exc:  # Timeouts included
+            raise ServerError(f"the server did not answer: {exc}")
+        if not line:
+            raise ServerError("the server closed the connection")
+        return json.loads(line)
+
+    def call(self, method: str, **params) -> Any:
+        """Run one ``Metadata`` method on the server."""
+        return _result(self._send({"method": method, "params": params}))
+
+    def _pages(
+        self, method: str, limit: Optional[int], offset: int, **params
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield the rows of a listing, asking for one page at a time.
+
+        Rows written between two pages may be skipped or repeated.
+        """
+        while limit is None or limit > 0:
+            size = _page_size(limit)
+            page = self.call(method, limit=size, offset=offset, **params)
+            for title, record in page:
+                yield title, record
+            if len(page) < size:
+                return
+            offset += len(page)
+            if limit is not None:
+                limit -= len(page)
+
+    def batch(self, calls: Iterable[Tuple[str, Dict[str, Any]]]) -> List:
+        """Run several methods in one round trip and return their results.
+
+        The result of a call that failed is its exception.
+        """
+        results = []
+        for response in self._send(
+            [{"method": method, "params": params} for method, params in calls]
+        ):
+            try:
+                results.append(_result(response))
+            except (DatabaseError, ServerError) as exc:
+                results.append(exc)
+        return results
+
+    def add(
+        self, metadata_title: str, metadata_value: str, comment: str
+    ) -> CurrentMetadata:
+        return CurrentMetadata(
+            *self.call(
+                "add",
+                metadata_title=metadata_title,
+                metadata_value=metadata_value,
+                comment=comment,
+            )
+        )
+
+    def get_metadata(self, metadata_title: str = None) -> Dict[str, Any]:
+        return self.call("get_metadata", metadata_title=metadata_title)
+
+    def iter_metadata(
+        self,
+        prefix: str = None,
+        active_only: bool = False,
+        assigned_by: str = None,
+        since: datetime.datetime = None,
+        limit: int = None,
+        offset: int = 0,
+        include_archived: bool = False,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return self._pages(
+            "iter_metadata",
+            limit,
+            offset,
+            prefix=prefix,
+            active_only=active_only,
+            assigned_by=assigned_by,
+            since=since.isoformat() if since is not None else None,
+            include_archived=include_archived,
+        )
+
+    def find(
+        self,
+        value: str = None,
+        assigned_by: str = None,
+        prefix: str = None,
+        inactive: bool = None,
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        return self._pages(
+            "find",
+            None,
+            0,
+            value=value,
+            assigned_by=assigned_by,
+            prefix=prefix,
+            inactive=inactive,
+        )
+
+    def lookup(self, value: str) -> List[str]:
+        return self.call("lookup", value=value)
+
+    def metrics(self) -> str:
+        return self.call("metrics")
+
+    def set_inactive(self, metadata_title: str) -> CurrentMetadata:
+        return CurrentMetadata(
+            *self.call("set_inactive", metadata_title=metadata_title)
+        )
+
+    def remove(self, metadata_title: str) -> CurrentMetadata:
+        return CurrentMetadata(
+            *self.call("remove", metadata_title=metadata_title)
+        )
+
+    def bulk_add(
+        self, rows: Iterable[Dict[str, Any]], strict: bool = False
+    ) -> BulkResult:
+        metadata, errors, error = self.call(
+            "bulk_add", rows=list(rows), strict=strict
+        )
+        return BulkResult(metadata, [tuple(item) for item in errors], error)
+
+    def reserve_ipv4_network(self, host: str, **params) -> CurrentMetadata:
+        return CurrentMetadata(
+            *self.call("reserve_ipv4_network", host=host, **params)
+        )
+
+    def reserve_ipv4_networks(
+        self, hosts: Iterable[str], **params
+    ) -> BulkResult:
+        metadata, errors, error = self.call(
+            "reserve_ipv4_networks", hosts=list(hosts), **params
+        )
+        return BulkResult(metadata, [tuple(item) for item in errors], error)
+
+
+def connect(
+    socket_path: Path, db_path: Path = None, backend: str = None
+) -> Optional[RemoteMetadata]:
+    """Return a client of the server on ``socket_path`` if one is running.
+
+    With ``db_path`` and ``backend`` the server must serve that database,
+    as a server started before the configuration changed may not. Returns
+    None as well if it does not, or if the ``METADATA_MANAGEMENT_NO_SERVER``
+    environment variable is set.
+    """
+    if os.environ.get(NO_SERVER_ENV) or not socket_path.exists():
+        return None
+    try:
+        client = RemoteMetadata(socket_path)
+    except OSError:
+        return None
+    if db_path is None:
+        return client
+    expected = {"db_path": str(db_path.resolve()), "backend": backend}
+    try:
+        served = client.call("handshake")
+    except ServerError:
+        served = None
+    if served != expected:
+        client.close()
+        return None
+    return client
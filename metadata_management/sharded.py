@@ -0,0 +1,364 @@
+"""Hash-partitioned storage backend for the metadata database.
+
+The database path holds a manifest, ``{"shards": N, "generation": G}``,
+and the records live in N JSON files next to it,
+``<database>.shard-<i>-of-<N>``. A record is kept in shard
+``crc32(title) % N``, so a mutation rewrites and locks a single shard,
+and writers of different shards do not wait for each other.
+
+Writers read the manifest, lock their shards and check that the
+generation, bumped by every reshard, did not change meanwhile. The shard
+count alone would miss a reshard to M shards and back to N, which leaves
+new lock files behind the same names. ``reshard`` holds every shard lock
+while it writes the new shards and replaces the manifest, so writers
+wait for it instead of failing, and readers keep reading the shards they
+opened.
+"""
+import collections
+import json
+import zlib
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metadata_management import (
+    DB_LOCK_ERROR,
+    DB_READ_ERROR,
+    DB_WRITE_ERROR,
+    JSON_ERROR,
+    SUCCESS,
+    profiling,
+)
+from metadata_management.database import (
+    DEFAULT_LOCK_TIMEOUT,
+    LOCK_SUFFIX,
+    DatabaseError,
+    DatabaseHandler,
+    DBResponse,
+    MetadataFilter,
+    atomic_write,
+)
+
+DEFAULT_SHARDS = 8
+DEFAULT_WORKERS = 4  # Shards read at the same time
+
+
+def get_shard_path(db_path: Path, index: int, count: int) -> Path:
+    """Return the path of shard ``index`` of ``count`` of ``db_path``."""
+    return db_path.with_name(f"{db_path.name}.shard-{index}-of-{count}")
+
+
+def shard_of(title: str, count: int) -> int:
+    """Return the shard holding ``title``, the same in every process."""
+    return zlib.crc32(title.encode()) % count
+
+
+def _split(metadata: Dict[str, Any], count: int) -> List[Dict[str, Any]]:
+    shards: List[Dict[str, Any]] = [{} for _ in range(count)]
+    for title, record in metadata.items():
+        shards[shard_of(title, count)][title] = record
+    return shards
+
+
+def write_shards(
+    db_path: Path, metadata: Dict[str, Any], count: int, generation: int = 0
+) -> None:
+    """Write ``metadata`` to ``count`` new shards, then the manifest."""
+    for index, shard in enumerate(_split(metadata, count)):
+        atomic_write(
+            get_shard_path(db_path, index, count), json.dumps(shard, indent=4)
+        )
+    atomic_write(
+        db_path, json.dumps({"shards": count, "generation": generation})
+    )
+
+
+def _load(
+    stream: IO[str], where: Optional[MetadataFilter]
+) -> List[Tuple[str, Dict[str, Any]]]:
+    with stream:
+        data = stream.read()
+    try:
+        metadata = json.loads(data) if data.strip() not in ("", "[]") else {}
+    except ValueError:
+        raise DatabaseError(JSON_ERROR)
+    return [
+        (title, record)
+        for title, record in metadata.items()
+        if where is None or where.matches(title, record)
+    ]
+
+
+class ShardedDatabaseHandler(DatabaseHandler):
+    """Store the database as JSON shards chosen by a hash of the title.
+
+    Each shard has its own lock. The database lock is not taken by the
+    handler's writes, only by ``reshard`` and by callers serialising
+    their own read-modify-write sequences, such as reservations. Callers
+    keeping other state in step with writes, such as the index, take the
+    shard locks through ``write_lock``.
+    """
+
+    def __init__(
+        self,
+        db_path: Path,
+        lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+        workers: int = DEFAULT_WORKERS,
+    ) -> None:
+        super().__init__(db_path, lock_timeout)
+        self._lock_timeout = lock_timeout
+        self._workers = workers
+        self._shards: Dict[Tuple[int, int], DatabaseHandler] = {}
+
+    def count(self) -> int:
+        """Return the number of shards in the manifest."""
+        return self._manifest()[0]
+
+    def _manifest(self) -> Tuple[int, int]:
+        """Return the shard count and generation in the manifest."""
+        try:
+            manifest = json.loads(self._db_path.read_text())
+            return int(manifest["shards"]), int(manifest.get("generation", 0))
+        except OSError:
+            raise DatabaseError(DB_READ_ERROR)
+        except (ValueError, KeyError, TypeError):
+            raise DatabaseError(JSON_ERROR)
+
+    def _shard(self, index: int, count: int) -> DatabaseHandler:
+        shard = self._shards.get((index, count))
+        if shard is None:
+            shard = self._shards[index, count] = DatabaseHandler(
+                get_shard_path(self._db_path, index, count),
+                self._lock_timeout,
+            )
+        return shard
+
+    def files(self) -> List[Path]:
+        try:
+            count = self.count()
+        except DatabaseError:
+            return [self._db_path]
+        return [self._db_path] + [
+            get_shard_path(self._db_path, index, count)
+            for index in range(count)
+        ]
+
+    @contextmanager
+    def _locked(
+        self, titles: Optional[Iterable[str]] = None
+    ) -> Iterator[Tuple[int, Dict[int, DatabaseHandler]]]:
+        """Lock the shards of ``titles``, or all of them.
+
+        Yields the shard count and the locked shards by index. Raises
+        DatabaseError if a lock cannot be taken.
+        """
+        titles = list(titles) if titles is not None else None
+        while True:
+            manifest = self._manifest()
+            count = manifest[0]
+            if titles is None:
+                indexes = list(range(count))
+            else:
+                indexes = sorted({shard_of(title, count) for title in titles})
+            with ExitStack() as stack:
+                for index in indexes:  # In order, so writers cannot deadlock
+                    shard = self._shard(index, count)
+                    if not shard.lock.acquire():
+                        raise DatabaseError(DB_LOCK_ERROR)
+                    stack.callback(shard.lock.release)
+                if self._manifest() == manifest:
+                    yield count, {
+                        index: self._shard(index, count) for index in indexes
+                    }
+                    return
+            # Resharded while waiting for the locks
+
+    @contextmanager
+    def write_lock(
+        self, titles: Optional[Iterable[str]] = None
+    ) -> Iterator[List[Path]]:
+        """Hold the locks of the shards of ``titles``, or of every shard.
+
+        Yields the manifest and the locked shards, the files writes of
+        ``titles`` change. The manifest only changes with a reshard.
+        """
+        with self._locked(titles) as (count, shards):
+            yield [self._db_path] + [
+                get_shard_path(self._db_path, index, count)
+                for index in shards
+            ]
+
+    def _open_shards(self) -> List[IO[str]]:
+        """Open every shard, as one version of the manifest lists them."""
+        while True:
+            manifest = self._manifest()
+            count = manifest[0]
+            streams: List[IO[str]] = []
+            try:
+                for index in range(count):
+                    path = get_shard_path(self._db_path, index, count)
+                    streams.append(path.open("r"))
+                return streams
+            except OSError as exc:
+                for stream in streams:
+                    stream.close()
+                if not isinstance(exc, FileNotFoundError):
+                    raise DatabaseError(DB_READ_ERROR)
+                if self._manifest() == manifest:
+                    raise DatabaseError(DB_READ_ERROR)
+                # Removed by a reshard since the manifest was read
+
+    @profiling.traced
+    def read_metadata(self) -> DBResponse:
+        try:
+            metadata = dict(self.iter_metadata())
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+        profiling.annotate(rows=len(metadata))
+        return DBResponse(metadata, SUCCESS)
+
+    @profiling.traced
+    def write_metadata(self, metadata: Dict[str, Any]) -> DBResponse:
+        """Replace the database content with ``metadata``."""
+        try:
+            with self._locked() as (count, shards):
+                parts = _split(metadata, count)
+                for index, shard in shards.items():
+                    write = shard.write_metadata(parts[index])
+                    if write.error:
+                        return DBResponse(metadata, write.error)
+        except DatabaseError as exc:
+            return DBResponse(metadata, exc.error)
+        return DBResponse(metadata, SUCCESS)
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(title, record)`` pairs shard by shard.
+
+        Up to ``workers`` shards are read and filtered in parallel ahead
+        of the one being yielded.
+        """
+        streams = collections.deque(self._open_shards())
+        pending: "collections.deque[Tuple[Future, IO[str]]]" = (
+            collections.deque()
+        )
+        with ThreadPoolExecutor(min(self._workers, len(streams))) as pool:
+            try:
+                while streams or pending:
+                    while streams and len(pending) < self._workers:
+                        stream = streams.popleft()
+                        pending.append(
+                            (pool.submit(_load, stream, where), stream)
+                        )
+                    yield from pending.popleft()[0].result()
+            finally:  # Stopped early
+                for future, stream in pending:
+                    if future.cancel():
+                        stream.close()
+                for stream in streams:
+                    stream.close()
+
+    def get_record(self, title: str) -> DBResponse:
+        """Return a single record, reading its shard only."""
+        try:
+            while True:
+                manifest = self._manifest()
+                count = manifest[0]
+                read = self._shard(shard_of(title, count), count).get_record(
+                    title
+                )
+                if read.error != DB_READ_ERROR or self._manifest() == manifest:
+                    return read
+                # Removed by a reshard since the manifest was read
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+
+    def put_records(
+        self, records: Dict[str, Any], delete: Iterable[str] = ()
+    ) -> DBResponse:
+        """Insert, replace and delete records, writing each shard once.
+
+        Writes to different shards are not atomic together.
+        """
+        delete = list(delete)
+        try:
+            with self._locked([*records, *delete]) as (count, shards):
+                for index, shard in shards.items():
+                    write = shard.put_records(
+                        {
+                            title: record
+                            for title, record in records.items()
+                            if shard_of(title, count) == index
+                        },
+                        [
+                            title
+                            for title in delete
+                            if shard_of(title, count) == index
+                        ],
+                    )
+                    if write.error:
+                        return DBResponse(records, write.error)
+        except DatabaseError as exc:
+            return DBResponse(records, exc.error)
+        return DBResponse(records, SUCCESS)
+
+    def put_record(self, title: str, record: Dict[str, Any]) -> DBResponse:
+        """Insert or replace a single record."""
+        write = self.put_records({title: record})
+        return DBResponse({title: record}, write.error)
+
+    def update_record(self, title: str, changes: Dict[str, Any]) -> DBResponse:
+        """Update fields of an existing record and return the new record."""
+        try:
+            with self._locked([title]) as (_, shards):
+                (shard,) = shards.values()
+                return shard.update_record(title, changes)
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+
+    def delete_record(self, title: str) -> DBResponse:
+        """Delete a single record and return it."""
+        try:
+            with self._locked([title]) as (_, shards):
+                (shard,) = shards.values()
+                return shard.delete_record(title)
+        except DatabaseError as exc:
+            return DBResponse({}, exc.error)
+
+    def reshard(self, count: int) -> int:
+        """Spread the records over ``count`` shards.
+
+        Writers wait for the new shards to be written and readers keep
+        reading the shards they opened before.
+        """
+        if not self.lock.acquire():  # One reshard at a time
+            return DB_LOCK_ERROR
+        try:
+            with self._locked() as (current, shards):
+                if count == current:
+                    return SUCCESS
+                generation = self._manifest()[1] + 1
+                metadata: Dict[str, Any] = {}
+                for shard in shards.values():
+                    read = shard.read_metadata()
+                    if read.error:
+                        return read.error
+                    metadata.update(read.metadata)
+                try:
+                    write_shards(self._db_path, metadata, count, generation)
+                except OSError:
+                    return DB_WRITE_ERROR
+                # Writers waiting for these see the new manifest and retry
+                for index in shards:
+                    path = get_shard_path(self._db_path, index, current)
+                    path.unlink(missing_ok=True)
+                    path.with_name(path.name + LOCK_SUFFIX).unlink(
+                        missing_ok=True
+                    )
+            return SUCCESS
+        except DatabaseError as exc:
+            return exc.error
+        finally:
+            self.lock.release()
@@ -0,0 +1,266 @@
+"""Write compressed full and incremental snapshots of the database.
+
+A snapshot is a compressed JSON Lines file of ``put`` and ``del``
+entries, as in the log of the WAL backend. A full snapshot puts every
+row; an incremental one holds the changes since the previous snapshot.
+Snapshots are numbered, and a database is restored by applying its
+latest full snapshot and the incremental ones after it in order.
+
+Each snapshot is numbered past the highest one at its destination, and
+an existing snapshot is never overwritten. What the previous snapshot
+held is known from ``<database>.snapshot``, which keeps the snapshot
+number and a digest of each row; if the destination holds a later
+snapshot than it records, the next one is full.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from metadata_management import DB_LOCK_ERROR, DB_WRITE_ERROR, SUCCESS
+from metadata_management.database import (
+    DatabaseError,
+    DatabaseHandler,
+    atomic_write,
+)
+from metadata_management.wal import DELETE, PUT
+
+GZIP = "gzip"
+ZSTD = "zstd"
+COMPRESSIONS = (GZIP, ZSTD)
+EXTENSIONS = {GZIP: ".gz", ZSTD: ".zst"}
+FULL = "full"
+INCREMENTAL = "incremental"
+STATE_SUFFIX = ".snapshot"
+S3_SCHEME = "s3://"
+
+
+class SnapshotError(Exception):
+    """A snapshot could not be written or read."""
+
+
+class SnapshotResult(NamedTuple):
+    sequence: int
+    kind: str
+    location: str  # None if there were no changes to write
+    changes: int
+    size: int  # compressed bytes
+    error: int
+
+
+def get_state_path(db_path: Path) -> Path:
+    """Return the path of the snapshot state kept next to ``db_path``."""
+    return db_path.with_name(db_path.name + STATE_SUFFIX)
+
+
+def _digest(record: Dict[str, Any]) -> str:
+    encoded = json.dumps(record, sort_keys=True).encode()
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+def _open_compressed(path: Path, mode: str, compression: str) -> IO[bytes]:
+    if compression == ZSTD:
+        try:
+            import zstandard
+        except ImportError:
+            raise SnapshotError("zstd needs the zstandard package")
+        if mode == "wb":
+            return zstandard.ZstdCompressor().stream_writer(path.open("wb"))
+        return zstandard.ZstdDecompressor().stream_reader(path.open("rb"))
+    return gzip.open(path, mode)
+
+
+def _read_state(db_path: Path) -> Dict[str, Any]:
+    try:
+        return json.loads(get_state_path(db_path).read_text())
+    except (OSError, ValueError):
+        return {"sequence": 0, "destination": None, "digests": None}
+
+
+def _s3_key(destination: str, name: str) -> Tuple[str, str]:
+    bucket, _, prefix = destination[len(S3_SCHEME) :].partition("/")
+    return bucket, f"{prefix.rstrip('/')}/{name}" if prefix else name
+
+
+def _sequences(destination: str, db_name: str, **aws_options) -> Iterator[int]:
+    """Yield the numbers of the snapshots of ``db_name`` at ``destination``."""
+    prefix = db_name + "."
+    if destination.startswith(S3_SCHEME):
+        from metadata_management.aws import get_client
+
+        bucket, key_prefix = _s3_key(destination, prefix)
+        pages = (
+            get_client(service_name="s3", **aws_options)
+            .get_paginator("list_objects_v2")
+            .paginate(Bucket=bucket, Prefix=key_prefix)
+        )
+        names: Iterable[str] = (
+            item["Key"].rpartition("/")[2]
+            for page in pages
+            for item in page.get("Contents", ())
+        )
+    else:
+        try:
+            names = os.listdir(destination)
+        except FileNotFoundError:
+            names = ()
+    for name in names:
+        number = name[len(prefix) :].partition(".")[0]
+        if name.startswith(prefix) and number.isdigit():
+            yield int(number)
+
+
+def _upload(path: Path, destination: str, name: str, **aws_options) -> str:
+    if destination.startswith(S3_SCHEME):
+        from metadata_management.aws import get_client
+
+        client = get_client(service_name="s3", **aws_options)
+        bucket, key = _s3_key(destination, name)
+        location = f"{S3_SCHEME}{bucket}/{key}"
+        try:
+            client.head_object(Bucket=bucket, Key=key)
+        except client.exceptions.ClientError as exc:
+            if exc.response["Error"]["Code"] not in ("404", "NoSuchKey"):
+                raise
+        else:
+            raise SnapshotError(f"{location} already exists")
+        client.upload_file(str(path), bucket, key)
+        return location
+    target = Path(destination) / name
+    try:
+        os.link(path, target)  # Unlike a rename, fails if target exists
+    except FileExistsError:
+        raise SnapshotError(f"{target} already exists")
+    return str(target)
+
+
+def _write_entries(
+    db_handler: DatabaseHandler,
+    path: Path,
+    compression: str,
+    previous: Optional[Dict[str, str]],
+) -> Tuple[Dict[str, str], int]:
+    """Write the rows that differ from ``previous``, or all if it is None.
+
+    ``previous`` maps titles to the digests of the last snapshot and is
+    consumed. Returns the digests of the current rows and the number of
+    entries written.
+    """
+    digests, changes = {}, 0
+    with _open_compressed(path, "wb", compression) as raw:
+        stream = io.TextIOWrapper(raw, encoding="utf-8")
+        for title, record in db_handler.iter_metadata():
+            digest = digests[title] = _digest(record)
+            if previous is not None and previous.pop(title, None) == digest:
+                continue
+            entry = {"op": PUT, "title": title, "record": record}
+            stream.write(json.dumps(entry) + "\n")
+            changes += 1
+        for title in previous or ():
+            stream.write(json.dumps({"op": DELETE, "title": title}) + "\n")
+            changes += 1
+        stream.flush()
+        stream.detach()
+    return digests, changes
+
+
+def write_snapshot(
+    db_handler: DatabaseHandler,
+    db_path: Path,
+    destination: str,
+    incremental: bool = False,
+    compression: str = GZIP,
+    **aws_options,
+) -> SnapshotResult:
+    """Write a snapshot of the database to a directory or S3 prefix.
+
+    ``destination`` is a local directory or ``s3://bucket/prefix``. An
+    incremental snapshot is written as a full one if the last snapshot
+    to the same destination is not the one recorded, and not written at
+    all if nothing changed. Upload and listing errors are raised, and
+    ``SnapshotError`` if the snapshot already exists.
+    """
+    state = _read_state(db_path)
+    latest = max(
+        _sequences(destination, db_path.name, **aws_options), default=0
+    )
+    previous = state["digests"] if incremental else None
+    if state["destination"] != destination or state["sequence"] != latest:
+        previous = None
+    kind = FULL if previous is None else INCREMENTAL
+    unchanged = SnapshotResult(state["sequence"], kind, None, 0, 0, SUCCESS)
+    sequence = max(state["sequence"], latest) + 1
+    name = f"{db_path.name}.{sequence:08d}.{kind}.jsonl"
+    name += EXTENSIONS[compression]
+    if destination.startswith(S3_SCHEME):
+        staging = db_path.parent
+    else:
+        staging = Path(destination)
+    try:
+        staging.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=staging, prefix=name + ".")
+        os.close(fd)
+    except OSError:
+        return unchanged._replace(error=DB_WRITE_ERROR)
+    tmp_path = Path(tmp_name)
+    try:
+        if not db_handler.lock.acquire():
+            return unchanged._replace(error=DB_LOCK_ERROR)
+        try:
+            digests, changes = _write_entries(
+                db_handler, tmp_path, compression, previous
+            )
+        finally:
+            db_handler.lock.release()
+        if kind == INCREMENTAL and not changes:
+            return unchanged
+        size = tmp_path.stat().st_size
+        location = _upload(tmp_path, destination, name, **aws_options)
+        atomic_write(
+            get_state_path(db_path),
+            json.dumps(
+                {
+                    "sequence": sequence,
+                    "destination": destination,
+                    "digests": digests,
+                }
+            ),
+        )
+    except DatabaseError as exc:
+        return unchanged._replace(error=exc.error)
+    except OSError:
+        return unchanged._replace(error=DB_WRITE_ERROR)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+    return SnapshotResult(sequence, kind, location, changes, size, SUCCESS)
+
+
+def read_snapshots(paths: Iterable[Path]) -> Dict[str, Any]:
+    """Return the database restored from local snapshot files.
+
+    ``paths`` are a full snapshot followed by incremental ones, in order.
+    """
+    metadata: Dict[str, Any] = {}
+    for path in paths:
+        compression = ZSTD if path.suffix == EXTENSIONS[ZSTD] else GZIP
+        with _open_compressed(path, "rb", compression) as raw:
+            for line in io.TextIOWrapper(raw, encoding="utf-8"):
+                entry = json.loads(line)
+                if entry["op"] == PUT:
+                    metadata[entry["title"]] = entry["record"]
+                else:
+                    metadata.pop(entry["title"], None)
+    return metadata
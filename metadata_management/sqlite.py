@@ -0,0 +1,294 @@
+"""SQLite storage backend for the metadata database."""
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from metadata_management import (
+    DB_READ_ERROR,
+    DB_WRITE_ERROR,
+    ID_ERROR,
+    SUCCESS,
+    profiling,
+)
+from metadata_management.database import (
+    DEFAULT_LOCK_TIMEOUT,
+    DatabaseError,
+    DatabaseHandler,
+    DBResponse,
+    MetadataFilter,
+)
+
+# Record field name -> column name.
+COLUMNS = {
+    "Value": "value",
+    "Comment": "comment",
+    "AssignedBy": "assigned_by",
+    "AssignedDateUTC": "assigned_date",
+    "inactive": "inactive",
+}
+SCHEMA = (
+    """
+    CREATE TABLE IF NOT EXISTS metadata (
+        title TEXT PRIMARY KEY,
+        value TEXT,
+        comment TEXT,
+        assigned_by TEXT,
+        assigned_date TEXT,
+        inactive INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS metadata_inactive ON metadata (inactive)",
+    "CREATE INDEX IF NOT EXISTS metadata_assigned_by "
+    "ON metadata (assigned_by)",
+    "CREATE INDEX IF NOT EXISTS metadata_assigned_date "
+    "ON metadata (assigned_date)",
+    "CREATE INDEX IF NOT EXISTS metadata_value ON metadata (value)",
+)
+SELECT = (
+    "SELECT title, value, comment, assigned_by, assigned_date, inactive "
+    "FROM metadata"
+)
+UPSERT = (
+    "INSERT OR REPLACE INTO metadata "
+    "(title, value, comment, assigned_by, assigned_date, inactive) "
+    "VALUES (?, ?, ?, ?, ?, ?)"
+)
+
+
+def _where_clause(where: MetadataFilter) -> Tuple[str, List[Any]]:
+    """Translate a filter into an indexed WHERE clause."""
+    conditions, parameters = [], []
+    if where.prefix:
+        # A range on the primary key instead of LIKE, which is not indexed.
+        conditions.append("title >= ? AND title < ?")
+        parameters += [
+            where.prefix,
+            where.prefix[:-1] + chr(ord(where.prefix[-1]) + 1),
+        ]
+    if where.active_only:
+        conditions.append("inactive = 0")
+    if where.inactive_only:
+        conditions.append("inactive = 1")
+    if where.value is not None:
+        conditions.append("value = ?")
+        parameters.append(where.value)
+    if where.assigned_by is not None:
+        conditions.append("assigned_by = ?")
+        parameters.append(where.assigned_by)
+    if where.since is not None:
+        conditions.append("assigned_date >= ?")
+        parameters.append(where.since)
+    if not conditions:
+        return "", []
+    return " WHERE " + " AND ".join(conditions), parameters
+
+
+def _to_record(row: Tuple) -> Tuple[str, Dict[str, Any]]:
+    title, value, comment, assigned_by, assigned_date, inactive = row
+    return title, {
+        "Value": value,
+        "Comment": comment,
+        "AssignedBy": assigned_by,
+        "AssignedDateUTC": assigned_date,
+        "inactive": bool(inactive),
+    }
+
+
+def _to_row(title: str, record: Dict[str, Any]) -> Tuple:
+    return (
+        title,
+        record.get("Value"),
+        record.get("Comment"),
+        record.get("AssignedBy"),
+        record.get("AssignedDateUTC"),
+        int(bool(record.get("inactive", False))),
+    )
+
+
+class SQLiteDatabaseHandler(DatabaseHandler):
+    """Store one row per metadata title in an SQLite database."""
+
+    rewrites_file = False
+
+    def __init__(
+        self, db_path: Path, lock_timeout: float = DEFAULT_LOCK_TIMEOUT
+    ) -> None:
+        super().__init__(db_path, lock_timeout)
+        self._timeout = lock_timeout
+        self._connection = None
+        # Threads share the connection, so they take turns with transactions
+        self._transaction_lock = threading.RLock()
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        with self._transaction_lock:
+            if self._connection is None:
+                self._connection = sqlite3.connect(
+                    self._db_path,
+                    timeout=self._timeout,
+                    isolation_level=None,
+                    check_same_thread=False,
+                )
+                self._connection.execute("PRAGMA journal_mode=WAL")
+                self._connection.execute("PRAGMA synchronous=NORMAL")
+            return self._connection
+
+    @contextmanager
+    def _write(self) -> Iterator[sqlite3.Connection]:
+        with self._transaction_lock:
+            connection = self.connection
+            connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield connection
+            except BaseException:
+                connection.execute("ROLLBACK")
+                raise
+            try:
+                connection.execute("COMMIT")
+            except sqlite3.Error:
+                if connection.in_transaction:
+                    connection.execute("ROLLBACK")
+                raise
+
+    def create(self) -> int:
+        """Create the schema and indexes."""
+        try:
+            with self._write() as connection:
+                for statement in SCHEMA:
+                    connection.execute(statement)
+        except sqlite3.Error:
+            return DB_WRITE_ERROR
+        return SUCCESS
+
+    def files(self) -> List[Path]:
+        log_path = self._db_path.with_name(self._db_path.name + "-wal")
+        return [self._db_path, log_path]
+
+    def compact(self) -> int:
+        """Reclaim the space of deleted rows and empty the SQLite log."""
+        try:
+            self.connection.execute("VACUUM")
+            self.connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        except sqlite3.Error:
+            return DB_WRITE_ERROR
+        return SUCCESS
+
+    def close(self) -> None:
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    @profiling.traced
+    def read_metadata(self) -> DBResponse:
+        try:
+            rows = self.connection.execute(SELECT).fetchall()
+        except sqlite3.Error:
+            return DBResponse({}, DB_READ_ERROR)
+        return DBResponse(dict(_to_record(row) for row in rows), SUCCESS)
+
+    @profiling.traced
+    def write_metadata(self, metadata: Dict[str, Any]) -> DBResponse:
+        """Replace the database content with ``metadata``."""
+        try:
+            with self._write() as connection:
+                connection.execute("DELETE FROM metadata")
+                connection.executemany(
+                    UPSERT, (_to_row(*item) for item in metadata.items())
+                )
+        except sqlite3.Error:
+            return DBResponse(metadata, DB_WRITE_ERROR)
+        return DBResponse(metadata, SUCCESS)
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(title, record)`` pairs straight from a cursor."""
+        clause, parameters = _where_clause(where or MetadataFilter())
+        try:
+            for row in self.connection.execute(SELECT + clause, parameters):
+                yield _to_record(row)
+        except sqlite3.Error:
+            raise DatabaseError(DB_READ_ERROR)
+
+    def count_rows(self) -> Tuple[int, int]:
+        """Return the number of rows and of inactive rows."""
+        try:
+            rows, inactive = self.connection.execute(
+                "SELECT count(*), coalesce(sum(inactive), 0) FROM metadata"
+            ).fetchone()
+        except sqlite3.Error:
+            raise DatabaseError(DB_READ_ERROR)
+        return rows, inactive
+
+    def get_record(self, title: str) -> DBResponse:
+        """Return a single record."""
+        try:
+            row = self.connection.execute(
+                SELECT + " WHERE title = ?", (title,)
+            ).fetchone()
+        except sqlite3.Error:
+            return DBResponse({}, DB_READ_ERROR)
+        if row is None:
+            return DBResponse({}, ID_ERROR)
+        return DBResponse(_to_record(row)[1], SUCCESS)
+
+    def put_record(self, title: str, record: Dict[str, Any]) -> DBResponse:
+        """Insert or replace a single record."""
+        write = self.put_records({title: record})
+        return DBResponse({title: record}, write.error)
+
+    def put_records(
+        self, records: Dict[str, Any], delete: Iterable[str] = ()
+    ) -> DBResponse:
+        """Insert or replace several records, and delete others, at once.
+
+        Titles in ``delete`` that do not exist are ignored.
+        """
+        try:
+            with self._write() as connection:
+                connection.executemany(
+                    UPSERT, (_to_row(*item) for item in records.items())
+                )
+                connection.executemany(
+                    "DELETE FROM metadata WHERE title = ?",
+                    ((title,) for title in delete),
+                )
+        except sqlite3.Error:
+            return DBResponse(records, DB_WRITE_ERROR)
+        return DBResponse(records, SUCCESS)
+
+    def update_record(self, title: str, changes: Dict[str, Any]) -> DBResponse:
+        """Update fields of an existing record and return the new record."""
+        assignments = ", ".join(f"{COLUMNS[field]} = ?" for field in changes)
+        try:
+            with self._write() as connection:
+                updated = connection.execute(
+                    f"UPDATE metadata SET {assignments} WHERE title = ?",
+                    (*changes.values(), title),
+                )
+                if not updated.rowcount:
+                    return DBResponse({}, ID_ERROR)
+                row = connection.execute(
+                    SELECT + " WHERE title = ?", (title,)
+                ).fetchone()
+        except sqlite3.Error:
+            return DBResponse({}, DB_WRITE_ERROR)
+        return DBResponse(_to_record(row)[1], SUCCESS)
+
+    def delete_record(self, title: str) -> DBResponse:
+        """Delete a single record and return it."""
+        try:
+            with self._write() as connection:
+                row = connection.execute(
+                    SELECT + " WHERE title = ?", (title,)
+                ).fetchone()
+                if row is None:
+                    return DBResponse({}, ID_ERROR)
+                connection.execute(
+                    "DELETE FROM metadata WHERE title = ?", (title,)
+                )
+        except sqlite3.Error:
+            return DBResponse({}, DB_WRITE_ERROR)
+        return DBResponse(_to_record(row)[1], SUCCESS)
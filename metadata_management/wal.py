@@ -0,0 +1,353 @@
+"""Append-only log storage backend for the metadata database."""
+import contextlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from metadata_management import (
+    DB_LOCK_ERROR,
+    DB_READ_ERROR,
+    DB_WRITE_ERROR,
+    ID_ERROR,
+    JSON_ERROR,
+    SUCCESS,
+    profiling,
+)
+from metadata_management.database import (
+    DEFAULT_LOCK_TIMEOUT,
+    DatabaseError,
+    DatabaseHandler,
+    DBResponse,
+    MetadataFilter,
+    atomic_write,
+)
+from metadata_management.records import MetadataRecord
+
+LOG_SUFFIX = ".wal"
+DEFAULT_COMPACT_THRESHOLD = 4 * 1024 * 1024  # bytes of log before folding
+PUT = "put"
+DELETE = "del"
+
+
+def get_log_path(db_path: Path) -> Path:
+    """Return the path of the log file belonging to a snapshot file."""
+    return db_path.with_name(db_path.name + LOG_SUFFIX)
+
+
+def _new_generation() -> str:
+    return os.urandom(8).hex()
+
+
+def _header(generation: str) -> str:
+    return json.dumps({"generation": generation}) + "\n"
+
+
+def _read_header(log: Optional[IO[bytes]]) -> Tuple[Optional[str], int]:
+    """Return the generation of a log and the offset of its first record.
+
+    Logs written before headers were added have no generation.
+    """
+    if log is None:
+        return None, 0
+    line = log.readline()
+    if not line.endswith(b"\n"):
+        return None, 0  # Empty, or a torn header
+    try:
+        generation = json.loads(line).get("generation")
+    except (ValueError, AttributeError):
+        return None, 0  # Read as a record, to report the error
+    return (generation, len(line)) if generation is not None else (None, 0)
+
+
+def _sync_directory(path: Path) -> None:
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _apply(state: Dict[str, MetadataRecord], entry: Dict[str, Any]) -> None:
+    if entry["op"] == PUT:
+        state[entry["title"]] = MetadataRecord.from_dict(entry["record"])
+    else:
+        state.pop(entry["title"], None)
+
+
+class LogDatabaseHandler(DatabaseHandler):
+    """Store the database as a JSON snapshot plus a JSON Lines log.
+
+    Every mutation appends one record to the log and syncs it to disk
+    before returning. Once the log grows past ``compact_threshold`` bytes
+    it is folded into the snapshot on a background thread. The snapshot
+    uses the same format as the JSON backend, so a folded database can be
+    opened by either handler.
+
+    The log starts with a header holding a random generation, replaced
+    by each fold, so handlers notice folds by other processes even if the
+    new log reuses the inode of the old one.
+
+    Appends and folds hold the database lock. Before each mutation the
+    in-memory state catches up with records appended by other processes.
+    """
+
+    rewrites_file = False
+
+    def __init__(
+        self,
+        db_path: Path,
+        compact_threshold: int = DEFAULT_COMPACT_THRESHOLD,
+        lock_timeout: float = DEFAULT_LOCK_TIMEOUT,
+    ) -> None:
+        super().__init__(db_path, lock_timeout)
+        self._log_path = get_log_path(db_path)
+        self._compact_threshold = compact_threshold
+        self._compactor: Optional[threading.Thread] = None
+        self._state: Optional[Dict[str, MetadataRecord]] = None
+        self._generation: Optional[str] = None
+        self._log_size = 0
+
+    def _load(self) -> int:
+        """Replay the snapshot and any log records not seen yet.
+
+        Must be called with the database lock held.
+        """
+        try:
+            log: Optional[IO[bytes]] = self._log_path.open("rb")
+        except FileNotFoundError:
+            log = None
+        except OSError:
+            return DB_READ_ERROR
+        with log if log is not None else contextlib.nullcontext():
+            generation, offset = _read_header(log)
+            log_size = os.fstat(log.fileno()).st_size if log else 0
+            if (
+                self._state is not None
+                and generation == self._generation
+                and log_size >= self._log_size >= offset
+            ):
+                if log_size == self._log_size:
+                    return SUCCESS
+                state, offset = self._state, self._log_size
+            else:
+                # First load, or the log was folded by another handler.
+                try:
+                    state = {
+                        title: MetadataRecord.from_dict(record)
+                        for title, record in super().iter_metadata()
+                    }
+                except DatabaseError as exc:
+                    return exc.error
+            size = offset
+            if log is not None:
+                try:
+                    log.seek(offset)
+                    for line in log:
+                        if not line.endswith(b"\n"):
+                            break  # Torn record from an interrupted append
+                        try:
+                            _apply(state, json.loads(line))
+                        except (json.JSONDecodeError, KeyError):
+                            return JSON_ERROR
+                        size += len(line)
+                    if size != log_size:
+                        os.truncate(self._log_path, size)
+                except OSError:
+                    return DB_READ_ERROR
+        self._state, self._generation, self._log_size = state, generation, size
+        return SUCCESS
+
+    def _append(self, *entries: Dict[str, Any]) -> int:
+        lines = [json.dumps(entry) + "\n" for entry in entries]
+        created = not self._log_size
+        if created:  # Missing, empty, or only a torn header
+            self._generation = _new_generation()
+            lines.insert(0, _header(self._generation))
+        data = "".join(lines).encode()
+        try:
+            with self._log_path.open("ab") as log:
+                log.write(data)
+                log.flush()
+                os.fsync(log.fileno())
+            if created:
+                _sync_directory(self._log_path.parent)
+        except OSError:
+            self._state = None  # Reloaded from disk by the next call
+            return DB_WRITE_ERROR
+        for entry in entries:
+            _apply(self._state, entry)
+        self._log_size += len(data)
+        if self._log_size >= self._compact_threshold and not (
+            self._compactor and self._compactor.is_alive()
+        ):
+            self._compactor = threading.Thread(target=self.compact)
+            self._compactor.start()
+        return SUCCESS
+
+    def _write_snapshot(self, metadata: Dict[str, Any]) -> int:
+        generation = _new_generation()
+        header = _header(generation)
+        try:
+            atomic_write(
+                self._db_path,
+                json.dumps(metadata, indent=4, default=MetadataRecord.to_dict),
+            )
+            atomic_write(self._log_path, header)
+        except OSError:
+            self._state = None
+            return DB_WRITE_ERROR
+        self._generation, self._log_size = generation, len(header.encode())
+        return SUCCESS
+
+    def files(self) -> List[Path]:
+        return [self._db_path, self._log_path]
+
+    def compact(self) -> int:
+        """Fold the log into the snapshot and start an empty log."""
+        if not self.lock.acquire():
+            return DB_LOCK_ERROR
+        try:
+            return self._load() or self._write_snapshot(self._state)
+        finally:
+            self.lock.release()
+
+    def wait(self) -> None:
+        """Block until a running background compaction has finished."""
+        if self._compactor is not None:
+            self._compactor.join()
+
+    @profiling.traced
+    def read_metadata(self) -> DBResponse:
+        if not self.lock.acquire():
+            return DBResponse({}, DB_LOCK_ERROR)
+        try:
+            error = self._load()
+            if error:
+                return DBResponse({}, error)
+            return DBResponse(
+                {title: row.to_dict() for title, row in self._state.items()},
+                SUCCESS,
+            )
+        finally:
+            self.lock.release()
+
+    @profiling.traced
+    def write_metadata(self, metadata: Dict[str, Any]) -> DBResponse:
+        """Replace the database content with ``metadata``."""
+        if not self.lock.acquire():
+            return DBResponse(metadata, DB_LOCK_ERROR)
+        try:
+            error = self._write_snapshot(metadata)
+            if not error:
+                self._state = {
+                    title: MetadataRecord.from_dict(row)
+                    for title, row in metadata.items()
+                }
+            return DBResponse(metadata, error)
+        finally:
+            self.lock.release()
+
+    def iter_metadata(
+        self, where: Optional[MetadataFilter] = None
+    ) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ``(title, record)`` pairs from the replayed state."""
+        if not self.lock.acquire():
+            raise DatabaseError(DB_LOCK_ERROR)
+        try:
+            error = self._load()
+            if error:
+                raise DatabaseError(error)
+            items = list(self._state.items())
+        finally:
+            self.lock.release()
+        for title, record in items:
+            record = record.to_dict()
+            if where is None or where.matches(title, record):
+                yield title, record
+
+    def get_record(self, title: str) -> DBResponse:
+        """Return a single record."""
+        if not self.lock.acquire():
+            return DBResponse({}, DB_LOCK_ERROR)
+        try:
+            error = self._load()
+            if error:
+                return DBResponse({}, error)
+            if title not in self._state:
+                return DBResponse({}, ID_ERROR)
+            return DBResponse(self._state[title].to_dict(), SUCCESS)
+        finally:
+            self.lock.release()
+
+    def put_record(self, title: str, record: Dict[str, Any]) -> DBResponse:
+        """Insert or replace a single record."""
+        write = self.put_records({title: record})
+        return DBResponse({title: record}, write.error)
+
+    def put_records(
+        self, records: Dict[str, Any], delete: Iterable[str] = ()
+    ) -> DBResponse:
+        """Insert or replace several records, and delete others, in one append.
+
+        Titles in ``delete`` that do not exist are ignored.
+        """
+        if not self.lock.acquire():
+            return DBResponse(records, DB_LOCK_ERROR)
+        try:
+            error = self._load() or self._append(
+                *(
+                    {"op": PUT, "title": title, "record": record}
+                    for title, record in records.items()
+                ),
+                *(
+                    {"op": DELETE, "title": title}
+                    for title in delete
+                    if title in self._state
+                ),
+            )
+            return DBResponse(records, error)
+        finally:
+            self.lock.release()
+
+    def update_record(self, title: str, changes: Dict[str, Any]) -> DBResponse:
+        """Update fields of an existing record and return the new record."""
+        if not self.lock.acquire():
+            return DBResponse({}, DB_LOCK_ERROR)
+        try:
+            error = self._load()
+            if error:
+                return DBResponse({}, error)
+            if title not in self._state:
+                return DBResponse({}, ID_ERROR)
+            record = {**self._state[title].to_dict(), **changes}
+            error = self._append({"op": PUT, "title": title, "record": record})
+            return DBResponse(record, error)
+        finally:
+            self.lock.release()
+
+    def delete_record(self, title: str) -> DBResponse:
+        """Delete a single record and return it."""
+        if not self.lock.acquire():
+            return DBResponse({}, DB_LOCK_ERROR)
+        try:
+            error = self._load()
+            if error:
+                return DBResponse({}, error)
+            if title not in self._state:
+                return DBResponse({}, ID_ERROR)
+            record = self._state[title].to_dict()
+            error = self._append({"op": DELETE, "title": title})
+            return DBResponse(record, error)
+        finally:
+            self.lock.release()
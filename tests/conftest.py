@@ -0,0 +1,64 @@
+import glob
+import json
+import os
+
+import pytest
+from typer.testing import CliRunner
+
+from metadata_management import SUCCESS, aws, cli
+from metadata_management.database import LOCK_SUFFIX
+from metadata_management.index import INDEX_SUFFIX
+from metadata_management.manager import ARCHIVE_SUFFIX, CurrentMetadata
+from metadata_management.snapshot import STATE_SUFFIX
+
+TEST_DB = "./test_db.json"
+ASSIGNED_DATE = "2022-02-17T16:11:29.093288"
+# Files the backends may leave next to TEST_DB.
+BACKEND_SUFFIXES = (
+    INDEX_SUFFIX + "*",
+    STATE_SUFFIX,
+    ARCHIVE_SUFFIX,
+    LOCK_SUFFIX,
+    ARCHIVE_SUFFIX + LOCK_SUFFIX,
+)
+
+
+@pytest.fixture(autouse=True)
+def clear_client_cache():
+    """Keep clients created under one test's AWS mocks out of the next."""
+    aws.clear_client_cache()
+    yield
+    aws.clear_client_cache()
+
+
+@pytest.fixture
+def mock_db(tmp_path):
+    try:
+        result = CliRunner().invoke(cli.app, ["init", "--db-path", TEST_DB])
+        assert result.exit_code == 0, result
+        yield result
+    finally:
+        os.remove(TEST_DB)
+        for suffix in BACKEND_SUFFIXES:
+            for path in glob.glob(TEST_DB + suffix):
+                os.remove(path)
+
+
+@pytest.fixture
+def mock_json_file(tmp_path):
+    metadata = CurrentMetadata(
+        metadata={
+            "account03": {
+                "Value": "bar",
+                "Comment": "baz",
+                "AssignedBy": "",
+                "AssignedDateUTC": ASSIGNED_DATE,
+                "inactive": False,
+            }
+        },
+        error=SUCCESS,
+    )
+    db_file = tmp_path / "metadata.json"
+    with db_file.open("w") as db:
+        json.dumps(metadata)
+    return db_file
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from unittest.mock import Mock
+
+from metadata_management import SUCCESS
+from metadata_management.aio import AsyncPool, gather_limited
+from metadata_management.manager import Metadata
+
+
+def test_gather_limited_bounds_concurrency():
+    running, peak = 0, 0
+
+    async def task(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return i
+
+    actual = asyncio.run(gather_limited((task(i) for i in range(20)), 3))
+
+    assert actual == list(range(20))
+    assert peak == 3
+
+
+def test_async_pool_allocate_cidr():
+    pool = Mock(request_cidr=Mock(return_value="10.0.1.0/24"))
+
+    async def allocate():
+        async_pool = await AsyncPool(pool).from_existing()
+        return await async_pool.allocate_cidr(24, "account01")
+
+    assert asyncio.run(allocate()) == "10.0.1.0/24"
+    pool.from_existing.assert_called_once_with(None, None, False)
+    pool.request_cidr.assert_called_once_with(
+        24, "account01", None, None
+    )
+
+
+def test_reserve_async_overlaps_aws_calls(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+    lock = threading.Lock()
+    counter = iter(range(256))
+    in_flight, peak = 0, 0
+    all_started = threading.Barrier(8)
+
+    def request_cidr(mask_bits, host, cidr=None, client_token=None):
+        nonlocal in_flight, peak
+        with lock:
+            in_flight += 1
+            peak = max(peak, in_flight)
+        try:
+            all_started.wait(timeout=5)  # Times out if calls are serial
+        except threading.BrokenBarrierError:
+            pass
+        with lock:
+            in_flight -= 1
+            return f"10.0.{next(counter)}.0/24"
+
+    async def reserve_all():
+        return await gather_limited(
+            metadata_management.reserve_ipv4_network_async(
+                f"account{i}", executor=executor
+            )
+            for i in range(8)
+        )
+
+    executor = ThreadPoolExecutor(max_workers=8)
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        pool.return_value.request_cidr = request_cidr
+        results = asyncio.run(reserve_all())
+    executor.shutdown()
+
+    assert [result.error for result in results] == [SUCCESS] * 8
+    assert peak == 8
+    assert len(metadata_management.get_metadata()) == 8
+
+
+def test_reserve_async_offline(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+
+    async def reserve_all():
+        return await asyncio.gather(
+            *(
+                metadata_management.reserve_ipv4_network_async(
+                    f"account{i}", sync=False
+                )
+                for i in range(4)
+            )
+        )
+
+    results = asyncio.run(reserve_all())
+
+    cidrs = {
+        record["Value"]
+        for result in results
+        for record in result.metadata.values()
+    }
+    assert len(cidrs) == 4
+
+
+def test_reserve_async_across_event_loops(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+    counter = iter(range(256))
+
+    async def reserve_all(start):
+        return await asyncio.gather(
+            *(
+                metadata_management.reserve_ipv4_network_async(
+                    f"account{i}"
+                )
+                for i in range(start, start + 4)
+            )
+        )
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        pool.return_value.request_cidr = (
+            lambda *args, **kwargs: f"10.0.{next(counter)}.0/24"
+        )
+        results = asyncio.run(reserve_all(0)) + asyncio.run(reserve_all(4))
+
+    assert [result.error for result in results] == [SUCCESS] * 8
+    assert len(metadata_management.get_metadata()) == 8
@@ -0,0 +1,63 @@
+import pytest
+
+from metadata_management.allocator import AllocationError, CidrAllocator
+
+
+def test_allocates_lowest_free_block():
+    allocator = CidrAllocator("10.0.0.0/16")
+
+    actual = [allocator.allocate(24) for _ in range(3)]
+
+    assert actual == ["10.0.0.0/24", "10.0.1.0/24", "10.0.2.0/24"]
+
+
+def test_mixed_sizes_do_not_overlap():
+    allocator = CidrAllocator("10.0.0.0/16")
+
+    allocator.allocate(24)
+    actual = allocator.allocate(20)
+
+    assert actual == "10.0.16.0/20"
+    with pytest.raises(AllocationError):
+        allocator.reserve("10.0.16.0/24")
+
+
+def test_reserve_detects_overlap():
+    allocator = CidrAllocator("10.0.0.0/16")
+    allocator.reserve("10.0.4.0/22")
+
+    with pytest.raises(AllocationError):
+        allocator.reserve("10.0.5.0/24")
+    with pytest.raises(AllocationError):
+        allocator.reserve("10.0.0.0/20")
+    with pytest.raises(AllocationError):
+        allocator.reserve("10.1.0.0/24")
+    assert allocator.allocate(22) == "10.0.0.0/22"
+
+
+def test_release_merges_buddies():
+    allocator = CidrAllocator("10.0.0.0/24")
+    blocks = [allocator.allocate(26) for _ in range(4)]
+    with pytest.raises(AllocationError):
+        allocator.allocate(26)
+
+    for block in blocks:
+        allocator.release(block)
+
+    assert allocator.allocate(24) == "10.0.0.0/24"
+    with pytest.raises(AllocationError):
+        allocator.release("10.0.0.0/26")
+
+
+def test_from_metadata_reports_conflicts():
+    rows = [
+        ("ip_reservation#a", {"Value": "10.0.0.0/24"}),
+        ("ip_reservation#b", {"Value": "10.0.0.0/25"}),
+        ("ip_reservation#c", {"Value": "not a cidr"}),
+    ]
+
+    allocator, conflicts = CidrAllocator.from_metadata("10.0.0.0/16", rows)
+
+    assert conflicts == ["ip_reservation#b", "ip_reservation#c"]
+    assert allocator.allocated() == ["10.0.0.0/24"]
+    assert allocator.allocated_addresses() == 256
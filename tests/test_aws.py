@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
+from unittest.mock import Mock
+
+from moto import mock_ec2
+
+from metadata_management.aws import clear_client_cache, get_client
+from metadata_management.ipam import IPAM, Pool
+
+
+@mock_ec2
+def test_operations_share_a_client():
+    ipam = IPAM(region_name="us-east-1")
+    pool = Pool(region_name="us-east-1")
+    other_region = Pool(region_name="eu-west-1")
+
+    assert ipam.client is pool.client
+    assert other_region.client is not pool.client
+    assert other_region.client.meta.region_name == "eu-west-1"
+
+
+@mock_ec2
+def test_client_options():
+    client = get_client("us-east-1", max_pool_connections=32, max_attempts=2)
+
+    assert client.meta.config.max_pool_connections == 32
+    assert client.meta.config.retries["total_max_attempts"] == 3
+    assert get_client("us-east-1") is not client
+
+
+@mock_ec2
+def test_threads_get_the_same_client():
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        clients = list(
+            executor.map(lambda _: get_client("us-east-1"), range(32))
+        )
+
+    assert all(client is clients[0] for client in clients)
+
+
+def test_repeated_operations_reuse_the_cached_client():
+    boto3 = Mock()
+    session = boto3.session.Session.return_value
+    session.client.side_effect = lambda *args, **kwargs: Mock()
+    with mock.patch("metadata_management.aws.boto3", boto3):
+        clients = [Pool(region_name="us-east-1").client for _ in range(5)]
+        clear_client_cache()
+        fresh = Pool(region_name="us-east-1").client
+
+    assert all(client is clients[0] for client in clients)
+    assert fresh is not clients[0]
+    assert session.client.call_count == 2
@@ -1,17 +1,20 @@
-import os
 from unittest import mock
 from unittest.mock import Mock
 
 from typer.testing import CliRunner
 import json
-import pytest
 
-from metadata_management import __app_name__, __version__, cli, SUCCESS
+from metadata_management import (
+    __app_name__,
+    __version__,
+    cli,
+    formats,
+    SUCCESS,
+)
 from metadata_management.manager import CurrentMetadata
+from tests.conftest import ASSIGNED_DATE
 
 runner = CliRunner()
-TEST_DB = "./test_db.json"
-ASSIGNED_DATE = "2022-02-17T16:11:29.093288"
 test_data1 = CurrentMetadata(
     metadata={
         "account03": {
@@ -38,36 +41,6 @@ test_data2 = CurrentMetadata(
 )
 
 
-@pytest.fixture
-def mock_db(tmp_path):
-    try:
-        result = runner.invoke(cli.app, ["init", "--db-path", TEST_DB])
-        assert result.exit_code == 0, result
-        yield result
-    finally:
-        os.remove(TEST_DB)
-
-
-@pytest.fixture
-def mock_json_file(tmp_path):
-    metadata = CurrentMetadata(
-        metadata={
-            "account03": {
-                "Value": "bar",
-                "Comment": "baz",
-                "AssignedBy": "",
-                "AssignedDateUTC": ASSIGNED_DATE,
-                "inactive": False,
-            }
-        },
-        error=SUCCESS,
-    )
-    db_file = tmp_path / "metadata.json"
-    with db_file.open("w") as db:
-        json.dumps(metadata)
-    return db_file
-
-
 def test_cli_version():
     result = runner.invoke(cli.app, ["--version"])
     assert result.exit_code == 0
@@ -122,3 +95,162 @@ def test_cli_remove(mock_db):
     assert result.exit_code == 0, result
     result = runner.invoke(cli.app, ["remove", "account01#ipv4address"])
     assert result.exit_code == 0, result
+
+
+def test_cli_import_export(mock_db, tmp_path):
+    rows = tmp_path / "rows.jsonl"
+    rows.write_text(
+        '{"Title": "account01", "Value": "bar", "Comment": "baz"}\n'
+        "not json\n"
+        '{"Title": "account02", "Value": "bar", "inactive": true}\n'
+        '{"Title": "account03"}\n'
+    )
+    result = runner.invoke(cli.app, ["import", str(rows)])
+    assert result.exit_code == 1, result
+    assert "row 2: row is not a JSON object" in result.output
+    assert '"Value" must be a non-empty string' in result.output
+    assert "2 rows imported, 2 rejected" in result.stdout
+
+    exported = tmp_path / "rows.csv"
+    result = runner.invoke(
+        cli.app, ["export", str(exported), "--format", "csv"]
+    )
+    assert result.exit_code == 0, result
+    lines = exported.read_text().splitlines()
+    assert lines[0] == ",".join(formats.FIELDS)
+    assert len(lines) == 3
+    assert lines[2].startswith("account02,bar,,") and lines[2].endswith("True")
+
+
+def test_cli_list_filters(mock_db):
+    for title in ("ip_reservation#account01", "ip_reservation#account02"):
+        runner.invoke(cli.app, ["add", title, "10.0.0.0/24", "test"])
+    runner.invoke(cli.app, ["add", "account01#ipv4address", "127.0.0.1", ""])
+    runner.invoke(cli.app, ["set-inactive", "ip_reservation#account01"])
+
+    result = runner.invoke(
+        cli.app,
+        [
+            "list",
+            "--prefix",
+            "ip_reservation#",
+            "--active-only",
+            "--format",
+            "jsonl",
+        ],
+    )
+
+    assert result.exit_code == 0, result
+    rows = [json.loads(line) for line in result.stdout.splitlines()]
+    assert [row["Title"] for row in rows] == ["ip_reservation#account02"]
+
+
+def test_cli_list_pagination(mock_db):
+    for i in range(5):
+        runner.invoke(cli.app, ["add", f"account{i}", "bar", "baz"])
+
+    result = runner.invoke(
+        cli.app, ["list", "--offset", "1", "--limit", "2", "--format", "json"]
+    )
+
+    assert result.exit_code == 0, result
+    titles = [row["Title"] for row in json.loads(result.stdout)]
+    assert titles == ["account1", "account2"]
+
+
+def test_cli_list_empty(mock_db):
+    result = runner.invoke(cli.app, ["list"])
+
+    assert result.exit_code == 0, result
+    assert "There are no entries" in result.stdout
+
+
+def test_cli_list_table_is_plain_when_piped(mock_db):
+    runner.invoke(cli.app, ["add", "account01", "foo", "bar"])
+
+    result = runner.invoke(cli.app, ["list", "--format", "table"])
+
+    assert result.exit_code == 0, result
+    assert "account01" in result.stdout
+    assert "\x1b[" not in result.stdout
+
+
+def test_cli_reserve_ipv4_networks(mock_db, tmp_path):
+    host_file = tmp_path / "hosts.txt"
+    host_file.write_text("account02\naccount03\n")
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        pool.return_value.from_existing.return_value.request_cidr = Mock(
+            side_effect=["10.0.1.0/24", "10.0.2.0/24", "10.0.3.0/24"]
+        )
+        result = runner.invoke(
+            cli.app,
+            [
+                "reserve-ipv4-networks",
+                "account01",
+                "--from-file",
+                str(host_file),
+                "--no-dry-run",
+                "--workers",
+                "1",
+            ],
+        )
+
+    assert result.exit_code == 0, result.output
+    assert "3 networks reserved, 0 failed" in result.output
+
+
+def test_cli_recover(mock_db):
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        pool.return_value.from_existing.return_value.allocate_cidr = Mock(
+            side_effect=RuntimeError("connection reset")
+        )
+        runner.invoke(
+            cli.app, ["reserve-ipv4-network", "account01", "24", "0"]
+        )
+        pool.return_value.from_existing.return_value.iter_allocations = Mock(
+            return_value=[{"Cidr": "10.0.1.0/24", "Description": "account01"}]
+        )
+        result = runner.invoke(cli.app, ["recover"])
+
+    assert result.exit_code == 0, result.output
+    assert "ip_reservation#account01: 10.0.1.0/24" in result.output
+    assert "1 reservations recovered" in result.output
+
+
+def test_cli_reconcile_reports_drift(mock_db):
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        found = pool.return_value.from_existing.return_value
+        found.iter_allocations.return_value = [
+            {"Cidr": "10.0.5.0/24", "Description": "leaked"}
+        ]
+        result = runner.invoke(cli.app, ["reconcile"])
+
+    assert result.exit_code == 1, result.output
+    assert "orphaned: leaked database=- aws=10.0.5.0/24" in result.output
+    assert "0 missing, 1 orphaned, 0 mismatched" in result.output
+    found.release_allocation.assert_not_called()
+
+
+def test_cli_find_and_lookup(mock_db):
+    runner.invoke(cli.app, ["add", "ip_reservation#a", "10.0.5.0/24", ""])
+    runner.invoke(cli.app, ["add", "ip_reservation#b", "10.0.6.0/24", ""])
+    runner.invoke(cli.app, ["add", "account01#ipv4address", "10.0.5.0/24", ""])
+
+    found = runner.invoke(
+        cli.app,
+        ["find", "--prefix", "ip_reservation", "--active", "-f", "jsonl"],
+    )
+    looked_up = runner.invoke(cli.app, ["lookup", "10.0.5.0/24"])
+    missing = runner.invoke(cli.app, ["lookup", "10.0.7.0/24"])
+
+    assert found.exit_code == 0, found.output
+    rows = [json.loads(line) for line in found.stdout.splitlines()]
+    assert [row["Title"] for row in rows] == [
+        "ip_reservation#a",
+        "ip_reservation#b",
+    ]
+    assert sorted(looked_up.stdout.split()) == [
+        "account01#ipv4address",
+        "ip_reservation#a",
+    ]
+    assert missing.exit_code == 1
@@ -0,0 +1,143 @@
+import datetime
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from metadata_management import SUCCESS, cli
+from metadata_management.database import (
+    BACKENDS,
+    SQLITE_BACKEND,
+    init_database,
+    open_database,
+)
+from metadata_management.manager import Metadata, get_archive_path
+from metadata_management.sqlite import SQLiteDatabaseHandler
+from tests.conftest import TEST_DB
+from tests.test_cli import runner
+
+OLD = "2020-01-01T00:00:00"
+
+
+def _row(assigned_date, inactive):
+    return {
+        "Value": "10.0.0.0/24",
+        "Comment": "",
+        "AssignedBy": "",
+        "AssignedDateUTC": assigned_date,
+        "inactive": inactive,
+    }
+
+
+@pytest.fixture(params=BACKENDS)
+def manager(request, tmp_path):
+    db_path = tmp_path / "metadata.db"
+    init_database(db_path, request.param)
+    now = datetime.datetime.utcnow().isoformat()
+    # Kept open, as closing the last SQLite connection folds its log into
+    # the database before the size is measured.
+    writer = open_database(db_path, request.param)
+    writer.put_records(
+        {
+            "old_inactive": _row(OLD, True),
+            "new_inactive": _row(now, True),
+            "old_active": _row(OLD, False),
+        }
+    )
+    yield Metadata(db_path, request.param)
+    writer.close()
+
+
+def test_compact_archives_old_inactive_metadata(manager):
+    actual = manager.compact(datetime.timedelta(days=30))
+
+    assert actual.error == SUCCESS
+    assert actual.archived == 1
+    assert actual.bytes_after < actual.bytes_before
+    assert sorted(title for title, _ in manager.iter_metadata()) == [
+        "new_inactive",
+        "old_active",
+    ]
+    assert [title for title, _ in manager.find(inactive=True)] == [
+        "new_inactive"
+    ]
+    archived = manager.iter_metadata(include_archived=True)
+    assert sorted(title for title, _ in archived) == [
+        "new_inactive",
+        "old_active",
+        "old_inactive",
+    ]
+
+
+def test_compact_merges_with_earlier_archive(manager):
+    manager.compact(datetime.timedelta(days=30))
+    manager.set_inactive("old_active")
+
+    actual = manager.compact(datetime.timedelta(days=30))
+
+    assert actual.archived == 1
+    assert sorted(
+        title
+        for title, _ in manager.iter_metadata(
+            prefix="old_", include_archived=True
+        )
+    ) == ["old_active", "old_inactive"]
+
+
+def test_compact_without_expired_metadata(manager):
+    actual = manager.compact(datetime.timedelta(days=3650))
+
+    assert (actual.archived, actual.error) == (0, SUCCESS)
+    assert actual.bytes_after == actual.bytes_before
+
+
+def test_compact_closes_the_timing_handlers(tmp_path):
+    db_path = tmp_path / "metadata.db"
+    init_database(db_path, SQLITE_BACKEND)
+    manager = Metadata(db_path, SQLITE_BACKEND)
+
+    with mock.patch.object(SQLiteDatabaseHandler, "close") as close:
+        manager.compact(datetime.timedelta(days=30))
+
+    close.assert_called_once()  # Nothing archived, so timed once
+
+
+def test_automatic_compaction_runs_at_most_daily(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path)
+    manager = Metadata(db_path, archive_after=datetime.timedelta(days=30))
+    open_database(db_path).put_records(
+        {"first": _row(OLD, False), "second": _row(OLD, False)}
+    )
+
+    manager.set_inactive("first")
+    manager.set_inactive("second")  # Within a day of the last compaction
+
+    assert list(Metadata(get_archive_path(db_path)).get_metadata()) == [
+        "first"
+    ]
+    assert list(manager.get_metadata()) == ["second"]
+
+
+def test_cli_compact_and_list_archived(mock_db):
+    runner.invoke(cli.app, ["add", "account01", "foo", "bar"])
+    runner.invoke(cli.app, ["set-inactive", "account01"])
+
+    result = runner.invoke(cli.app, ["compact", "--older-than-days", "0"])
+    listed = runner.invoke(cli.app, ["list", "--format", "csv"])
+    archived = runner.invoke(
+        cli.app, ["list", "--format", "csv", "--include-archived"]
+    )
+
+    assert result.exit_code == 0, result.stdout
+    assert "Archived 1 inactive metadata" in result.stdout
+    assert "account01" not in listed.stdout
+    assert "account01" in archived.stdout
+    assert get_archive_path(Path(TEST_DB)).exists()
+
+
+def test_cli_compact_needs_an_age(mock_db):
+    result = runner.invoke(cli.app, ["compact"])
+
+    assert result.exit_code == 1
+    assert "archive_after_days" in result.stdout
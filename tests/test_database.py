@@ -0,0 +1,236 @@
+import io
+import json
+import multiprocessing
+import tracemalloc
+from unittest import mock
+
+import pytest
+
+from metadata_management import DB_LOCK_ERROR, ID_ERROR, JSON_ERROR, SUCCESS
+from metadata_management.database import (
+    BACKENDS,
+    CachedDatabaseHandler,
+    DatabaseError,
+    DatabaseHandler,
+    FileLock,
+    JSONObjectStream,
+    init_database,
+    open_database,
+)
+from metadata_management.records import MetadataRecord
+
+RECORD = {
+    "Value": "bar",
+    "Comment": "baz",
+    "AssignedBy": "bap",
+    "AssignedDateUTC": "2022-02-17T16:11:29.093288",
+    "inactive": False,
+}
+
+
+def _handler(tmp_path, metadata=None):
+    db_file = tmp_path / "metadata.json"
+    if metadata is None:
+        init_database(db_file)
+    else:
+        db_file.write_text(json.dumps(metadata))
+    return DatabaseHandler(db_file)
+
+
+def test_transaction_parses_and_writes_once(tmp_path):
+    handler = _handler(tmp_path, {"account01": RECORD})
+    with mock.patch(
+        "metadata_management.database.json.loads", wraps=json.loads
+    ) as loads, mock.patch(
+        "metadata_management.database.json.dumps", wraps=json.dumps
+    ) as dumps:
+        with handler.transaction() as txn:
+            txn.metadata["account02"] = dict(RECORD)
+
+    assert txn.error == SUCCESS
+    assert loads.call_count == 1
+    assert dumps.call_count == 1
+    assert set(handler.read_metadata().metadata) == {"account01", "account02"}
+
+
+def test_transaction_rollback_discards_changes(tmp_path):
+    handler = _handler(tmp_path, {"account01": RECORD})
+    with handler.transaction() as txn:
+        txn.metadata.clear()
+        txn.rollback()
+
+    assert handler.read_metadata().metadata == {"account01": RECORD}
+
+
+def test_transaction_does_not_overwrite_corrupt_database(tmp_path):
+    db_file = tmp_path / "metadata.json"
+    db_file.write_text("{not json")
+    handler = DatabaseHandler(db_file)
+    with handler.transaction() as txn:
+        txn.metadata["account01"] = RECORD
+
+    assert txn.error == JSON_ERROR
+    assert db_file.read_text() == "{not json"
+
+
+def test_delete_record_removes_row(tmp_path):
+    handler = _handler(tmp_path, {"account01": RECORD, "account02": RECORD})
+
+    actual = handler.delete_record("account01")
+
+    assert actual == (RECORD, SUCCESS)
+    assert list(handler.read_metadata().metadata) == ["account02"]
+
+
+def test_update_record_unknown_title(tmp_path):
+    handler = _handler(tmp_path)
+
+    actual = handler.update_record("account01", {"inactive": True})
+
+    assert actual.error == ID_ERROR
+
+
+def _add_rows(db_file, backend, writer, rows):
+    from metadata_management.manager import Metadata
+
+    metadata = Metadata(db_file, backend)
+    for row in range(rows):
+        assert metadata.add(f"writer{writer}#{row}", "bar", "baz").error == 0
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_parallel_writers_lose_no_updates(tmp_path, backend):
+    db_file = tmp_path / "metadata.db"
+    init_database(db_file, backend)
+    context = multiprocessing.get_context("fork")
+    writers = [
+        context.Process(target=_add_rows, args=(db_file, backend, i, 20))
+        for i in range(4)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert [writer.exitcode for writer in writers] == [0, 0, 0, 0]
+    read = open_database(db_file, backend).read_metadata()
+    assert read.error == SUCCESS
+    assert len(read.metadata) == 80
+
+
+def test_lock_timeout(tmp_path):
+    handler = _handler(tmp_path)
+    holder = FileLock(handler.lock._path)
+    assert holder.acquire()
+    try:
+        handler.lock._timeout = 0.05
+        actual = handler.put_record("account01", RECORD)
+    finally:
+        holder.release()
+
+    assert actual.error == DB_LOCK_ERROR
+    assert handler.read_metadata().metadata == {}
+
+
+def test_write_replaces_file_atomically(tmp_path):
+    handler = _handler(tmp_path, {"account01": RECORD})
+    inode = handler._db_path.stat().st_ino
+
+    handler.put_record("account02", RECORD)
+
+    assert handler._db_path.stat().st_ino != inode
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "metadata.json",
+        "metadata.json.lock",
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64 * 1024])
+def test_json_object_stream_matches_json_loads(chunk_size):
+    metadata = {
+        f"account{i:03}": {**RECORD, "Count": i * 1000, "inactive": i % 2 == 0}
+        for i in range(50)
+    }
+    document = json.dumps(metadata, indent=4)
+
+    actual = dict(JSONObjectStream(io.StringIO(document), chunk_size))
+
+    assert actual == metadata
+
+
+@pytest.mark.parametrize("document", ["", "[]", " {} \n"])
+def test_json_object_stream_empty(document):
+    assert list(JSONObjectStream(io.StringIO(document))) == []
+
+
+@pytest.mark.parametrize(
+    "document", ['{"a": 1', '{"a": 1} []', '{"a" 1}', "[1]", "{1: 2}"]
+)
+def test_json_object_stream_invalid(document):
+    with pytest.raises(json.JSONDecodeError):
+        list(JSONObjectStream(io.StringIO(document), chunk_size=2))
+
+
+def test_iter_metadata_memory_is_bounded(tmp_path):
+    metadata = {f"account{i:06}": dict(RECORD) for i in range(20000)}
+    handler = _handler(tmp_path, metadata)
+    file_size = handler._db_path.stat().st_size
+
+    tracemalloc.start()
+    try:
+        rows = sum(1 for _ in handler.iter_metadata())
+        _current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert rows == 20000
+    assert peak < file_size / 4
+
+
+def test_iter_metadata_reports_corrupt_file(tmp_path):
+    db_file = tmp_path / "metadata.json"
+    db_file.write_text('{"account01": {')
+    handler = DatabaseHandler(db_file)
+
+    with pytest.raises(DatabaseError) as exc_info:
+        list(handler.iter_metadata())
+
+    assert exc_info.value.error == JSON_ERROR
+    assert handler.get_record("account01").error == JSON_ERROR
+
+
+@pytest.mark.parametrize("backend", BACKENDS)
+def test_put_records_deletes_in_same_write(tmp_path, backend):
+    db_file = tmp_path / "metadata.db"
+    init_database(db_file, backend)
+    handler = open_database(db_file, backend)
+    handler.put_records({"pending#account01": RECORD})
+
+    actual = handler.put_records(
+        {"account01": RECORD}, delete=["pending#account01", "missing"]
+    )
+
+    assert actual.error == SUCCESS
+    assert list(handler.read_metadata().metadata) == ["account01"]
+
+
+def test_resident_cache_holds_compact_records(tmp_path):
+    partial = {"Value": "bar", "inactive": "False"}
+    db_file = _handler(
+        tmp_path, {"account01": RECORD, "account02": partial}
+    )._db_path
+    handler = CachedDatabaseHandler(db_file)
+
+    read = handler.read_metadata()
+    handler.put_record("account03", RECORD)
+
+    assert read.metadata == {"account01": RECORD, "account02": partial}
+    assert all(
+        isinstance(row, MetadataRecord) for row in handler._metadata.values()
+    )
+    assert handler.get_record("account02").metadata == partial
+    assert dict(handler.iter_metadata()) == {
+        "account01": RECORD,
+        "account02": partial,
+        "account03": RECORD,
+    }
@@ -0,0 +1,101 @@
+from unittest.mock import Mock
+
+import pytest
+from freezegun import freeze_time
+
+from metadata_management import discovery
+from metadata_management.discovery import DiscoveryCache
+from metadata_management.ipam import Pool
+
+POOLS = {
+    "IpamPools": [
+        {"IpamPoolId": "ipam-pool-b", "Description": "dev"},
+        {
+            "IpamPoolId": "ipam-pool-c",
+            "Tags": [{"Key": "Name", "Value": "prod"}],
+        },
+        {"IpamPoolId": "ipam-pool-a", "Description": "dev"},
+    ]
+}
+
+
+def make_pool(profile_name=None):
+    pool = Pool(region_name="us-east-1")
+    pool.profile_name = profile_name
+    pool.client = Mock(describe_ipam_pools=Mock(return_value=POOLS))
+    return pool
+
+
+def test_cache_expires(tmp_path):
+    cache = DiscoveryCache(tmp_path / "discovery.json", ttl=60)
+    with freeze_time("2022-01-01 00:00:00"):
+        cache.set("us-east-1", discovery.POOL, "", "ipam-pool-a")
+    with freeze_time("2022-01-01 00:00:59"):
+        assert cache.get("us-east-1", discovery.POOL) == "ipam-pool-a"
+    with freeze_time("2022-01-01 00:01:01"):
+        assert cache.get("us-east-1", discovery.POOL) is None
+
+
+def test_cache_persists_and_invalidates(tmp_path):
+    path = tmp_path / "discovery.json"
+    DiscoveryCache(path).set("us-east-1", discovery.POOL, "", "ipam-pool-a")
+    DiscoveryCache(path).set("us-west-2", discovery.POOL, "", "ipam-pool-b")
+
+    cache = DiscoveryCache(path)
+    assert cache.get("us-east-1", discovery.POOL) == "ipam-pool-a"
+    cache.invalidate("us-east-1")
+    assert cache.get("us-east-1", discovery.POOL) is None
+    assert cache.get("us-west-2", discovery.POOL) == "ipam-pool-b"
+    cache.invalidate()
+    assert DiscoveryCache(path).get("us-west-2", discovery.POOL) is None
+
+
+@pytest.mark.parametrize(
+    "name, expected",
+    [
+        (None, "ipam-pool-a"),
+        ("dev", "ipam-pool-a"),
+        ("prod", "ipam-pool-c"),
+        ("ipam-pool-b", "ipam-pool-b"),
+    ],
+)
+def test_pool_selection_is_deterministic(name, expected):
+    assert make_pool().from_existing(name).ipam_pool_id == expected
+
+
+def test_pool_not_found():
+    with pytest.raises(LookupError):
+        make_pool().from_existing("staging")
+
+
+def test_pool_read_through_cache(tmp_path):
+    cache = DiscoveryCache(tmp_path / "discovery.json")
+    first, second = make_pool(), make_pool()
+
+    first.from_existing("prod", cache)
+    second.from_existing("prod", cache)
+
+    assert second.ipam_pool_id == "ipam-pool-c"
+    second.client.describe_ipam_pools.assert_not_called()
+    second.from_existing("prod", cache, refresh=True)
+    second.client.describe_ipam_pools.assert_called_once()
+
+
+def test_cache_is_kept_per_profile(tmp_path):
+    path = tmp_path / "discovery.json"
+    dev, prod = make_pool("dev"), make_pool("prod")
+    prod.client.describe_ipam_pools.return_value = {
+        "IpamPools": [{"IpamPoolId": "ipam-pool-z"}]
+    }
+
+    dev.from_existing(cache=DiscoveryCache(path))
+    prod.from_existing(cache=DiscoveryCache(path))
+
+    assert dev.ipam_pool_id == "ipam-pool-a"
+    assert prod.ipam_pool_id == "ipam-pool-z"
+    prod.client.describe_ipam_pools.assert_called_once()
+    cache = DiscoveryCache(path)
+    assert cache.get("us-east-1", discovery.POOL, profile="dev") == (
+        "ipam-pool-a"
+    )
+    assert cache.get("us-east-1", discovery.POOL) is None
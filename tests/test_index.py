@@ -0,0 +1,103 @@
+import pytest
+
+from metadata_management import DB_LOCK_ERROR
+from metadata_management.database import (
+    BACKENDS,
+    SQLITE_BACKEND,
+    DatabaseError,
+    DatabaseHandler,
+    init_database,
+)
+from metadata_management.index import MetadataIndex, get_index_path
+from metadata_management.manager import Metadata
+
+
+@pytest.fixture(params=BACKENDS)
+def manager(request, tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path, request.param)
+    manager = Metadata(db_path, request.param)
+    manager.add("ip_reservation#account01", "10.0.5.0/24", "")
+    manager.add("ip_reservation#account02", "10.0.6.0/24", "")
+    manager.add("account01#ipv4address", "10.0.5.0/24", "")
+    manager.set_inactive("ip_reservation#account02")
+    return manager
+
+
+def test_find(manager):
+    def titles(**criteria):
+        return sorted(title for title, _ in manager.find(**criteria))
+
+    assert titles(prefix="ip_reservation") == [
+        "ip_reservation#account01",
+        "ip_reservation#account02",
+    ]
+    assert titles(prefix="ip_reservation", inactive=True) == [
+        "ip_reservation#account02"
+    ]
+    assert titles(prefix="ip", inactive=False) == []
+    assert titles(value="10.0.5.0/24", inactive=False) == [
+        "account01#ipv4address",
+        "ip_reservation#account01",
+    ]
+    assert titles(assigned_by="nobody") == []
+    assert manager.lookup("10.0.6.0/24") == ["ip_reservation#account02"]
+
+
+def test_index_is_updated_by_writes(manager):
+    manager.lookup("10.0.5.0/24")  # Builds the index
+    manager.remove("ip_reservation#account01")
+    manager.bulk_add(
+        [{"Title": "account02#ipv4address", "Value": "10.0.5.0/24"}]
+    )
+    manager.set_inactive("account01#ipv4address")
+
+    assert sorted(manager.lookup("10.0.5.0/24")) == [
+        "account01#ipv4address",
+        "account02#ipv4address",
+    ]
+    assert sorted(title for title, _ in manager.find(inactive=True)) == [
+        "account01#ipv4address",
+        "ip_reservation#account02",
+    ]
+
+
+def test_index_is_persisted_and_rebuilt_when_stale(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path)
+    Metadata(db_path).add("account01", "bar", "")
+    assert Metadata(db_path).lookup("bar") == ["account01"]
+    index = MetadataIndex(db_path, DatabaseHandler(db_path).files)
+    assert get_index_path(db_path).exists() and index.is_fresh()
+
+    DatabaseHandler(db_path).put_record("account02", {"Value": "bar"})
+
+    assert not index.is_fresh()
+    assert sorted(Metadata(db_path).lookup("bar")) == [
+        "account01",
+        "account02",
+    ]
+    assert index.is_fresh()
+
+
+def test_find_reports_lock_timeout(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path)
+    manager = Metadata(db_path, lock_timeout=0)
+    other = DatabaseHandler(db_path, lock_timeout=0)
+    assert other.lock.acquire()
+    try:
+        with pytest.raises(DatabaseError) as exc:
+            list(manager.find(value="bar"))
+    finally:
+        other.lock.release()
+
+    assert exc.value.error == DB_LOCK_ERROR
+
+
+def test_sqlite_backend_needs_no_index_file(tmp_path):
+    db_path = tmp_path / "metadata.db"
+    init_database(db_path, SQLITE_BACKEND)
+
+    assert Metadata(db_path, SQLITE_BACKEND).lookup("bar") == []
+    assert not get_index_path(db_path).exists()
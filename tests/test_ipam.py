@@ -1,10 +1,11 @@
 from unittest import mock
 from unittest.mock import Mock
 
+from botocore.stub import Stubber
 from moto import mock_ec2
 
 import metadata_management
-from metadata_management.ipam import IPAM
+from metadata_management.ipam import IPAM, Pool
 
 
 @mock_ec2
@@ -41,12 +42,15 @@ def test_ipam_from_new():
 
 
 def test_ipam_from_existing():
-    with mock.patch(
-        "metadata_management.aws.boto3",
-        Mock(
-            client=Mock(return_value=Mock(create_ipam=Mock(return_value={})))
-        ),
-    ):
+    response = {
+        "Ipams": [
+            {"IpamId": "ipam-foo", "PrivateDefaultScopeId": "scope-foo"}
+        ]
+    }
+    boto3 = Mock()
+    client = boto3.session.Session.return_value.client.return_value
+    client.describe_ipams.return_value = response
+    with mock.patch("metadata_management.aws.boto3", boto3):
         from metadata_management.ipam import IPAM
 
         ipam = IPAM(region_name="foo-region")
@@ -54,3 +58,33 @@ def test_ipam_from_existing():
         actual = ipam.from_existing("foo-ipam")
 
     assert isinstance(actual, IPAM)
+    assert (actual.ipam_id, actual.scope_id) == ("ipam-foo", "scope-foo")
+
+
+def test_pool_iter_allocations_follows_pages():
+    pool = Pool(region_name="us-east-1", dry_run=False)
+    pool.ipam_pool_id = "ipam-pool-a"
+    request = {
+        "DryRun": False,
+        "IpamPoolId": "ipam-pool-a",
+        "MaxResults": 1000,
+    }
+    with Stubber(pool.client) as stubber:
+        stubber.add_response(
+            "get_ipam_pool_allocations",
+            {
+                "IpamPoolAllocations": [{"Cidr": "10.0.0.0/24"}],
+                "NextToken": "page-2",
+            },
+            request,
+        )
+        stubber.add_response(
+            "get_ipam_pool_allocations",
+            {"IpamPoolAllocations": [{"Cidr": "10.0.1.0/24"}]},
+            {**request, "NextToken": "page-2"},
+        )
+
+        actual = [allocation["Cidr"] for allocation in pool.iter_allocations()]
+
+        stubber.assert_no_pending_responses()
+    assert actual == ["10.0.0.0/24", "10.0.1.0/24"]
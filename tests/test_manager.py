@@ -1,17 +1,22 @@
 from unittest import mock
-from unittest.mock import patch, Mock
+from unittest.mock import ANY, patch, Mock
 
 import pytest
 from freezegun import freeze_time
 from moto import mock_ec2
 
-from metadata_management import SUCCESS
+from metadata_management import (
+    CIDR_ERROR,
+    DB_WRITE_ERROR,
+    SUCCESS,
+    VALIDATION_ERROR,
+)
+from metadata_management.database import DBResponse
 from metadata_management.manager import Metadata, CurrentMetadata
 from tests.test_cli import (
     test_data1,
     test_data2,
     ASSIGNED_DATE,
-    mock_json_file,
 )
 
 test_data3 = CurrentMetadata(
@@ -95,3 +100,260 @@ def test_reserve_ipv4_network(mock_json_file, metadata_title, expected):
         assert actual == expected
         read = metadata_management._db_handler.read_metadata()
         assert len(read.metadata) == 1
+
+
+def test_bulk_add_writes_once(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+    rows = [{"Title": f"account{i}", "Value": "bar"} for i in range(100)]
+    with patch.object(
+        metadata_management._db_handler,
+        "write_metadata",
+        wraps=metadata_management._db_handler.write_metadata,
+    ) as write_metadata:
+        actual = metadata_management.bulk_add(rows + [{"Title": "x"}])
+
+    assert write_metadata.call_count == 1
+    assert len(actual.metadata) == 100
+    assert actual.errors == [(101, '"Value" must be a non-empty string')]
+    assert actual.error == SUCCESS
+
+
+def test_bulk_add_strict_rejects_all(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+
+    actual = metadata_management.bulk_add(
+        [{"Title": "account01", "Value": "bar"}, None], strict=True
+    )
+
+    assert actual.error == VALIDATION_ERROR
+    assert metadata_management.get_metadata() == {}
+
+
+def test_bulk_add_rejects_overlapping_reservations(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+    metadata_management.add("ip_reservation#account01", "10.0.0.0/24", "")
+    rows = [
+        {"Title": "ip_reservation#account02", "Value": "10.0.0.0/25"},
+        {"Title": "ip_reservation#account03", "Value": "10.0.1.0/24"},
+        {"Title": "ip_reservation#account04", "Value": "10.0.1.0/24"},
+    ]
+
+    actual = metadata_management.bulk_add(rows)
+    strict = Metadata(mock_json_file, local_pool="10.0.0.0/16").bulk_add(
+        [{"Title": "ip_reservation#account05", "Value": "10.0.2.0/24"}]
+        + rows[:1],
+        strict=True,
+    )
+
+    assert actual.error == SUCCESS
+    assert list(actual.metadata) == ["ip_reservation#account03"]
+    assert [row_number for row_number, _ in actual.errors] == [1, 3]
+    assert strict.error == CIDR_ERROR
+    assert strict.errors == [
+        (2, "10.0.0.0/25 overlaps an existing allocation")
+    ]
+    assert sorted(metadata_management.get_metadata()) == [
+        "ip_reservation#account01",
+        "ip_reservation#account03",
+    ]
+    assert metadata_management.cidr_conflicts == []
+    assert metadata_management.stats().pools == {"10.0.0.0/16": (512, 65536)}
+
+
+def test_reserve_ipv4_network_offline(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+    metadata_management.add(
+        "ip_reservation#account01", "10.0.0.0/24", "auto-reserved IP"
+    )
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        second = metadata_management.reserve_ipv4_network(
+            "account02", sync=False
+        )
+        metadata_management.set_inactive("ip_reservation#account01")
+        third = metadata_management.reserve_ipv4_network(
+            "account03", sync=False
+        )
+
+    pool.assert_not_called()
+    assert second.metadata["ip_reservation#account02"]["Value"] == (
+        "10.0.1.0/24"
+    )
+    assert third.metadata["ip_reservation#account03"]["Value"] == (
+        "10.0.0.0/24"
+    )
+    overlapping = metadata_management.add(
+        "ip_reservation#account04", "10.0.1.0/25", "manual"
+    )
+    assert overlapping.error == CIDR_ERROR
+
+
+def test_add_checks_overlaps_before_any_reservation(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+    metadata_management.add("ip_reservation#account01", "10.0.0.0/24", "")
+
+    actual = Metadata(mock_json_file, local_pool="10.0.0.0/16").add(
+        "ip_reservation#account02", "10.0.0.0/25", ""
+    )
+
+    assert actual.error == CIDR_ERROR
+
+
+def test_add_gives_back_cidrs_it_did_not_keep(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/23")
+    metadata_management.add("ip_reservation#account01", "10.0.0.0/24", "")
+    metadata_management.add("ip_reservation#account01", "10.0.1.0/24", "")
+    with patch.object(
+        metadata_management._db_handler,
+        "put_record",
+        return_value=DBResponse({}, DB_WRITE_ERROR),
+    ):
+        failed = metadata_management.add(
+            "ip_reservation#account02", "10.0.0.0/24", ""
+        )
+
+    actual = metadata_management.add(
+        "ip_reservation#account03", "10.0.0.0/24", ""
+    )
+
+    assert failed.error == DB_WRITE_ERROR
+    assert actual.error == SUCCESS  # Neither replaced nor failed is held
+    assert metadata_management.stats().pools == {"10.0.0.0/23": (512, 512)}
+
+
+def test_allocator_sees_reservations_of_other_processes(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+    other = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+    metadata_management.reserve_ipv4_network("account01", sync=False)
+
+    other.add("ip_reservation#account02", "10.0.1.0/24", "")
+    actual = metadata_management.reserve_ipv4_network("account03", sync=False)
+
+    assert actual.metadata["ip_reservation#account03"]["Value"] == (
+        "10.0.2.0/24"
+    )
+    overlapping = metadata_management.add(
+        "ip_reservation#account04", "10.0.1.0/25", ""
+    )
+    assert overlapping.error == CIDR_ERROR
+
+
+def test_reserve_ipv4_network_syncs_local_cidr(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/16")
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        actual = metadata_management.reserve_ipv4_network("account01")
+
+    allocate_cidr = pool.return_value.from_existing.return_value.allocate_cidr
+    allocate_cidr.assert_called_once_with(
+        24, "account01", cidr="10.0.0.0/24", client_token=ANY
+    )
+    assert actual.error == SUCCESS
+
+
+def test_reserve_ipv4_networks_partial_failure(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+    cidrs = {"account01": "10.0.1.0/24", "account03": "10.0.3.0/24"}
+
+    def request_cidr(mask_bits, host, cidr=None, client_token=None):
+        if host not in cidrs:
+            raise RuntimeError("pool exhausted")
+        return cidrs[host]
+
+    with mock.patch("metadata_management.manager.Pool") as pool, patch.object(
+        metadata_management._db_handler,
+        "write_metadata",
+        wraps=metadata_management._db_handler.write_metadata,
+    ) as write_metadata:
+        pool.return_value.from_existing.return_value.request_cidr = (
+            request_cidr
+        )
+        actual = metadata_management.reserve_ipv4_networks(
+            ["account01", "account02", "account03", "account01"]
+        )
+
+    pool.return_value.from_existing.assert_called_once_with(
+        None, None, False
+    )
+    assert write_metadata.call_count == 2  # The journal, then the results
+    assert {
+        title: record["Value"] for title, record in actual.metadata.items()
+    } == {
+        "ip_reservation#account01": "10.0.1.0/24",
+        "ip_reservation#account03": "10.0.3.0/24",
+    }
+    assert actual.errors == [
+        (2, "account02: pool exhausted"),
+        (4, "account01: duplicate host"),
+    ]
+    assert actual.error == SUCCESS
+
+
+def test_reserve_ipv4_networks_offline(mock_json_file):
+    metadata_management = Metadata(mock_json_file, local_pool="10.0.0.0/22")
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        actual = metadata_management.reserve_ipv4_networks(
+            [f"account{i}" for i in range(5)], sync=False
+        )
+
+    pool.assert_not_called()
+    assert len(actual.metadata) == 4
+    assert actual.errors == [(5, "account4: no free /24 in 10.0.0.0/22")]
+
+
+def test_reserve_ipv4_network_retry_is_idempotent(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        pool.return_value.from_existing.return_value.allocate_cidr = Mock(
+            side_effect=RuntimeError("connection reset")
+        )
+        with pytest.raises(RuntimeError):
+            metadata_management.reserve_ipv4_network("account01")
+        pending = metadata_management.get_metadata(
+            "pending_reservation#account01"
+        )
+        pool.return_value.from_existing.return_value = Mock(
+            Cidr="10.0.1.0/24"
+        )
+        first = metadata_management.reserve_ipv4_network("account01")
+        second = metadata_management.reserve_ipv4_network("account01")
+
+    allocate_cidr = pool.return_value.from_existing.return_value.allocate_cidr
+    allocate_cidr.assert_called_once_with(
+        24,
+        "account01",
+        client_token=pending["pending_reservation#account01"]["Comment"],
+    )
+    assert first == second
+    assert list(metadata_management.get_metadata()) == [
+        "ip_reservation#account01"
+    ]
+
+
+def test_recover_pending_reservations(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+    metadata_management._begin_reservations(
+        {"account01": "/24", "account02": "/24", "account03": "/24"}
+    )
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        pool.return_value.from_existing.return_value.iter_allocations = Mock(
+            return_value=[
+                {"Cidr": "10.0.1.0/24", "Description": "account01"},
+                {"Cidr": "10.0.3.0/24", "Description": "account03"},
+                {"Cidr": "10.0.4.0/24", "Description": "account03"},
+                {"Cidr": "10.0.9.0/24", "Description": "other"},
+            ]
+        )
+        actual = metadata_management.recover()
+
+    assert actual.recovered == {"ip_reservation#account01": "10.0.1.0/24"}
+    assert actual.dropped == ["account02"]
+    assert actual.errors == ["account03: 2 allocations found"]
+    assert actual.error == SUCCESS
+    assert sorted(metadata_management.get_metadata()) == [
+        "ip_reservation#account01",
+        "pending_reservation#account03",
+    ]
@@ -0,0 +1,149 @@
+import urllib.request
+from unittest import mock
+
+import pytest
+
+from metadata_management import cli, metrics, profiling
+from metadata_management.allocator import CidrAllocator
+from metadata_management.database import (
+    SHARDED_BACKEND,
+    SQLITE_BACKEND,
+    init_database,
+)
+from metadata_management.manager import Metadata, StoreStats
+from metadata_management.server import serve_metrics
+from tests.test_cli import runner
+
+
+@pytest.fixture(autouse=True)
+def stop_metrics():
+    yield
+    metrics.stop()
+
+
+def _samples(text):
+    return dict(
+        line.rsplit(" ", 1) for line in text.splitlines() if line[0] != "#"
+    )
+
+
+@pytest.mark.parametrize("backend", [None, SQLITE_BACKEND])
+def test_stats_count_rows(tmp_path, mock_json_file, backend):
+    if backend is None:
+        manager = Metadata(mock_json_file)
+    else:
+        db_path = tmp_path / "metadata.sqlite"
+        init_database(db_path, backend)
+        manager = Metadata(db_path, backend)
+    manager.add("account01", "foo", "")
+    manager.add("account02", "bar", "")
+    manager.set_inactive("account01")
+
+    actual = manager.stats()
+
+    assert (actual.rows, actual.inactive_rows) == (2, 1)
+    assert actual.size_bytes > 0
+    assert actual.pools == {}
+
+
+def test_pool_utilisation_is_kept_up_to_date(mock_json_file):
+    manager = Metadata(mock_json_file, local_pool="10.0.0.0/22")
+    manager.add("ip_reservation#account01", "10.0.0.0/24", "")
+
+    assert manager.stats().pools == {"10.0.0.0/22": (256, 1024)}
+    with mock.patch.object(CidrAllocator, "from_metadata") as from_metadata:
+        manager.reserve_ipv4_network("account02", sync=False)
+        manager.set_inactive("ip_reservation#account01")
+        actual = manager.stats().pools
+
+    from_metadata.assert_not_called()  # No scan after the first one
+    assert actual == {"10.0.0.0/22": (256, 1024)}
+
+
+def test_stats_take_no_write_lock_and_build_no_index(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path, SHARDED_BACKEND)
+    Metadata(db_path, SHARDED_BACKEND).add(
+        "ip_reservation#account01", "10.0.0.0/24", ""
+    )
+    manager = Metadata(db_path, SHARDED_BACKEND, local_pool="10.0.0.0/22")
+    handler = manager._db_handler
+
+    with mock.patch.object(
+        handler, "write_lock", side_effect=AssertionError
+    ), mock.patch.object(handler.lock, "acquire", side_effect=AssertionError):
+        actual = manager.stats()
+
+    assert (actual.rows, actual.inactive_rows) == (1, 0)
+    assert actual.pools == {"10.0.0.0/22": (256, 1024)}
+    assert not manager._index.exists()
+
+
+def test_render_exposition_format():
+    metrics.collect()
+
+    @profiling.traced
+    def operation():
+        pass
+
+    operation()
+    operation()
+    text = metrics.render(StoreStats(3, 1, 100, 0.5, {"10.0.0.0/8": (1, 4)}))
+    actual = _samples(text)
+
+    assert "# TYPE metadata_management_rows gauge" in text
+    assert actual['metadata_management_rows{state="active"}'] == "2"
+    assert actual["metadata_management_database_bytes"] == "100"
+    assert actual["metadata_management_lock_wait_seconds_total"] == "0.5"
+    assert actual[
+        'metadata_management_pool_utilisation_ratio{pool="10.0.0.0/8"}'
+    ] == "0.25"
+    name = "metadata_management_operation_duration_seconds"
+    label = 'operation="test_render_exposition_format.<locals>.operation"'
+    assert actual[f"{name}_count{{{label}}}"] == "2"
+    assert actual[f'{name}_bucket{{{label},le="+Inf"}}'] == "2"
+
+
+def test_operations_are_not_timed_until_collected():
+    metrics.collect()
+    metrics.stop()
+
+    assert not profiling.active
+    assert "operation_duration" not in metrics.render(
+        StoreStats(0, 0, 0, 0.0, {})
+    )
+
+
+def test_http_endpoint(mock_json_file):
+    metrics.collect()
+    manager = Metadata(mock_json_file)
+    manager.add("account01", "foo", "")
+    http_server = serve_metrics(manager, 0)
+    host, port = http_server.server_address[:2]
+    url = f"http://127.0.0.1:{port}/metrics"
+    try:
+        with urllib.request.urlopen(url) as response:
+            content_type = response.headers["Content-Type"]
+            actual = _samples(response.read().decode())
+    finally:
+        http_server.shutdown()
+        http_server.server_close()
+
+    assert host == "127.0.0.1"
+    assert content_type == metrics.CONTENT_TYPE
+    assert actual['metadata_management_rows{state="active"}'] == "1"
+    assert actual[
+        "metadata_management_operation_duration_seconds_count"
+        '{operation="Metadata.add"}'
+    ] == "1"
+
+
+def test_metrics_command_writes_textfile(mock_db, tmp_path):
+    output = tmp_path / "metadata.prom"
+
+    result = runner.invoke(cli.app, ["metrics", "--output", str(output)])
+
+    assert result.exit_code == 0
+    assert _samples(output.read_text())[
+        'metadata_management_rows{state="inactive"}'
+    ] == "0"
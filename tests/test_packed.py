@@ -0,0 +1,110 @@
+import json
+
+import pytest
+from typer.testing import CliRunner
+
+from metadata_management import ID_ERROR, JSON_ERROR, SUCCESS, cli
+from metadata_management.database import (
+    PACKED_BACKEND,
+    DatabaseError,
+    DatabaseHandler,
+    MetadataFilter,
+    init_database,
+)
+from metadata_management.packed import PackedDatabaseHandler, PackedFile, pack
+from tests.test_database import RECORD
+
+runner = CliRunner()
+METADATA = {
+    "ip_reservation#account02": RECORD,
+    "account01": {**RECORD, "Comment": "ünïcode \"quoted\""},
+    "ip_reservation#account01": {**RECORD, "inactive": True},
+    "ip_reservation$account03": RECORD,
+}
+
+
+def _handler(tmp_path, metadata=None):
+    db_file = tmp_path / "metadata.pack"
+    init_database(db_file, PACKED_BACKEND)
+    handler = PackedDatabaseHandler(db_file)
+    if metadata is not None:
+        handler.write_metadata(metadata)
+    return handler
+
+
+def test_pack_round_trip(tmp_path):
+    path = tmp_path / "metadata.pack"
+    path.write_bytes(pack(METADATA))
+
+    with PackedFile(path) as packed:
+        assert packed.load() == METADATA
+        assert list(packed.load()) == sorted(METADATA)
+        assert packed.get("account01") == METADATA["account01"]
+        assert packed.get("account00") is None
+        assert packed.get("zzz") is None
+        reservations = packed.iter_prefix("ip_reservation#")
+        assert [title for title, _ in reservations] == [
+            "ip_reservation#account01",
+            "ip_reservation#account02",
+        ]
+
+
+def test_handler(tmp_path):
+    handler = _handler(tmp_path, METADATA)
+
+    handler.put_record("account04", RECORD)
+    handler.delete_record("account01")
+    active = handler.iter_metadata(
+        MetadataFilter(prefix="ip_reservation#", active_only=True)
+    )
+
+    assert [title for title, _ in active] == ["ip_reservation#account02"]
+    assert handler.get_record("account04") == (RECORD, SUCCESS)
+    assert handler.get_record("account01").error == ID_ERROR
+    assert len(handler.read_metadata().metadata) == 4
+
+
+def test_empty_database(tmp_path):
+    handler = _handler(tmp_path)
+
+    assert handler.read_metadata() == ({}, SUCCESS)
+    assert list(handler.iter_metadata()) == []
+
+
+def test_corrupt_file(tmp_path):
+    handler = _handler(tmp_path)
+    (tmp_path / "metadata.pack").write_text("[]")
+
+    assert handler.read_metadata().error == JSON_ERROR
+    assert handler.get_record("account01").error == JSON_ERROR
+    with pytest.raises(DatabaseError):
+        list(handler.iter_metadata())
+
+
+def test_cli_migrate_both_ways(tmp_path):
+    source = tmp_path / "metadata.json"
+    source.write_text(json.dumps(METADATA, indent=4))
+    packed = tmp_path / "metadata.pack"
+    restored = tmp_path / "restored.json"
+
+    to_packed = runner.invoke(
+        cli.app, ["migrate", str(source), str(packed), "-b", "packed"]
+    )
+    to_json = runner.invoke(
+        cli.app,
+        [
+            "migrate",
+            str(packed),
+            str(restored),
+            "--from-backend",
+            "packed",
+            "-b",
+            "json",
+        ],
+    )
+
+    assert to_packed.exit_code == 0, to_packed.stdout
+    assert to_json.exit_code == 0, to_json.stdout
+    assert "4 rows migrated" in to_json.stdout
+    assert packed.stat().st_size < source.stat().st_size
+    assert DatabaseHandler(restored).read_metadata().metadata == METADATA
@@ -0,0 +1,74 @@
+import json
+
+import pytest
+from moto import mock_ec2
+
+from metadata_management import aws, cli, profiling
+from metadata_management.database import DatabaseHandler, init_database
+from tests.test_cli import runner
+
+
+@pytest.fixture(autouse=True)
+def disable_profiling():
+    yield
+    profiling.disable()
+
+
+def _totals():
+    return {total["name"]: total for total in profiling.summary()}
+
+
+def test_nothing_is_recorded_while_disabled(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path)
+    profiling.enable()
+    profiling.disable()
+
+    DatabaseHandler(db_path).put_record("account01", {"Value": "bar"})
+
+    assert profiling.span("anything") is profiling.NULL_SPAN
+    assert profiling.summary() == []
+
+
+def test_storage_spans_count_bytes_and_rows(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path)
+    profiling.enable()
+
+    DatabaseHandler(db_path).put_records({"a": {}, "b": {}})
+    DatabaseHandler(db_path).read_metadata()
+
+    totals = _totals()
+    assert totals["DatabaseHandler.read_metadata"]["calls"] == 2
+    assert totals["DatabaseHandler.write_metadata"]["calls"] == 1
+    assert totals["json.dumps"]["rows"] == 2
+    assert totals["file.write"]["bytes_written"] == db_path.stat().st_size
+    assert totals["file.read"]["bytes_read"] == 2 + db_path.stat().st_size
+
+
+@mock_ec2
+def test_aws_calls_are_timed():
+    profiling.enable()
+
+    aws.get_client(region_name="us-east-1").describe_vpcs()
+
+    assert {"aws.client.ec2", "ec2.DescribeVpcs"} <= set(_totals())
+
+
+def test_cli_profile_and_trace(mock_db, tmp_path):
+    trace = tmp_path / "trace.json"
+
+    result = runner.invoke(
+        cli.app,
+        ["--profile", "--trace", str(trace), "add", "account01", "b", "c"],
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Metadata.add" in result.output
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert [event["name"] for event in events][:3] == [
+        "startup",
+        "cli.add",
+        "Metadata.add",
+    ]
+    assert not profiling.enabled
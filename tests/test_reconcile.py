@@ -0,0 +1,96 @@
+from unittest import mock
+from unittest.mock import Mock, call
+
+from metadata_management.manager import Metadata
+from metadata_management.reconcile import (
+    MISMATCHED,
+    MISSING,
+    ORPHANED,
+    Drift,
+    find_drift,
+    repair,
+)
+
+
+def allocation(host, cidr, resource_type="custom"):
+    return {
+        "Cidr": cidr,
+        "Description": host,
+        "IpamPoolAllocationId": f"alloc-{cidr}",
+        "ResourceType": resource_type,
+    }
+
+
+def test_find_drift():
+    reservations = {
+        "account01": "10.0.1.0/24",
+        "account02": "10.0.2.0/24",
+        "account03": "10.0.3.0/24",
+        "account04": "10.0.4.0/24",
+    }
+    allocations = [
+        allocation("account04", "10.0.14.0/24"),
+        allocation("account01", "10.0.1.0/24"),
+        allocation("account03", "10.0.33.0/24"),
+        allocation("account04", "10.0.4.0/24"),
+        allocation("leaked", "10.0.5.0/24"),
+        allocation("pending", "10.0.6.0/24"),
+        allocation("", "10.1.0.0/16", resource_type="vpc"),
+    ]
+
+    actual = list(find_drift(reservations, allocations, {"pending"}))
+
+    assert actual == [
+        Drift(ORPHANED, "leaked", None, "10.0.5.0/24", "alloc-10.0.5.0/24"),
+        Drift(
+            ORPHANED, "account04", None, "10.0.14.0/24", "alloc-10.0.14.0/24"
+        ),
+        Drift(
+            MISMATCHED,
+            "account03",
+            "10.0.3.0/24",
+            "10.0.33.0/24",
+            "alloc-10.0.33.0/24",
+        ),
+        Drift(MISSING, "account02", "10.0.2.0/24"),
+    ]
+
+
+def test_repair():
+    pool = Mock()
+
+    repair(pool, Drift(MISSING, "account02", "10.0.2.0/24"))
+    repair(pool, Drift(ORPHANED, "leaked", None, "10.0.5.0/24", "alloc-5"))
+    repair(
+        pool,
+        Drift(MISMATCHED, "account03", "10.0.3.0/24", "10.0.33.0/24", "a-33"),
+    )
+
+    assert pool.mock_calls == [
+        call.request_cidr(24, "account02", cidr="10.0.2.0/24"),
+        call.release_allocation("alloc-5", "10.0.5.0/24"),
+        call.release_allocation("a-33", "10.0.33.0/24"),
+        call.request_cidr(24, "account03", cidr="10.0.3.0/24"),
+    ]
+
+
+def test_reconcile_repairs_as_it_goes(mock_json_file):
+    metadata_management = Metadata(mock_json_file)
+    metadata_management.add(
+        "ip_reservation#account01", "10.0.1.0/24", "auto-reserved IP"
+    )
+    metadata_management.add(
+        "ip_reservation#account02", "10.0.2.0/24", "auto-reserved IP"
+    )
+
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        found = pool.return_value.from_existing.return_value
+        found.iter_allocations.return_value = [
+            allocation("account01", "10.0.1.0/24")
+        ]
+        found.request_cidr.side_effect = RuntimeError("already allocated")
+        actual = list(metadata_management.reconcile(repair=True))
+
+    assert actual == [
+        (Drift(MISSING, "account02", "10.0.2.0/24"), "already allocated")
+    ]
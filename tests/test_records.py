@@ -0,0 +1,81 @@
+import tracemalloc
+
+import pytest
+
+from metadata_management.records import MetadataRecord, from_epoch, to_epoch
+from tests.test_database import RECORD
+
+
+def test_round_trip():
+    record = {**RECORD, "Extra": 1}
+
+    actual = MetadataRecord.from_dict(record)
+
+    assert isinstance(actual.assigned_date, int)
+    assert actual.to_dict() == record
+
+
+@pytest.mark.parametrize(
+    "record",
+    [{"Value": "10.0.0.0/24"}, {**RECORD, "inactive": "false"}, {}],
+)
+def test_round_trip_keeps_fields_as_given(record):
+    assert MetadataRecord.from_dict(record).to_dict() == record
+
+
+@pytest.mark.parametrize(
+    "assigned_date",
+    [
+        "2022-02-17T16:11:29.093288",
+        "2022-02-17T16:11:29",
+        "1969-12-31T23:59:59.999999",
+    ],
+)
+def test_epoch_round_trip(assigned_date):
+    assert from_epoch(to_epoch(assigned_date)) == assigned_date
+
+
+@pytest.mark.parametrize(
+    "assigned_date", ["yesterday", "2022-02-17T16:11:29+02:00", None]
+)
+def test_unparseable_dates_are_kept(assigned_date):
+    assert to_epoch(assigned_date) == assigned_date
+
+
+@pytest.mark.parametrize("assigned_date", [1645114289, 1645114289.093288])
+def test_numeric_dates_are_kept(assigned_date):
+    record = {**RECORD, "AssignedDateUTC": assigned_date}
+
+    actual = MetadataRecord.from_dict(record)
+
+    assert list(actual.to_dict().items()) == list(record.items())
+    assert actual != MetadataRecord.from_dict(RECORD)
+
+
+def test_records_are_not_hashable():
+    with pytest.raises(TypeError):
+        hash(MetadataRecord.from_dict(RECORD))
+
+
+def test_repeated_strings_are_shared():
+    first = MetadataRecord.from_dict({**RECORD, "Comment": "".join("ab")})
+    second = MetadataRecord.from_dict({**RECORD, "Comment": "".join("ab")})
+
+    assert first.comment is second.comment
+
+
+def test_records_use_less_memory_than_dicts():
+    def measure(convert):
+        tracemalloc.start()
+        try:
+            store = [
+                convert({**RECORD, "Value": f"10.0.{i >> 8}.{i & 255}/32"})
+                for i in range(5000)
+            ]
+            current, _peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        assert len(store) == 5000
+        return current
+
+    assert measure(MetadataRecord.from_dict) < measure(dict) * 0.75
@@ -0,0 +1,275 @@
+import stat
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from metadata_management import ID_ERROR, SUCCESS, cli, metrics
+from metadata_management.database import (
+    JSON_BACKEND,
+    SQLITE_BACKEND,
+    CachedDatabaseHandler,
+    DatabaseError,
+    DatabaseHandler,
+)
+from metadata_management.manager import Metadata
+from metadata_management import server as server_module
+from metadata_management.server import (
+    NO_SERVER_ENV,
+    MetadataServer,
+    RemoteMetadata,
+    ServerError,
+    connect,
+)
+from tests.conftest import TEST_DB
+from tests.test_cli import runner
+
+
+@contextmanager
+def _serve(socket_path, db_path):
+    metadata_server = MetadataServer(
+        socket_path, Metadata(db_path, resident=True)
+    )
+    thread = threading.Thread(target=metadata_server.serve_forever)
+    thread.start()
+    try:
+        yield socket_path
+    finally:
+        metadata_server.shutdown()
+        metadata_server.server_close()
+        thread.join()
+
+
+@pytest.fixture
+def server(tmp_path, mock_json_file):
+    with _serve(tmp_path / "server.sock", mock_json_file) as socket_path:
+        yield socket_path
+
+
+@pytest.fixture
+def cli_server(tmp_path, mock_db):
+    """A server of the database the CLI is configured with."""
+    with _serve(tmp_path / "server.sock", Path(TEST_DB)) as socket_path:
+        with mock.patch.object(
+            cli.config, "get_socket_path", return_value=socket_path
+        ):
+            yield socket_path
+
+
+def test_remote_metadata_round_trip(server):
+    client = RemoteMetadata(server)
+
+    added = client.add("account01", "bar", "baz")
+    client.set_inactive("account01")
+
+    assert added.error == SUCCESS
+    assert client.get_metadata("account01")["account01"]["inactive"]
+    assert [title for title, _ in client.iter_metadata()] == ["account01"]
+    assert client.lookup("bar") == ["account01"]
+    assert list(client.find(inactive=False)) == []
+    assert client.remove("account01").metadata["Value"] == "bar"
+    assert client.remove("account01").error == ID_ERROR
+    client.close()
+
+
+def test_listings_come_in_pages(server, monkeypatch):
+    monkeypatch.setattr(server_module, "PAGE_SIZE", 2)
+    client = RemoteMetadata(server)
+    for i in range(5):
+        client.add(f"account{i}", "bar", "")
+
+    with mock.patch.object(client, "call", wraps=client.call) as call:
+        listed = [title for title, _ in client.iter_metadata()]
+        limited = [
+            title for title, _ in client.iter_metadata(limit=3, offset=1)
+        ]
+        found = [title for title, _ in client.find(value="bar")]
+
+    assert listed == found == [f"account{i}" for i in range(5)]
+    assert limited == ["account1", "account2", "account3"]
+    assert [kwargs["limit"] for _, kwargs in call.call_args_list] == [
+        *[2, 2, 2],
+        *[2, 1],
+        *[2, 2, 2],
+    ]
+    client.close()
+
+
+def test_pages_resume_the_listing(server, monkeypatch):
+    monkeypatch.setattr(server_module, "PAGE_SIZE", 2)
+    client, other = RemoteMetadata(server), RemoteMetadata(server)
+    for i in range(7):
+        client.add(f"account{i}", "bar", "")
+    visited = []
+    iter_metadata = CachedDatabaseHandler.iter_metadata
+
+    def counting_iter_metadata(self, where=None):
+        for title, record in iter_metadata(self, where):
+            visited.append(title)
+            yield title, record
+
+    monkeypatch.setattr(
+        CachedDatabaseHandler, "iter_metadata", counting_iter_metadata
+    )
+    listed = [title for title, _ in client.iter_metadata()]
+    limited = [title for title, _ in other.iter_metadata(limit=2, offset=4)]
+
+    assert listed == [f"account{i}" for i in range(7)]
+    assert limited == ["account4", "account5"]
+    assert len(visited) == 7 + 6  # Each row once, then offset 4 skipped once
+    client.close()
+    other.close()
+
+
+def test_remote_metadata_has_a_timeout(server):
+    client = RemoteMetadata(server)
+
+    assert client._socket.gettimeout() == server_module.DEFAULT_TIMEOUT
+    client.close()
+
+
+def test_remote_metadata_batch(server):
+    client = RemoteMetadata(server)
+
+    actual = client.batch(
+        [
+            ("add", {"metadata_title": "account01", "metadata_value": "1"}),
+            (
+                "add",
+                {
+                    "metadata_title": "account02",
+                    "metadata_value": "2",
+                    "comment": "",
+                },
+            ),
+            ("drop_database", {}),
+        ]
+    )
+
+    assert isinstance(actual[0], ServerError)  # comment is required
+    assert actual[1] == [{"account02": mock.ANY}, SUCCESS]
+    assert str(actual[2]) == "unknown method"
+    client.close()
+
+
+def test_lookups_do_not_wait_for_reservations(server):
+    started, release = threading.Event(), threading.Event()
+
+    def allocate_cidr(*args, **kwargs):
+        started.set()
+        release.wait(timeout=5)
+
+    reserving = RemoteMetadata(server)
+    client = RemoteMetadata(server, timeout=1)
+    client.add("account01", "10.1.0.0/24", "")
+    with mock.patch("metadata_management.manager.Pool") as pool:
+        found = pool.return_value.from_existing.return_value
+        found.allocate_cidr, found.Cidr = allocate_cidr, "10.0.0.0/24"
+        thread = threading.Thread(
+            target=reserving.reserve_ipv4_network, args=("account02",)
+        )
+        thread.start()
+        assert started.wait(timeout=5)
+        try:
+            actual = client.lookup("10.1.0.0/24")
+        finally:
+            release.set()
+            thread.join()
+
+    assert actual == ["account01"]
+    client.close()
+    reserving.close()
+
+
+def test_resident_database_sees_other_writers(server, mock_json_file):
+    client = RemoteMetadata(server)
+    client.add("account01", "bar", "baz")
+
+    DatabaseHandler(mock_json_file).put_record("account02", {"Value": "2"})
+
+    assert sorted(client.get_metadata()) == ["account01", "account02"]
+    mock_json_file.write_text("{")
+    with pytest.raises(DatabaseError):
+        list(client.iter_metadata())
+    client.close()
+
+
+def test_serve_binds_socket_for_owner_only(tmp_path, mock_json_file):
+    socket_path = tmp_path / "server.sock"
+    modes = []
+
+    def serve_forever(self):
+        modes.append(stat.S_IMODE(socket_path.stat().st_mode))
+
+    with mock.patch.object(MetadataServer, "serve_forever", serve_forever):
+        server_module.serve(socket_path, Metadata(mock_json_file))
+    metrics.stop()
+
+    assert modes == [0o600]
+    assert not socket_path.exists()
+
+
+def test_connect(server, monkeypatch):
+    client = connect(server)
+    assert isinstance(client, RemoteMetadata)
+    client.close()
+    assert connect(server.with_name("missing.sock")) is None
+    monkeypatch.setenv(NO_SERVER_ENV, "1")
+    assert connect(server) is None
+
+
+def test_connect_checks_the_served_database(server, mock_json_file):
+    client = connect(server, mock_json_file, JSON_BACKEND)
+    assert isinstance(client, RemoteMetadata)
+    client.close()
+
+    assert connect(server, mock_json_file, SQLITE_BACKEND) is None
+    other = server.with_name("other.json")
+    assert connect(server, other, JSON_BACKEND) is None
+
+
+def test_params_are_checked_against_the_method(server):
+    client = RemoteMetadata(server)
+
+    actual = client.batch(
+        [
+            ("lookup", {"value": "bar", "drop": True}),
+            ("find", {"limit": 1, "drop": True}),
+            ("lookup", {"value": "bar"}),
+        ]
+    )
+
+    assert "unexpected keyword argument 'drop'" in str(actual[0])
+    assert "unexpected keyword argument 'drop'" in str(actual[1])
+    assert actual[2] == []
+    client.close()
+
+
+def test_cli_uses_running_server(cli_server):
+    with mock.patch.object(cli, "Metadata") as metadata:
+        result = runner.invoke(cli.app, ["add", "account01", "bar", "baz"])
+
+    assert result.exit_code == 0, result.output
+    metadata.assert_not_called()
+
+
+def test_cli_ignores_server_of_another_database(mock_db, server):
+    with mock.patch.object(
+        cli.config, "get_socket_path", return_value=server
+    ), mock.patch.object(cli, "Metadata") as metadata:
+        runner.invoke(cli.app, ["add", "account01", "bar", "baz"])
+
+    metadata.assert_called_once()
+
+
+def test_cli_reports_server_failures(cli_server):
+    with mock.patch.dict(
+        server_module.METHODS,
+        lookup=mock.Mock(side_effect=RuntimeError("boom")),
+    ):
+        result = runner.invoke(cli.app, ["lookup", "bar"])
+
+    assert result.exit_code == 1
+    assert "RuntimeError: boom" in result.stdout
@@ -0,0 +1,206 @@
+import json
+import multiprocessing
+from unittest import mock
+
+import pytest
+
+from metadata_management import DB_LOCK_ERROR, ID_ERROR, SUCCESS, cli
+from metadata_management.database import (
+    SHARDED_BACKEND,
+    MetadataFilter,
+    init_database,
+    migrate_database,
+    open_database,
+)
+from metadata_management.manager import Metadata
+from metadata_management.sharded import (
+    DEFAULT_SHARDS,
+    ShardedDatabaseHandler,
+    get_shard_path,
+    shard_of,
+)
+from tests.test_cli import runner
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path, SHARDED_BACKEND)
+    return db_path
+
+
+def _titles(count):
+    return [f"ip_reservation#account{i:02}" for i in range(count)]
+
+
+def test_records_are_spread_over_shards(db_path):
+    db_handler = ShardedDatabaseHandler(db_path)
+    titles = _titles(20)
+
+    db_handler.put_records({title: {"Value": title} for title in titles})
+
+    assert db_handler.count() == DEFAULT_SHARDS
+    assert dict(db_handler.iter_metadata()) == {
+        title: {"Value": title} for title in titles
+    }
+    title = titles[0]
+    shard = get_shard_path(db_path, shard_of(title, 8), 8)
+    assert title in shard.read_text()
+    assert db_handler.get_record(title).metadata == {"Value": title}
+    assert db_handler.get_record("missing").error == ID_ERROR
+
+
+def test_mutation_rewrites_one_shard(db_path):
+    db_handler = ShardedDatabaseHandler(db_path)
+    db_handler.put_records({title: {"Value": "1"} for title in _titles(20)})
+    before = {path: path.stat().st_ino for path in db_handler.files()[1:]}
+
+    db_handler.update_record(_titles(1)[0], {"inactive": True})
+
+    changed = [
+        path for path, inode in before.items() if path.stat().st_ino != inode
+    ]
+    assert changed == [get_shard_path(db_path, shard_of(_titles(1)[0], 8), 8)]
+
+
+def test_writers_of_other_shards_do_not_wait(db_path):
+    first, second = "account01", "account02"
+    assert shard_of(first, 8) != shard_of(second, 8)
+    other = ShardedDatabaseHandler(db_path)
+    db_handler = ShardedDatabaseHandler(db_path, lock_timeout=0)
+    with other._locked([first]):
+        blocked = db_handler.put_record(first, {"Value": "1"})
+        written = db_handler.put_record(second, {"Value": "2"})
+
+    assert blocked.error == DB_LOCK_ERROR
+    assert written.error == SUCCESS
+
+
+def test_iter_metadata_filters_every_shard(db_path):
+    db_handler = ShardedDatabaseHandler(db_path, workers=2)
+    db_handler.put_records(
+        {
+            **{title: {"Value": "1"} for title in _titles(10)},
+            "account01": {"Value": "2", "inactive": True},
+        }
+    )
+
+    actual = db_handler.iter_metadata(
+        MetadataFilter(prefix="ip_reservation#", active_only=True)
+    )
+
+    assert sorted(title for title, _ in actual) == _titles(10)
+    assert next(db_handler.iter_metadata())  # Stopping early is fine
+
+
+def test_reshard_keeps_records(db_path):
+    db_handler = ShardedDatabaseHandler(db_path)
+    stale = ShardedDatabaseHandler(db_path)
+    stale.get_record("anything")  # Caches the handlers of 8 shards
+    records = {title: {"Value": title} for title in _titles(30)}
+    db_handler.put_records(records)
+
+    assert db_handler.reshard(3) == SUCCESS
+    stale.put_record("account99", {"Value": "99"})
+    stale.delete_record(_titles(1)[0])
+
+    assert db_handler.count() == 3
+    assert not get_shard_path(db_path, 0, 8).exists()
+    assert len(db_handler.files()) == 4
+    records.pop(_titles(1)[0])
+    assert db_handler.read_metadata().metadata == {
+        **records,
+        "account99": {"Value": "99"},
+    }
+
+
+def test_reshard_and_back_is_noticed_by_writers(db_path):
+    db_handler = ShardedDatabaseHandler(db_path)
+    other = ShardedDatabaseHandler(db_path)
+    assert other.reshard(3) == SUCCESS
+    assert other.reshard(DEFAULT_SHARDS) == SUCCESS
+    assert json.loads(db_path.read_text())["generation"] == 2
+    manifests = [(DEFAULT_SHARDS, 0), *[(DEFAULT_SHARDS, 2)] * 3]
+
+    with mock.patch.object(
+        db_handler, "_manifest", side_effect=manifests
+    ) as manifest:
+        with db_handler._locked(["account01"]) as (count, shards):
+            pass
+
+    assert manifest.call_count == 4  # The first lock file may be unlinked
+    assert count == DEFAULT_SHARDS and len(shards) == 1
+
+
+def test_manager_and_index_on_shards(db_path):
+    manager = Metadata(db_path, SHARDED_BACKEND)
+    manager.add("account01", "bar", "")
+    assert manager.lookup("bar") == ["account01"]
+
+    ShardedDatabaseHandler(db_path).reshard(2)
+    open_database(db_path, SHARDED_BACKEND).put_record(
+        "account02", {"Value": "bar"}
+    )
+
+    assert sorted(manager.lookup("bar")) == ["account01", "account02"]
+
+
+def test_indexed_writers_of_other_shards_do_not_wait(db_path):
+    first, second = "account01", "account02"
+    Metadata(db_path, SHARDED_BACKEND).lookup("bar")  # Builds the index
+    writer = Metadata(db_path, SHARDED_BACKEND)
+    manager = Metadata(db_path, SHARDED_BACKEND, lock_timeout=0)
+    with writer._indexed([first]) as update_index:
+        blocked = manager.add(first, "bar", "")
+        written = manager.add(second, "bar", "")
+
+    assert update_index is not None
+    assert blocked.error == DB_LOCK_ERROR
+    assert written.error == SUCCESS
+    assert manager._index.is_fresh()
+    assert manager.lookup("bar") == [second]
+
+
+def _add_rows(db_path, writer, rows):
+    manager = Metadata(db_path, SHARDED_BACKEND)
+    for row in range(rows):
+        assert manager.add(f"writer{writer}#{row}", "bar", "").error == 0
+
+
+def test_parallel_indexed_writers_keep_the_index_fresh(db_path):
+    manager = Metadata(db_path, SHARDED_BACKEND)
+    manager.lookup("bar")  # Builds the index
+    context = multiprocessing.get_context("fork")
+    writers = [
+        context.Process(target=_add_rows, args=(db_path, i, 20))
+        for i in range(4)
+    ]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert [writer.exitcode for writer in writers] == [0, 0, 0, 0]
+    assert manager._index.is_fresh()  # Kept up to date, not rebuilt
+    assert len(manager.lookup("bar")) == 80
+
+
+def test_migrate_to_shards(tmp_path, db_path):
+    source = tmp_path / "source.json"
+    init_database(source)
+    open_database(source).put_records({"a": {}, "b": {}})
+
+    actual = migrate_database(
+        open_database(source), open_database(db_path, SHARDED_BACKEND)
+    )
+
+    assert actual == (2, SUCCESS)
+    read = open_database(db_path, SHARDED_BACKEND).read_metadata()
+    assert read.metadata == {"a": {}, "b": {}}
+
+
+def test_cli_reshard_needs_sharded_backend(mock_db):
+    result = runner.invoke(cli.app, ["reshard", "4"])
+
+    assert result.exit_code == 1
+    assert "sharded" in result.stdout
@@ -0,0 +1,142 @@
+import sys
+
+import boto3
+import pytest
+from moto import mock_s3
+
+from metadata_management import SUCCESS, cli
+from metadata_management.database import BACKENDS, init_database
+from metadata_management.manager import Metadata
+from metadata_management.snapshot import (
+    FULL,
+    INCREMENTAL,
+    SnapshotError,
+    _upload,
+    get_state_path,
+    read_snapshots,
+)
+from tests.test_cli import runner
+
+
+@pytest.fixture(params=BACKENDS)
+def manager(request, tmp_path):
+    db_path = tmp_path / "metadata.json"
+    init_database(db_path, request.param)
+    manager = Metadata(db_path, request.param)
+    manager.add("account01", "bar", "")
+    manager.add("account02", "baz", "")
+    return manager
+
+
+def test_incremental_snapshots_restore_database(manager, tmp_path):
+    destination = tmp_path / "snapshots"
+
+    first = manager.snapshot(str(destination), incremental=True)
+    manager.set_inactive("account01")
+    manager.remove("account02")
+    manager.add("account03", "bap", "")
+    second = manager.snapshot(str(destination), incremental=True)
+    unchanged = manager.snapshot(str(destination), incremental=True)
+
+    assert (first.sequence, first.kind, first.changes) == (1, FULL, 2)
+    assert (second.sequence, second.kind) == (2, INCREMENTAL)
+    assert second.changes == 3
+    assert unchanged.error == SUCCESS and unchanged.location is None
+    assert sorted(path.name for path in destination.iterdir()) == [
+        "metadata.json.00000001.full.jsonl.gz",
+        "metadata.json.00000002.incremental.jsonl.gz",
+    ]
+    restored = read_snapshots(sorted(destination.iterdir()))
+    assert restored == manager.get_metadata()
+
+
+def test_new_destination_starts_with_full_snapshot(manager, tmp_path):
+    manager.snapshot(str(tmp_path / "first"))
+
+    result = manager.snapshot(str(tmp_path / "second"), incremental=True)
+
+    assert (result.sequence, result.kind, result.changes) == (2, FULL, 2)
+
+
+def test_sequence_follows_the_destination(manager, tmp_path):
+    destination = tmp_path / "snapshots"
+    manager.snapshot(str(destination))
+    get_state_path(tmp_path / "metadata.json").unlink()
+
+    result = manager.snapshot(str(destination), incremental=True)
+
+    assert (result.sequence, result.kind) == (2, FULL)
+    assert len(list(destination.iterdir())) == 2
+
+
+def test_existing_snapshot_is_not_overwritten(manager, tmp_path):
+    staged = tmp_path / "staged.gz"
+    staged.write_bytes(b"new")
+    existing = tmp_path / "metadata.json.00000001.full.jsonl.gz"
+    existing.write_bytes(b"old")
+
+    with pytest.raises(SnapshotError):
+        _upload(staged, str(tmp_path), existing.name)
+
+    assert existing.read_bytes() == b"old"
+
+
+def test_zstd_needs_zstandard(manager, tmp_path, monkeypatch):
+    monkeypatch.setitem(sys.modules, "zstandard", None)
+
+    with pytest.raises(SnapshotError):
+        manager.snapshot(str(tmp_path / "snapshots"), compression="zstd")
+
+
+@mock_s3
+def test_snapshot_to_s3(manager):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="backups")
+
+    result = manager.snapshot("s3://backups/metadata/", incremental=True)
+
+    assert result.location == (
+        "s3://backups/metadata/metadata.json.00000001.full.jsonl.gz"
+    )
+    listed = s3.list_objects_v2(Bucket="backups")["Contents"]
+    assert [item["Key"] for item in listed] == [
+        "metadata/metadata.json.00000001.full.jsonl.gz"
+    ]
+    assert listed[0]["Size"] == result.size
+
+
+@mock_s3
+def test_s3_sequence_follows_existing_objects(manager):
+    s3 = boto3.client("s3", region_name="us-east-1")
+    s3.create_bucket(Bucket="backups")
+    s3.put_object(
+        Bucket="backups",
+        Key="metadata/metadata.json.00000007.full.jsonl.gz",
+        Body=b"",
+    )
+
+    result = manager.snapshot("s3://backups/metadata", incremental=True)
+
+    assert (result.sequence, result.kind) == (8, FULL)
+
+
+@mock_s3
+def test_failed_upload_keeps_previous_state(manager, tmp_path):
+    with pytest.raises(Exception):
+        manager.snapshot("s3://missing-bucket")
+
+    assert not get_state_path(tmp_path / "metadata.json").exists()
+    assert not list(tmp_path.glob("*.gz*"))  # Staged file removed
+
+
+def test_cli_snapshot(mock_db, tmp_path):
+    runner.invoke(cli.app, ["add", "account01", "bar", "baz"])
+
+    result = runner.invoke(cli.app, ["snapshot", str(tmp_path)])
+    again = runner.invoke(
+        cli.app, ["snapshot", str(tmp_path), "--incremental"]
+    )
+
+    assert result.exit_code == 0, result.output
+    assert "Snapshot 1 (full, 1 rows" in result.output
+    assert "No changes since snapshot 1" in again.output
@@ -0,0 +1,143 @@
+import json
+import sqlite3
+
+import pytest
+from typer.testing import CliRunner
+
+from metadata_management import ID_ERROR, SUCCESS, cli, config
+from metadata_management.database import (
+    SQLITE_BACKEND,
+    MetadataFilter,
+    init_database,
+)
+from metadata_management.manager import Metadata
+from metadata_management.sqlite import SQLiteDatabaseHandler
+from tests.test_database import RECORD
+
+runner = CliRunner()
+
+
+def _handler(tmp_path):
+    db_file = tmp_path / "metadata.db"
+    init_database(db_file, SQLITE_BACKEND)
+    return SQLiteDatabaseHandler(db_file)
+
+
+def test_schema_uses_wal_and_indexes(tmp_path):
+    handler = _handler(tmp_path)
+    connection = handler.connection
+
+    journal_mode = connection.execute("PRAGMA journal_mode").fetchone()
+    indexes = {
+        row[1] for row in connection.execute("PRAGMA index_list(metadata)")
+    }
+
+    assert journal_mode == ("wal",)
+    assert {
+        "metadata_inactive",
+        "metadata_assigned_by",
+        "metadata_assigned_date",
+        "metadata_value",
+    } <= indexes
+
+
+def test_single_row_operations(tmp_path):
+    handler = _handler(tmp_path)
+
+    assert handler.put_record("account01", RECORD).error == SUCCESS
+    assert handler.get_record("account01") == (RECORD, SUCCESS)
+    assert handler.update_record("account01", {"inactive": True}) == (
+        {**RECORD, "inactive": True},
+        SUCCESS,
+    )
+    assert handler.delete_record("account01").error == SUCCESS
+    assert handler.get_record("account01").error == ID_ERROR
+    assert handler.delete_record("account01").error == ID_ERROR
+
+
+def test_metadata_get_single_entry(tmp_path):
+    db_file = tmp_path / "metadata.db"
+    init_database(db_file, SQLITE_BACKEND)
+    metadata = Metadata(db_file, SQLITE_BACKEND)
+    metadata.add("account01", "bar", "baz")
+
+    assert list(metadata.get_metadata("account01")) == ["account01"]
+    assert metadata.get_metadata("account02") == {}
+
+
+def test_cli_migrate(tmp_path):
+    source = tmp_path / "metadata.json"
+    target = tmp_path / "metadata.db"
+    source.write_text(
+        json.dumps({f"account{i:02}": RECORD for i in range(25)})
+    )
+
+    result = runner.invoke(
+        cli.app,
+        ["migrate", str(source), str(target), "--batch-size", "10"],
+    )
+
+    assert result.exit_code == 0, result.stdout
+    assert "25 rows migrated" in result.stdout
+    read = SQLiteDatabaseHandler(target).read_metadata()
+    assert len(read.metadata) == 25
+
+
+def test_cli_migrate_switch_keeps_other_settings(tmp_path, monkeypatch):
+    config_file = tmp_path / "config.ini"
+    config_file.write_text(
+        "[General]\ndatabase = old.json\narchive_after_days = 30\n\n"
+        "[IPAM]\ncidr = 10.0.0.0/8\n"
+    )
+    monkeypatch.setattr(config, "CONFIG_DIR_PATH", tmp_path)
+    monkeypatch.setattr(config, "CONFIG_FILE_PATH", config_file)
+    source = tmp_path / "metadata.json"
+    source.write_text(json.dumps({"account01": RECORD}))
+    target = tmp_path / "metadata.db"
+
+    result = runner.invoke(
+        cli.app, ["migrate", str(source), str(target), "--switch"]
+    )
+
+    assert result.exit_code == 0, result.stdout
+    assert config.get_local_pool(config_file) == "10.0.0.0/8"
+    assert config.get_archive_after(config_file).days == 30
+    assert f"database = {target}" in config_file.read_text()
+    assert f"backend = {SQLITE_BACKEND}" in config_file.read_text()
+
+
+def test_failed_commit_is_rolled_back(tmp_path):
+    handler = _handler(tmp_path)
+    handler.connection.executescript(
+        "PRAGMA foreign_keys=ON;"
+        "CREATE TABLE parent (id INTEGER PRIMARY KEY);"
+        "CREATE TABLE child (parent INTEGER REFERENCES parent"
+        " DEFERRABLE INITIALLY DEFERRED);"
+    )
+
+    with pytest.raises(sqlite3.IntegrityError):  # Raised by COMMIT
+        with handler._write() as connection:
+            connection.execute("INSERT INTO child VALUES (1)")
+
+    assert not handler.connection.in_transaction
+    assert handler.put_record("account01", RECORD).error == SUCCESS
+
+
+def test_filtered_iteration(tmp_path):
+    handler = _handler(tmp_path)
+    handler.put_records(
+        {
+            "ip_reservation#account01": {**RECORD, "inactive": True},
+            "ip_reservation#account02": RECORD,
+            "ip_reservation$account03": RECORD,
+            "account04": {**RECORD, "AssignedBy": "someone"},
+        }
+    )
+
+    actual = handler.iter_metadata(
+        MetadataFilter(prefix="ip_reservation#", active_only=True)
+    )
+    by_user = handler.iter_metadata(MetadataFilter(assigned_by="someone"))
+
+    assert [title for title, _ in actual] == ["ip_reservation#account02"]
+    assert [title for title, _ in by_user] == ["account04"]
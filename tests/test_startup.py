@@ -0,0 +1,53 @@
+import os
+import subprocess
+import sys
+
+AWS_MODULES = ("boto3", "botocore", "asyncio")
+# Only needed by the SQLite backend and the index of the others.
+SQLITE_MODULES = ("sqlite3", "metadata_management.sqlite")
+
+
+def _import_times(*args, env=None):
+    """Run python -X importtime and return cumulative microseconds."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *args],
+        capture_output=True,
+        text=True,
+        check=True,
+        env=env,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        times[module.strip()] = int(cumulative)
+    return times
+
+
+def test_version_does_not_import_aws_stack():
+    times = _import_times("-m", "metadata_management", "--version")
+
+    assert not [module for module in AWS_MODULES if module in times]
+    assert not [module for module in SQLITE_MODULES if module in times]
+
+
+def test_json_commands_do_not_import_sqlite(tmp_path):
+    config_home = tmp_path / "config"
+    config_home.mkdir()
+    env = {**os.environ, "XDG_CONFIG_HOME": str(config_home)}
+    db_path = str(tmp_path / "metadata.json")
+    cli = ("-m", "metadata_management")
+    _import_times(*cli, "init", "--db-path", db_path, env=env)
+    _import_times(*cli, "add", "account01", "bar", "baz", env=env)
+
+    times = _import_times(*cli, "list", env=env)
+
+    assert not [module for module in SQLITE_MODULES if module in times]
+
+
+def test_cli_import_does_not_import_aws_stack():
+    times = _import_times("-c", "import metadata_management.cli")
+
+    assert not [module for module in AWS_MODULES if module in times]
+    assert not [module for module in SQLITE_MODULES if module in times]
@@ -0,0 +1,136 @@
+import json
+from unittest import mock
+
+from metadata_management import ID_ERROR, SUCCESS
+from metadata_management.database import (
+    WAL_BACKEND,
+    DatabaseHandler,
+    init_database,
+)
+from metadata_management.manager import Metadata
+from metadata_management.wal import (
+    LogDatabaseHandler,
+    _header,
+    get_log_path,
+)
+from tests.test_database import RECORD
+
+
+def _handler(tmp_path, **kwargs):
+    db_file = tmp_path / "metadata.json"
+    init_database(db_file, WAL_BACKEND)
+    return LogDatabaseHandler(db_file, **kwargs)
+
+
+def test_mutations_append_to_log_only(tmp_path):
+    handler = _handler(tmp_path)
+    snapshot = handler._db_path.read_text()
+
+    handler.put_record("account01", RECORD)
+    handler.put_record("account02", RECORD)
+    handler.update_record("account01", {"inactive": True})
+    handler.delete_record("account02")
+
+    assert handler._db_path.read_text() == snapshot
+    header, *log = get_log_path(handler._db_path).read_text().splitlines()
+    assert "generation" in json.loads(header)
+    assert [json.loads(line)["op"] for line in log] == [
+        "put",
+        "put",
+        "put",
+        "del",
+    ]
+
+
+def test_replay_snapshot_and_log(tmp_path):
+    handler = _handler(tmp_path)
+    handler.put_record("account01", RECORD)
+    handler.put_record("account02", RECORD)
+    handler.update_record("account01", {"inactive": True})
+    handler.delete_record("account02")
+
+    actual = LogDatabaseHandler(handler._db_path).read_metadata()
+
+    assert actual == ({"account01": {**RECORD, "inactive": True}}, SUCCESS)
+
+
+def test_records_are_replayed_as_written(tmp_path):
+    handler = _handler(tmp_path, compact_threshold=1)
+    records = {"account01": {"Value": "x"}, "account02": {"inactive": "no"}}
+
+    handler.put_records(records)
+    handler.wait()
+
+    assert LogDatabaseHandler(handler._db_path).read_metadata() == (
+        records,
+        SUCCESS,
+    )
+    assert DatabaseHandler(handler._db_path).read_metadata().metadata == (
+        records
+    )
+
+
+def test_replay_ignores_torn_record(tmp_path):
+    handler = _handler(tmp_path)
+    handler.put_record("account01", RECORD)
+    log_path = get_log_path(handler._db_path)
+    with log_path.open("a") as log:
+        log.write('{"op": "put", "title": "acc')
+
+    reopened = LogDatabaseHandler(handler._db_path)
+    reopened.put_record("account02", RECORD)
+
+    actual = LogDatabaseHandler(handler._db_path).read_metadata()
+    assert set(actual.metadata) == {"account01", "account02"}
+
+
+def test_log_is_folded_into_snapshot(tmp_path):
+    handler = _handler(tmp_path, compact_threshold=1)
+
+    handler.put_record("account01", RECORD)
+    handler.wait()
+
+    log = get_log_path(handler._db_path).read_text().splitlines()
+    assert list(json.loads(log[0])) == ["generation"] and len(log) == 1
+    snapshot = DatabaseHandler(handler._db_path).read_metadata()
+    assert snapshot.metadata == {"account01": RECORD}
+
+
+def test_metadata_uses_configured_backend(tmp_path):
+    db_file = tmp_path / "metadata.json"
+    init_database(db_file, WAL_BACKEND)
+    metadata = Metadata(db_file, WAL_BACKEND)
+
+    assert metadata.add("account01", "bar", "baz").error == SUCCESS
+    assert metadata.set_inactive("account02").error == ID_ERROR
+    assert metadata.remove("account01").error == SUCCESS
+    assert metadata.get_metadata() == {}
+
+
+def test_appends_are_synced(tmp_path):
+    handler = _handler(tmp_path)
+
+    with mock.patch("metadata_management.wal.os.fsync") as fsync:
+        handler.put_record("account01", RECORD)
+
+    fsync.assert_called()
+
+
+def test_fold_is_noticed_when_the_log_inode_is_reused(tmp_path):
+    handler = _handler(tmp_path)
+    handler.put_record("account01", RECORD)
+    log_path = get_log_path(handler._db_path)
+    size = log_path.stat().st_size
+    # Another process folds, and the new log lands on the same inode with
+    # the same size.
+    DatabaseHandler(handler._db_path).write_metadata({"account01": RECORD})
+    with log_path.open("r+b") as log:
+        log.write(_header("0" * 16).encode())
+        entry = {"op": "put", "title": "account02", "record": RECORD}
+        log.write((json.dumps(entry) + "\n").encode())
+        log.truncate()
+    assert log_path.stat().st_size == size
+
+    actual = handler.read_metadata()
+
+    assert set(actual.metadata) == {"account01", "account02"}